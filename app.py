@@ -1,566 +1,284 @@
 import streamlit as st
-import math
+import io
+import json
+import os
+import sqlite3
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+from plotly.subplots import make_subplots
+
+# Il motore di calcolo è nel pacchetto shielding (importabile senza Streamlit); qui solo l'interfaccia.
+# Lo script è rieseguito a ogni interazione, ma i moduli importati (e le loro cache) restano in memoria.
+from shielding.analitica import SPESSORE_NON_VALIDO_MM, calcola_spessore_x
+from shielding.archivio import ArchivioProgetto
+from shielding.batch import (
+    BATCH_COLUMN_DEFAULTS,
+    BATCH_FACILITY_COLUMN,
+    BATCH_ROOM_COLUMN,
+    iter_barrier_table,
+    run_batch_calculation,
+)
+from shielding.cache_persistente import CACHE_PATH_ENV, attiva_cache_persistente
+from shielding.calcolo import RAMO_LOGICO_LABELS, run_shielding_calculation
+from shielding.coefficienti import COEFF_STORE
+from shielding.curve import CURVE_B_MIN, calcola_curve_trasmissione, downsample_lttb
+from shielding.dati import (
+    ATTENUATION_DATA_KVP,
+    ATTENUATION_DATA_TC,
+    DLP_TC_FIXED_VALUES,
+    KERMA_DATA,
+    MODALITA_RADIOGRAFIA_UI_OPTIONS,
+    PRESHIELDING_XPRE_OPTIONS,
+    X_PRE_TABLE_HOLDER_KEYS,
+)
+from shielding.mappa_dose import calcola_mappa_kerma, riduci_mappa_max
+from shielding.montecarlo import MC_PERCENTILES, IstogrammaStreaming, mc_spessore
+from shielding.multisorgente import MULTISOURCE_WALL_COLUMN, calculate_multisource_walls
+from shielding.ottimizzazione import OPTIMIZER_OBJECTIVES, ottimizza_spessori
+from shielding.progetto import PROGETTO_CAUSE, ProgettoIncrementale
+from shielding.registro_dlp import REGISTRO_STATISTICHE, carico_tc_da_registro, params_carico_tc
+from shielding.relazione import write_facility_report
+from shielding.spessori import SECONDARY_MODELS
+from shielding.spettro import normalizza_spettro_carico
+from shielding.stratificate import COMPOSITE_LAYER_COLUMN, COMPOSITE_WALL_COLUMN, calculate_composite_walls, run_composite_calculation
+from shielding.sweep import SWEEP_AXES, SweepCache
+from shielding.tabelle_inverse import tabelle_spessore_inverso
+from shielding.tasso_dose import (
+    DOSE_RATE_COUNT_COLUMN,
+    DOSE_RATE_TIME_COLUMN,
+    DOSE_RATE_WORK_HOURS,
+    run_dose_rate_calculation,
+)
+from shielding.verifica import COMPLIANCE_THICKNESS_COLUMN, run_compliance_calculation, run_compliance_check
 
 
 # ====================================================================
-# 1. DATI NCRP 147 CONSOLIDATI
+# INTERFACCIA UTENTE STREAMLIT
 # ====================================================================
 
 
-# Struttura dati unificata per Modalità Radiografica (RAMO 1/2/4)
-# Include Kp1 (Primario), Wnorm (Carico di Lavoro), e le 3 componenti Ksec1 (Secondario/Fuga)
-# I valori di Ksec1 (LeakSide, ForBack, Comb) e Wnorm sono da Tabella 4.7, Kp1 da Tabella 4.5.
-KERMA_DATA = {
-    # 1. STANZA RADIOGRAFICA (TUTTE BARRIERE)
-    "STANZA RADIOGRAFICA (TUTTE BARRIERE)": {
-        'Wnorm': 2.5,
-        'Kp1': None, # Usato per barriere secondarie/generiche (Kp1 da Tab 4.5 non applicabile qui)
-        'Ksec1_LeakSide': 3.4e-2, # 3.4*10^-2
-        'Ksec1_ForBack': 4.8e-2, # 4.8*10^-2
-        'Ksec1_Comb': 4.9e-2,    # VALORE COMBINATO
-    },
-    # 2. STANZA RADIOGRAFICA GENERICA (CHEST BUCKY - PARETE PRIMARIA)
-    "STANZA RADIOGRAFICA (CHEST BUCKY)": {
-        'Wnorm': 0.60,
-        'Kp1': 2.3, # Kp1 da Tab 4.5
-        'Ksec1_LeakSide': 5.3e-3, # 5.3*10^-3
-        'Ksec1_ForBack': 6.9e-3, # 6.9*10^-3
-        'Ksec1_Comb': 7.3e-3,
-    },
-    # 3. STANZA RADIOGRAFICA (PAVIMENTO/ALTRE BARRIERE - ES: PARETE PRIMARIA)
-    "STANZA RADIOGRAFICA (PIANO/ALTRE BARRIERE)": {
-        'Wnorm': 1.9,
-        'Kp1': 5.2, # Kp1 da Tab 4.5
-        'Ksec1_LeakSide': 2.3e-2, # 2.3*10^-2
-        'Ksec1_ForBack': 3.3e-2, # 3.3*10^-2
-        'Ksec1_Comb': 3.3e-2,
-    },
-    # 4. TUBO FLUOROSCOPICO STANZA R&F
-    "FLUOROSCOPIA (R&F)": {
-        'Wnorm': 13.0,
-        'Kp1': None, # Usato per barriere secondarie
-        'Ksec1_LeakSide': 3.2e-1, # 3.2*10^-1
-        'Ksec1_ForBack': 4.4e-1, # 4.4*10^-1
-        'Ksec1_Comb': 4.6e-1,
-    },
-    # 5. TUBO RADIOGENO STANZA R&F
-    "RADIOGRAFIA (TUBO R&F)": {
-        'Wnorm': 1.5,
-        'Kp1': 5.9, # Kp1 da Tab 4.5 (Se la barriera è primaria)
-        'Ksec1_LeakSide': 2.9e-2, # 2.9*10^-2
-        'Ksec1_ForBack': 3.9e-2, # 3.9*10^-2
-        'Ksec1_Comb': 4.0e-2, # Corretto 4.0*0-2 a 4.0*10^-2
-    },
-    # 6. STANZA RADIOGRAFICA TORACE (CHEST ROOM) - NOME AGGIORNATO
-    "STANZA RADIOGRAFICA TORACE(CHEST ROOM)": {
-        'Wnorm': 0.22,
-        'Kp1': 1.2, # Kp1 da Tab 4.5 (Se la barriera è primaria)
-        'Ksec1_LeakSide': 2.7e-3, # 2.7*10^-3
-        'Ksec1_ForBack': 3.2e-3, # 3.2*10^-3
-        'Ksec1_Comb': 3.6e-3,
-    },
-    # 7. MAMMOGRAFIA
-    "MAMMOGRAFIA": {
-        'Wnorm': 6.7,
-        'Kp1': None, # Solo calcolo secondario per NCRP 147
-        'Ksec1_LeakSide': 1.1e-2, # 1.1*10^-2
-        'Ksec1_ForBack': 4.9e-2, # 4.9*10^-2
-        'Ksec1_Comb': 4.9e-2,
-    },
-    # 8. ANGIOGRAFIA CARDIACA
-    "ANGIO CARDIACA": {
-        'Wnorm': 160.0,
-        'Kp1': None, # Solo calcolo secondario
-        'Ksec1_LeakSide': 2.7,
-        'Ksec1_ForBack': 3.7,
-        'Ksec1_Comb': 3.8,
-    },
-    # 9. ANGIOGRAFIA PERIFERICA
-    "ANGIO PERIFERICA": {
-        'Wnorm': 64.0,
-        'Kp1': None, # Solo calcolo secondario
-        'Ksec1_LeakSide': 6.6e-1, # 6.6*10^-1
-        'Ksec1_ForBack': 9.5e-1, # 9.5*10^-1
-        'Ksec1_Comb': 9.5e-1,
-    }
-}
-
-
-# Parametri di Fitting (Alfa, Beta, Gamma) per Barriera Primaria (Tabella B.1)
-ATTENUATION_DATA_PRIMARY = {
-    "STANZA RADIOGRAFICA (TUTTE BARRIERE)": {
-        "PIOMBO": {'alpha': 2.346, 'beta': 1.59e+01, 'gamma': 4.982e-01}, 
-        "CEMENTO": {'alpha': 3.626e-02, 'beta': 1.429e-01, 'gamma': 4.931e-01}
-    },
-    "STANZA RADIOGRAFICA (CHEST BUCKY)": {
-        "PIOMBO": {'alpha': 2.264, 'beta': 1.308e+01, 'gamma': 5.6e-01},
-        "CEMENTO": {'alpha': 3.552e-02, 'beta': 1.177e-01, 'gamma': 6.007e-01}
-    },
-    "STANZA RADIOGRAFICA (PIANO/ALTRE BARRIERE)": {
-        "PIOMBO": {'alpha': 2.651, 'beta': 1.656e+01, 'gamma': 4.585e-01},
-        "CEMENTO": {'alpha': 3.994e-02, 'beta': 1.448e-01, 'gamma': 4.231e-01}
-    },
-    "FLUOROSCOPIA (R&F)": {
-        "PIOMBO": {'alpha': 2.347, 'beta': 1.267e+01, 'gamma': 6.149e-01},
-        "CEMENTO": {'alpha': 3.616e-02, 'beta': 9.721e-02, 'gamma': 5.186e-01}
-    },
-    "RADIOGRAFIA (TUBO R&F)": {
-        "PIOMBO": {'alpha': 2.295, 'beta': 1.3e+01, 'gamma': 5.573e-01},
-        "CEMENTO": {'alpha': 3.549e-02, 'beta': 1.164e-01, 'gamma': 5.774e-01}
-    },
-    "STANZA RADIOGRAFICA TORACE(CHEST ROOM)": {
-        "PIOMBO": {'alpha': 2.283, 'beta': 1.074e+01, 'gamma': 6.37e-01},
-        "CEMENTO": {'alpha': 3.622e-02, 'beta': 7.766e-02, 'gamma': 5.404e-01}
-    },
-    "MAMMOGRAFIA": {
-        "PIOMBO": {'alpha': 30.6, 'beta': 1.776e+02, 'gamma': 3.308e-01},
-        "CEMENTO": {'alpha': 2.577e-01, 'beta': 1.765, 'gamma': 3.644e-01} 
-    },
-    "ANGIO CARDIACA": {
-        "PIOMBO": {'alpha': 2.389, 'beta': 1.426e+01, 'gamma': 5.948e-01},
-        "CEMENTO": {'alpha': 3.717e-02, 'beta': 1.087e-01, 'gamma': 4.879e-01} 
-    },
-    "ANGIO PERIFERICA": {
-        "PIOMBO": {'alpha': 2.728, 'beta': 1.852e+01, 'gamma': 4.614e-01},
-        "CEMENTO": {'alpha': 4.292e-02, 'beta': 1.538e+02, 'gamma': 4.236e-01}
-    }
-}
-
-
-# Parametri di Fitting (Alfa, Beta, Gamma) per Barriera Secondaria (Tabella C.1)
-ATTENUATION_DATA_SECONDARY = {
-    "STANZA RADIOGRAFICA (TUTTE BARRIERE)": {
-        "PIOMBO": {'alpha': 2.298, 'beta': 1.738e+01, 'gamma': 6.193e-01},
-        "CEMENTO": {'alpha': 3.610e-02, 'beta': 1.433e-01, 'gamma': 5.600e-01}
-    },
-    "STANZA RADIOGRAFICA (CHEST BUCKY)": {
-        "PIOMBO": {'alpha': 2.256, 'beta': 1.38e+01, 'gamma': 8.837e-01},
-        "CEMENTO": {'alpha': 3.56e-02, 'beta': 1.79e-01, 'gamma': 7.705e-01}
-    },
-    "STANZA RADIOGRAFICA (PIANO/ALTRE BARRIERE)": {
-        "PIOMBO": {'alpha': 2.513, 'beta': 1.734e+01, 'gamma': 4.994e-01},
-        "CEMENTO": {'alpha': 3.920e-02, 'beta': 1.464e-01, 'gamma': 4.486e-01} 
-    },
-    "FLUOROSCOPIA (R&F)": {
-        "PIOMBO": {'alpha': 2.322, 'beta': 1.291e+01, 'gamma': 7.575e-01},
-        "CEMENTO": {'alpha': 3.630e-02, 'beta': 9.360e+02, 'gamma': 5.955e-01}
-    },
-    "RADIOGRAFIA (TUBO R&F)": {
-        "PIOMBO": {'alpha': 2.272, 'beta': 1.360e+01, 'gamma': 7.184e-01},
-        "CEMENTO": {'alpha': 3.560e-02, 'beta': 1.114e-01, 'gamma': 6.620e-01}
-    },
-    "STANZA RADIOGRAFICA TORACE(CHEST ROOM)": {
-        "PIOMBO": {'alpha': 2.288, 'beta': 9.848, 'gamma': 1.054},
-        "CEMENTO": {'alpha': 3.640e-02, 'beta': 6.590e-02, 'gamma': 7.543e-01}
-    },
-    "MAMMOGRAFIA": {
-        "PIOMBO": {'alpha': 29.91, 'beta': 1.844e+02, 'gamma': 3.550e-01},
-        "CEMENTO": {'alpha': 2.539e-01, 'beta': 1.8411, 'gamma': 3.924e-01}
-    },
-    "ANGIO CARDIACA": {
-        "PIOMBO": {'alpha': 2.354, 'beta': 1.494e+01, 'gamma': 7.481e-01},
-        "CEMENTO": {'alpha': 3.710e-02, 'beta': 1.067e-01, 'gamma': 5.733e-01}
-    },
-    "ANGIO PERIFERICA": {
-        "PIOMBO": {'alpha': 2.661, 'beta': 1.954e+01, 'gamma': 5.094e-01},
-        "CEMENTO": {'alpha': 4.219e-02, 'beta': 1.559e-01, 'gamma': 4.472e-01}
-    }
-}
-
-
-# Parametri di Fitting (Alfa, Beta, Gamma) per Barriera TC (RAMO 3)
-ATTENUATION_DATA_TC = {
-    "PIOMBO": {
-        "120 kVp": {'alpha': 2.246, 'beta': 8.95, 'gamma': 5.873e-01},
-        "140 kVp": {'alpha': 2.009, 'beta': 5.916, 'gamma':4.018e-01}
-    },
-    "CEMENTO": {
-        "120 kVp": {'alpha': 3.566e-02, 'beta': 7.109e-02, 'gamma': 6.073e-01},
-        "140 kVp": {'alpha': 3.345e-02, 'beta': 7.476e-02, 'gamma': 1.047}
-    }
-}
-
+# Figure Plotly riusate tra i rerun di una sessione (le più recenti)
+FIGURE_SESSIONE_MAX = 4
 
-# NUOVO DIZIONARIO PER LE SCELTE DELL'UTENTE (PRESHIELDING_XPRE_OPTIONS)
-# Spessore di Preshielding (Xpre) in mm (Tabella 4.6 - NCRP 147)
-PRESHIELDING_XPRE_OPTIONS = {
-    # Image receptor in table/holder attenuation by grid and cassette and image receptor
-    "NESSUNO (0.0 mm) - Table/Holder": 0.0,
-    "PIOMBO (0.85 mm) - Table/Holder": 0.85,
-    "CEMENTO (72.0 mm) - Table/Holder": 72.0,
-    "ACCIAIO (7.0 mm) - Table/Holder": 7.0,
-
-    # Cross-table lateral attenuation by grid and cassette only
-    "NESSUNO (0.0 mm) - Cross-Table Lateral": 0.0,
-    "PIOMBO (0.3 mm) - Cross-Table Lateral": 0.3,
-    "CEMENTO (30.0 mm) - Cross-Table Lateral": 30.0,
-    "ACCIAIO (2.0 mm) - Cross-Table Lateral": 2.0
-}
-
-# Mapping delle opzioni X_PRE per la logica dinamica
-X_PRE_TABLE_HOLDER_KEYS = [k for k in PRESHIELDING_XPRE_OPTIONS.keys() if "Table/Holder" in k]
-X_PRE_CROSS_TABLE_KEYS = [k for k in PRESHIELDING_XPRE_OPTIONS.keys() if "Cross-Table Lateral" in k]
-
-
-# DLP Fissi di Riferimento per il calcolo K1sec (Tabella 5.2 NCRP 147)
-# DLP [mGy*cm]
-DLP_TC_FIXED_VALUES = {
-    "HEAD": 1200, 
-    "BODY": 550, 
-}
-
-
-# Coefficienti di Kerma per TC (Tabella 5.2, parte inferiore)
-# Coefficiente di Kerma di diffusione per testa (cm^-1)
-K_HEAD_DIFF = 9.0e-5 # 9 x 10^-5 cm^-1
-# Coefficiente di Kerma di diffusione per corpo (cm^-1)
-K_BODY_DIFF = 3.0e-4 # 3 x 10^-4 cm^-1
-
-
-# ====================================================================
-# NUOVE MAPPATURE LOGICHE DEFINITE DALL'UTENTE
-# ====================================================================
 
-# Tutte le chiavi di KERMA_DATA da mostrare nella UI (include TUTTE BARRIERE)
-MODALITA_RADIOGRAFIA_UI_OPTIONS = list(KERMA_DATA.keys()) 
-
-# Chiavi che seguono la logica del RAMO 1 (Diagnostica Standard)
-RAMO_1_MODES = [
-    "STANZA RADIOGRAFICA (CHEST BUCKY)",
-    "STANZA RADIOGRAFICA (PIANO/ALTRE BARRIERE)",
-    "RADIOGRAFIA (TUBO R&F)",
-    "STANZA RADIOGRAFICA TORACE(CHEST ROOM)", 
-]
-
-# Chiavi che seguono la logica del RAMO 2 (Diagnostica Specializzata/Fluoro/Generica)
-RAMO_2_MODES = [
-    k for k in MODALITA_RADIOGRAFIA_UI_OPTIONS if k not in RAMO_1_MODES
-]
-
-
-# ====================================================================
-# 2. FUNZIONI ANALITICHE BASE
-# ====================================================================
-
-
-def calcola_spessore_x(alpha, beta, gamma, B):
+@st.cache_resource
+def curve_trasmissione_visualizzate(n_punti=4000, n_display=300):
     """
-    Calcola lo spessore x richiesto data la trasmittanza B (formula inversa NCRP 147).
+    Curve B(x) sulla griglia densa, sottocampionate con LTTB (su log10 B) per Plotly.
+    Una sola copia per processo server (sola lettura): i cambi dei widget non ricalcolano le curve.
     """
-    try:
-        if B is None or B <= 0 or alpha == 0 or gamma == 0:
-            return 999.0
-        
-        # Formula: X = (1 / (alpha * gamma)) * ln( [ B^(-gamma) + (beta / alpha) ] / [ 1 + (beta / alpha) ] )
-        
-        numeratore_ln = B**(-gamma) + (beta / alpha)
-        denominatore_ln = 1 + (beta / alpha)
-        
-        if denominatore_ln == 0 or numeratore_ln <= 0:
-            return 999.0
-            
-        x = (1 / (alpha * gamma)) * math.log(numeratore_ln / denominatore_ln)
-        return max(0.0, x)
-        
-    except Exception:
-        return 999.0
+    etichette, x, B = calcola_curve_trasmissione(n_punti)
+    x_ds, logB_ds = downsample_lttb(x, np.log10(B), n_display)
+    B_ds = 10 ** logB_ds
+    x_ds.setflags(write=False)
+    B_ds.setflags(write=False)
+    return etichette, x_ds, B_ds
 
 
-def calcola_kerma_incidente(K_val, U, N, d):
+def figura_sessione(chiave, costruisci):
     """
-    Calcola il kerma in aria non schermato alla distanza d per unità di tempo.
-    Formula: kerma_non_schermato = K_val * U * N / d^2 
+    Figura della sessione per la chiave, costruita con costruisci() solo al primo uso. Tra i rerun il
+    chiamante aggiorna in place i soli marker della configurazione corrente (Plotly impiega decine di ms
+    a costruire le figure con molte tracce); le figure non sono condivise tra sessioni.
     """
-    try:
-        if d <= 0: return 0.0
-        # $K_{incidente}$ (mGy/settimana)
-        # $K_{tu} = (K_{val} \cdot U \cdot N) / d^2$
-        kerma = (K_val * U * N) / (d ** 2)
-        return kerma
-    except Exception:
-        return 0.0
-
-
-# ====================================================================
-# 3. FUNZIONI DI CALCOLO SPECIFICHE (RAMO 1 & 2)
-# ====================================================================
-
-
-def calculate_primary_thickness(params):
-    """ 
-    Implementa il calcolo Primario (Ramo 1). 
-    Usa la chiave esatta selezionata dalla UI.
-    """
-    P = params.get('P_mSv_wk', 0.0) 
-    T = params.get('tasso_occupazione_T', 1.0)
-    d = params.get('distanza_d', 2.0)
-    U = params.get('fattore_uso_U', 0.25)
-    N = params.get('pazienti_settimana_N', 100)
-    modalita = params.get('modalita_radiografia')
-    materiale = params.get('materiale_schermatura')
-    Xpre = params.get('X_PRE_mm', 0.0) 
-
-    # Usa la chiave selezionata dall'utente direttamente.
-    modalita_key = modalita
-    
-    # Kp1 è in mGy*m^2 / mAs
-    Kp1_data = KERMA_DATA.get(modalita_key, {}).get('Kp1')
-    
-    # Se Kp1 è None, gestisce l'errore.
-    if Kp1_data is None:
-        return 0.0, 0.0, f"Dati Kp1 non definiti per la modalità '{modalita}' o non è prevista una barriera Primaria NCRP 147."
-
-    
-    if modalita_key not in ATTENUATION_DATA_PRIMARY or materiale not in ATTENUATION_DATA_PRIMARY[modalita_key]:
-        return 0.0, 0.0, f"Dati di attenuazione Primaria mancanti per '{modalita_key}'."
-        
-    data = ATTENUATION_DATA_PRIMARY[modalita_key][materiale]
-    alpha, beta, gamma = data['alpha'], data['beta'], data['gamma']
-    
-    # 1. Kerma non schermato (incidente)
-    kerma_non_schermato_mGy_wk = calcola_kerma_incidente(Kp1_data, U, N, d)
-    
-    if kerma_non_schermato_mGy_wk * T == 0 or P == 0:
-        return 0.0, 0.0, "Kerma o Tasso di Occupazione (T) o Dose Limite (P) nullo/i."
-        
-    # 2. Fattore di Trasmittanza B
-    B_P = P / (kerma_non_schermato_mGy_wk * T)
-    
-    # 3. Spessore di Riferimento Xref
-    Xref_mm = calcola_spessore_x(alpha, beta, gamma, B_P)
-    
-    # 4. Spessore Finale (Xref - Xpre)
-    Xfinale_mm = max(0.0, Xref_mm - Xpre)
-    
-    log_msg = f"Kp1={Kp1_data:.2f}. B={B_P:.4e}. Xref={Xref_mm:.2f}mm. Xpre={Xpre:.2f}mm. Modalità NCRP: {modalita_key}"
-    return Xfinale_mm, kerma_non_schermato_mGy_wk, log_msg
+    figure = st.session_state.setdefault('figure_sessione', OrderedDict())
+    fig = figure.get(chiave)
+    if fig is None:
+        fig = figure[chiave] = costruisci()
+        while len(figure) > FIGURE_SESSIONE_MAX:
+            figure.popitem(last=False)
+    else:
+        figure.move_to_end(chiave)
+    return fig
 
 
-def calculate_secondary_thickness(params):
-    """ 
-    Implementa il calcolo Secondario (Ramo 1/2). 
-    Usa la chiave esatta selezionata dalla UI.
+def punto_soluzione_corrente(params, results):
     """
-    P = params.get('P_mSv_wk', 0.0) 
-    T = params.get('tasso_occupazione_T', 1.0)
-    d = params.get('distanza_d', 2.0)
-    U = 1.0 # U è tipicamente 1.0 per la secondaria (NCRP 147 Eq. 4.4)
-    N = params.get('pazienti_settimana_N', 100)
-    modalita = params.get('modalita_radiografia')
-    materiale = params.get('materiale_schermatura')
-    Xpre = params.get('X_PRE_mm', 0.0) 
-
-    # Usa la chiave selezionata dall'utente direttamente.
-    modalita_key = modalita
-    
-    # Ksec1 è in mGy*m^2 / mAs o mGy*m^2 / min
-    Ksec1_data = KERMA_DATA.get(modalita_key, {}).get('Ksec1_Comb')
-    if Ksec1_data is None:
-        return 0.0, 0.0, 0.0, 0.0, f"Dati Ksec1_Comb non definiti per la modalità '{modalita_key}'."
-
-    
-    if modalita_key not in ATTENUATION_DATA_SECONDARY or materiale not in ATTENUATION_DATA_SECONDARY[modalita_key]:
-        return 0.0, 0.0, 0.0, 0.0, f"Dati di attenuazione Secondaria mancanti per '{modalita_key}'."
-        
-    data = ATTENUATION_DATA_SECONDARY[modalita_key][materiale]
-    alpha, beta, gamma = data['alpha'], data['beta'], data['gamma']
-    
-    # 1. Kerma non schermato (incidente)
-    # $K_{tu} = (K_{s1} \cdot U \cdot N) / d^2$. Utilizziamo U=1 per la secondaria come da NCRP 147 Eq. 4.4
-    kerma_non_schermato_mGy_wk = calcola_kerma_incidente(Ksec1_data, U, N, d)
-    
-    if kerma_non_schermato_mGy_wk * T == 0 or P == 0:
-        return 0.0, 0.0, 0.0, 0.0, "Kerma o Tasso di Occupazione (T) o Dose Limite (P) nullo/i."
-        
-    # 2. Fattore di Trasmittanza B
-    B_S = P / (kerma_non_schermato_mGy_wk * T)
-    
-    # 3. Spessore di Riferimento Xref
-    Xref_mm = calcola_spessore_x(alpha, beta, gamma, B_S)
-    
-    # 4. Spessore Finale (Xref - Xpre)
-    Xfinale_mm = max(0.0, Xref_mm - Xpre)
-    
-    log_msg = f"Ksec1={Ksec1_data:.4e}. B={B_S:.4e}. Xref={Xref_mm:.2f}mm. Xpre={Xpre:.2f}mm. (Modello combinato Ksec1, Modalità NCRP: {modalita_key})"
-    
-    # Nel modello combinato Ksec1, X_L = X_S = X_finale
-    return Xfinale_mm, Xfinale_mm, Xfinale_mm, kerma_non_schermato_mGy_wk, log_msg
-
-
-def calculate_special_secondary_thickness(params):
-    """ Implementa il calcolo Secondario (Ramo 2). Stesso flusso logico di Ramo 1. """
-    return calculate_secondary_thickness(params)
-
-
-def calculate_tc_thickness(params):
-    """ 
-    Implementa il calcolo Secondario (Ramo 3 - TC).
-    Utilizza i DLP fissi (1200 mGy*cm per Head, 550 mGy*cm per Body) per calcolare il Kerma K1sec.
+    Restituisce (tabella, chiave, materiale, Xref_mm, B) del calcolo corrente, o None se non rappresentabile.
+    Il modello Fuga+Diffusione somma due componenti con fit diversi: la soluzione non sta su una sola curva;
+    con lo spettro di carico Xref viene dalla curva integrata, non dal fit della modalità mostrato.
     """
-    P = params.get('P_mSv_wk', 0.0) 
-    T = params.get('tasso_occupazione_T', 1.0)
-    d = params.get('distanza_d', 2.0) # $d$ in metri
-    materiale = params.get('materiale_schermatura')
-    Xpre = params.get('X_PRE_mm', 0.0)
-    
-    # Parametri specifici TC (Recuperati da params)
-    N_head = params.get('weekly_n_head', 0) 
-    N_body = params.get('weekly_n_body', 0)
-    Kc = params.get('contrast_factor', 1.0) # Fattore di Contrasto
-    kvp = params.get('kvp_tc')
-    
-    # --- 1. Calcolo del Kerma non schermato a 1m per paziente (K1sec) ---
-    # K1sec(head) = khead * DLP_head * Kc (Eq. 5.1 NCRP 147)
-    dlp_head = DLP_TC_FIXED_VALUES["HEAD"]
-    K1sec_head_mGy_paz = K_HEAD_DIFF * dlp_head * Kc # [cm^-1] * [mGy*cm] * [] = [mGy]
-    
-    # K1sec(body) = 1.2 * kbody * DLP_body * Kc (Eq. 5.2 NCRP 147)
-    dlp_body = DLP_TC_FIXED_VALUES["BODY"]
-    K1sec_body_mGy_paz = 1.2 * K_BODY_DIFF * dlp_body * Kc 
-    
-    # --- 2. Calcolo del Kerma non schermato totale settimanale alla distanza d ($K_{tu}$) ---
-    # $K_{tu}$ (a 1m) = (K1sec(head) * N_head) + (K1sec(body) * N_body) (Eq. 5.3 NCRP 147)
-    total_kerma_at_1m_mGy_wk = (K1sec_head_mGy_paz * N_head) + (K1sec_body_mGy_paz * N_body)
-    
-    if d <= 0:
-        kerma_tc_non_schermato_mGy_wk = 0.0
-    else:
-        # $K_{tu}$ (Kerma Settimanale alla distanza d)
-        # $K_{tu}(d) = K_{tu}(1m) / d^2$ (d in metri, Kerma in mGy/wk)
-        kerma_tc_non_schermato_mGy_wk = (1 / (d ** 2)) * total_kerma_at_1m_mGy_wk
-    
-    # --- 3. Calcolo del Fattore di Trasmittanza B ($B_{T}$) ---
-    if kerma_tc_non_schermato_mGy_wk * T <= 0 or P == 0:
-        B_T = 1.0 
+    if not results or 'errore' in results or params.get('spettro_carico'):
+        return None
+    if params['tipo_barriera'] == "SECONDARIA" and params.get('modello_secondario') == "FUGA+DIFFUSIONE":
+        return None
+    K_T = results.get('kerma_non_schermato', 0.0) * params['tasso_occupazione_T']
+    if K_T <= 0 or params['P_mSv_wk'] <= 0:
+        return None
+
+    B = params['P_mSv_wk'] / K_T
+    materiale = params['materiale_schermatura']
+    i_mat = COEFF_STORE.materiale_id.get(materiale, -1)
+    if results['ramo_logico'] == RAMO_LOGICO_LABELS[3]:
+        tabella, chiave = "TC", params['kvp_tc']
+        coeff = COEFF_STORE.att_tc[i_mat, COEFF_STORE.kvp_id.get(chiave, -1)]
     else:
-        # $B = P / (K_{tu} \cdot T)$ (Eq. 5.4 NCRP 147)
-        B_T = P / (T * kerma_tc_non_schermato_mGy_wk)
-        
-    # --- 4. Calcolo dello Spessore X richiesto (Usa i nuovi dati ATTENUATION_DATA_TC) ---
-    
-    if materiale not in ATTENUATION_DATA_TC or kvp not in ATTENUATION_DATA_TC[materiale]:
-        return 0.0, 0.0, f"Dati di attenuazione TC (Materiale/kVp) mancanti per {materiale} a {kvp}.", 0.0, 0.0
-
-
-    data_tc_attenuation = ATTENUATION_DATA_TC[materiale][kvp]
-    alpha, beta, gamma = data_tc_attenuation['alpha'], data_tc_attenuation['beta'], data_tc_attenuation['gamma']
-    
-    Xref_mm = calcola_spessore_x(alpha, beta, gamma, B_T)
-    Xfinale_mm = max(0.0, Xref_mm - Xpre)
-
-
-    log_msg = (
-        f"K1sec(Head) = {K1sec_head_mGy_paz:.2e} mGy/paz (DLP={dlp_head}). "
-        f"K1sec(Body) = {K1sec_body_mGy_paz:.2e} mGy/paz (DLP={dlp_body}). "
-        f"$K_{{tu}}$ (a d={d}m) = {kerma_tc_non_schermato_mGy_wk:.2e} mGy/wk. "
-        f"B = {B_T:.4e}. Xref={Xref_mm:.2f}mm. Xpre={Xpre:.2f}mm. (kVp: {kvp}, $K_c$: {Kc})"
-    )
-    
-    return Xfinale_mm, kerma_tc_non_schermato_mGy_wk, log_msg, K1sec_head_mGy_paz, K1sec_body_mGy_paz
+        tabella, chiave = params['tipo_barriera'], params['modalita_radiografia']
+        att = COEFF_STORE.att_primaria if tabella == "PRIMARIA" else COEFF_STORE.att_secondaria
+        coeff = att[COEFF_STORE.modalita_id.get(chiave, -1), i_mat]
+
+    Xref_mm = calcola_spessore_x(*coeff.tolist(), B)
+    if Xref_mm == SPESSORE_NON_VALIDO_MM:
+        return None
+    return tabella, chiave, materiale, Xref_mm, B
+
+
+def aggiorna_marker_soluzione(fig, punto):
+    """ Sposta il marker della soluzione (ultima traccia della figura delle curve) sul punto corrente. """
+    Xref_mm, B_punto = punto[3:]
+    fig.data[-1].update(x=[Xref_mm], y=[B_punto], name=f"Soluzione: Xref={Xref_mm:.2f} mm, B={B_punto:.2e}")
+
+
+def figura_curve_trasmissione(tabelle, punto=None):
+    """ Figura Plotly delle curve B(x) (un pannello per materiale), con il punto di soluzione evidenziato. """
+    etichette, x, B = curve_trasmissione_visualizzate()
+    materiali = COEFF_STORE.materiali
+    fig = make_subplots(rows=1, cols=len(materiali), subplot_titles=materiali)
+
+    for (tabella, chiave, materiale), x_curva, B_curva in zip(etichette, x, B):
+        if tabella not in tabelle:
+            continue
+        evidenziata = punto is not None and punto[:3] == (tabella, chiave, materiale)
+        fig.add_trace(
+            go.Scatter(
+                x=x_curva, y=B_curva, mode='lines',
+                name=f"{tabella} - {chiave}",
+                legendgroup=f"{tabella} - {chiave}",
+                showlegend=COEFF_STORE.materiale_id[materiale] == 0,
+                line={'width': 3 if evidenziata else 1},
+                opacity=1.0 if evidenziata or punto is None else 0.5,
+            ),
+            row=1, col=COEFF_STORE.materiale_id[materiale] + 1,
+        )
 
+    if punto is not None:
+        tabella, chiave, materiale, Xref_mm, B_punto = punto
+        fig.add_trace(
+            go.Scatter(x=[], y=[], mode='markers', marker={'size': 12, 'symbol': 'x', 'color': 'red'}),
+            row=1, col=COEFF_STORE.materiale_id[materiale] + 1,
+        )
+        aggiorna_marker_soluzione(fig, punto)
 
-# ====================================================================
-# 4. LOGICA DI BACKEND PRINCIPALE (IF/THEN/ELSE)
-# ====================================================================
+    fig.update_yaxes(type='log', title_text="Trasmissione B", range=[np.log10(CURVE_B_MIN), 0])
+    fig.update_xaxes(title_text="Spessore x [mm]")
+    fig.update_layout(height=600, legend={'font': {'size': 10}})
+    return fig
 
 
-def run_shielding_calculation(params):
+@st.cache_resource
+def cache_risultati():
     """
-    Funzione principale che gestisce la logica if-then-else e indirizza i calcoli.
+    Cache persistente dei risultati su disco, condivisa da sessioni, processi e job batch. Opzionale: attiva
+    solo se la variabile SHIELDING_CACHE indica il percorso del file. None se non attiva o non disponibile.
     """
-    tipo_immagine = params.get('tipo_immagine')
-    tipo_barriera = params.get('tipo_barriera')
-    modalita_radiografia = params.get('modalita_radiografia')
-    
-    risultati = {'ramo_logico': 'Non Eseguito', 'spessore_finale_mm': 0.0}
-    
-    # -------------------------------------------------------------------------
-    # RAMO 1: DIAGNOSTICA STANDARD (Le 4 modalità definite dall'utente con Kp1)
-    # -------------------------------------------------------------------------
-    if tipo_immagine == "RADIOLOGIA DIAGNOSTICA" and modalita_radiografia in RAMO_1_MODES:
-        
-        risultati['ramo_logico'] = "RAMO 1: DIAGNOSTICA STANDARD"
-        
-        if tipo_barriera == "PRIMARIA":
-            X_mm, K_non_schermato, log_msg = calculate_primary_thickness(params) 
-            # Gestione errore se Kp1=None
-            if log_msg.startswith("Dati Kp1 non definiti"):
-                risultati.update({'errore': log_msg})
-            else:
-                 risultati.update({'spessore_finale_mm': X_mm, 'kerma_non_schermato': K_non_schermato, 'dettaglio': f"Eseguito calcolo Primario. {log_msg}"})
-        
-        elif tipo_barriera == "SECONDARIA":
-            X_mm, X_L, X_S, K_non_schermato, log_msg = calculate_secondary_thickness(params)
-            risultati.update({'spessore_finale_mm': X_mm, 'X_fuga_mm': X_L, 'X_diffusione_mm': X_S, 'kerma_non_schermato': K_non_schermato, 'dettaglio': f"Eseguito calcolo Secondario. {log_msg}"})
-        
-        else:
-            risultati['errore'] = "Tipo di barriera non specificato per il Ramo 1."
-
-
-    # -------------------------------------------------------------------------
-    # RAMO 2: DIAGNOSTICA SPECIALIZZATA/GENERICA (Tutte le altre voci, inclusa TUTTE BARRIERE)
-    # -------------------------------------------------------------------------
-    elif tipo_immagine == "RADIOLOGIA DIAGNOSTICA" and modalita_radiografia in RAMO_2_MODES:
-        
-        risultati['ramo_logico'] = "RAMO 2: DIAGNOSTICA SPECIALIZZATA/GENERICA"
-        
-        if tipo_barriera == "PRIMARIA":
-              # Queste modalità (TUTTE BARRIERE, Mammo, Angio, Fluoro) hanno Kp1=None
-              X_mm, K_non_schermato, log_msg = calculate_primary_thickness(params)
-              
-              if log_msg.startswith("Dati Kp1 non definiti"):
-                risultati['spessore_finale_mm'] = 0.0
-                risultati['dettaglio'] = f"Calcolo Primario omesso per modalità specializzata/generica (Kp1 non definito). Dettaglio: {log_msg}"
-              else:
-                risultati.update({'spessore_finale_mm': X_mm, 'kerma_non_schermato': K_non_schermato, 'dettaglio': f"Eseguito calcolo Primario Ramo 2. {log_msg}"})
-
-        
-        elif tipo_barriera == "SECONDARIA":
-            X_mm, X_L, X_S, K_non_schermato, log_msg = calculate_special_secondary_thickness(params)
-            risultati.update({'spessore_finale_mm': X_mm, 'X_fuga_mm': X_L, 'X_diffusione_mm': X_S, 'kerma_non_schermato': K_non_schermato, 'dettaglio': f"Eseguito calcolo Secondario Specializzato/Generico. {log_msg}"})
-        
-        else:
-            risultati['errore'] = "Tipo di barriera non specificato nel Ramo 2."
-
-
-    # -------------------------------------------------------------------------
-    # RAMO 3: TC (Tomografia Computerizzata)
-    # -------------------------------------------------------------------------
-    elif tipo_immagine == "TC": 
-        risultati['ramo_logico'] = 'RAMO 3: TC (Calcolo Spessore)'
-        
-        if tipo_barriera == "PRIMARIA":
-            risultati['spessore_finale_mm'] = 0.0
-            risultati['kerma_non_schermato'] = 0.0
-            risultati['dettaglio'] = "TC - Calcolo Primario non richiesto."
-        
-        elif tipo_barriera == "SECONDARIA":
-            X_mm, K_tu, log_msg, K1sec_head, K1sec_body = calculate_tc_thickness(params)
-            
-            risultati.update({
-                'spessore_finale_mm': X_mm, 
-                'kerma_non_schermato': K_tu, 
-                'dettaglio': f"Spessore TC calcolato. {log_msg}",
-                'K1sec_head_mGy_paz': K1sec_head,
-                'K1sec_body_mGy_paz': K1sec_body
-            })
-            
-        else:
-            risultati['errore'] = "Tipo di barriera non specificato nel Ramo 3 (TC)."
-    
-    else:
-        risultati['errore'] = "Combinazione Tipo Immagine/Modalità non riconosciuta."
-        
-    return risultati
+    if not os.environ.get(CACHE_PATH_ENV):
+        return None
+    try:
+        return attiva_cache_persistente()
+    except (OSError, sqlite3.Error):
+        return None
+
+
+@st.cache_data(max_entries=4)
+def carico_tc_registro(contenuto, nome_file, statistica):
+    """ Riepilogo del registro dosi caricato (in cache: i cambi dei widget non rileggono il file). """
+    sorgente = io.BytesIO(contenuto)
+    sorgente.name = nome_file
+    return carico_tc_da_registro(sorgente, statistica=statistica)
+
+
+@st.cache_resource
+def sweep_cache():
+    """ SweepCache condivisa dal processo server (sopravvive ai rerun e alle sessioni), con le tabelle inverse. """
+    return SweepCache(tabelle=tabelle_spessore_inverso())
+
+
+@st.cache_data(max_entries=32)
+def griglia_sweep(params_items, asse_x, valori_x, asse_y, valori_y):
+    """ Griglia dello sweep in cache per input identici; i raffinamenti passano da SweepCache. """
+    return sweep_cache().griglia(dict(params_items), asse_x, np.array(valori_x), asse_y, np.array(valori_y))
+
+
+def figura_sweep(griglia, asse_x, valori_x, asse_y, valori_y, materiale, punto=None):
+    """ Contorni dello spessore finale sulla griglia (asse_y x asse_x). """
+    fig = go.Figure(go.Contour(
+        x=valori_x, y=valori_y, z=griglia['spessore_finale_mm'],
+        colorscale='Viridis',
+        contours={'showlabels': True},
+        colorbar={'title': f"X [mm] {materiale}"},
+    ))
+    if punto is not None:
+        fig.add_trace(go.Scatter(
+            x=[punto[0]], y=[punto[1]], mode='markers', name="Configurazione corrente",
+            marker={'size': 12, 'symbol': 'x', 'color': 'red'},
+        ))
+    fig.update_layout(xaxis_title=SWEEP_AXES[asse_x][0], yaxis_title=SWEEP_AXES[asse_y][0], height=600)
+    return fig
+
+
+# Esempio di planimetria per la sezione Mappa di Dose (coordinate in metri)
+DOSE_MAP_EXAMPLE = {
+    "sorgenti": [
+        {"x": 2.0, "y": 2.5, "modalita_radiografia": "FLUOROSCOPIA (R&F)", "tipo_barriera": "SECONDARIA", "pazienti_settimana_N": 50},
+        {"x": 2.5, "y": 2.0, "modalita_radiografia": "RADIOGRAFIA (TUBO R&F)", "tipo_barriera": "SECONDARIA", "pazienti_settimana_N": 100},
+    ],
+    "barriere": [
+        {"x1": 0.0, "y1": 0.0, "x2": 5.0, "y2": 0.0, "spessore_mm": 1.0, "materiale_schermatura": "PIOMBO"},
+        {"x1": 5.0, "y1": 0.0, "x2": 5.0, "y2": 5.0, "spessore_mm": 150.0, "materiale_schermatura": "CEMENTO"},
+        {"x1": 5.0, "y1": 5.0, "x2": 0.0, "y2": 5.0, "spessore_mm": 1.5, "materiale_schermatura": "PIOMBO"},
+        {"x1": 0.0, "y1": 5.0, "x2": 0.0, "y2": 0.0, "spessore_mm": 1.0, "materiale_schermatura": "PIOMBO"},
+    ],
+    # Punti occupati (usati dall'Ottimizzazione Spessori)
+    "punti": [
+        {"x": 2.5, "y": -0.3, "P_mSv_wk": 0.02, "tasso_occupazione_T": 1.0},
+        {"x": 5.3, "y": 2.5, "P_mSv_wk": 0.1, "tasso_occupazione_T": 0.5},
+        {"x": 2.5, "y": 5.3, "P_mSv_wk": 0.02, "tasso_occupazione_T": 0.2},
+        {"x": -0.3, "y": 2.5, "P_mSv_wk": 0.02, "tasso_occupazione_T": 1.0},
+    ],
+}
 
 
-# ====================================================================
-# 5. INTERFACCIA UTENTE STREAMLIT
-# ====================================================================
+@st.cache_data(max_entries=8)
+def mappa_dose_visualizzata(planimetria_json, x_lim, y_lim, passo_m, T):
+    """ Mappa di dose calcolata e ridotta per Plotly; in cache per planimetria e griglia. """
+    planimetria = json.loads(planimetria_json)
+    mappa = calcola_mappa_kerma(planimetria['sorgenti'], planimetria['barriere'], x_lim, y_lim, passo_m, occupazione=T)
+    ridotta, fattore = riduci_mappa_max(mappa['dose'])
+    return mappa['x'][::fattore], mappa['y'][::fattore], ridotta, mappa['dose'].size
+
+
+def figura_mappa_dose(x, y, dose, planimetria, P):
+    """ Heatmap (log10) della dose settimanale con barriere, sorgenti e contorno della Dose Limite P. """
+    with np.errstate(divide='ignore'):
+        log_dose = np.log10(dose)
+    fig = go.Figure(go.Heatmap(
+        x=x, y=y, z=log_dose, colorscale='Inferno',
+        colorbar={'title': "log10 Dose [mGy/sett.]"},
+    ))
+    if P > 0:
+        fig.add_trace(go.Contour(
+            x=x, y=y, z=log_dose, showscale=False, contours_coloring='lines',
+            contours={'start': np.log10(P), 'end': np.log10(P), 'size': 1},
+            line={'color': 'cyan', 'width': 2}, name=f"P = {P} mSv/sett.",
+        ))
+    for b in planimetria['barriere']:
+        fig.add_trace(go.Scatter(
+            x=[b['x1'], b['x2']], y=[b['y1'], b['y2']], mode='lines', showlegend=False,
+            line={'color': 'white', 'width': 4}, hovertext=f"{b['spessore_mm']} mm {b['materiale_schermatura']}",
+        ))
+    fig.add_trace(go.Scatter(
+        x=[s['x'] for s in planimetria['sorgenti']], y=[s['y'] for s in planimetria['sorgenti']],
+        mode='markers', name="Sorgenti", marker={'size': 10, 'symbol': 'star', 'color': 'lime'},
+    ))
+    fig.update_layout(height=700, xaxis_title="x [m]", yaxis_title="y [m]", yaxis_scaleanchor='x')
+    return fig
 
 
 def main_app():
     st.set_page_config(page_title="Calcolo Schermatura NCRP 147", layout="wide")
+    cache = cache_risultati()
     st.title("🛡️ Calcolo Schermatura Radiologica (NCRP 147)")
     st.caption("Implementazione della logica Ramo 1, 2 e 3 (TC).")
     
@@ -583,6 +301,37 @@ def main_app():
         modalita_radiografia = st.selectbox("Modalità Radiografica", modalita_radiografia_options, index=0)
         tipo_barriera = st.selectbox("Tipo di Barriera", ["PRIMARIA", "SECONDARIA"])
         materiale_schermatura = st.selectbox("Materiale Schermatura", ["PIOMBO", "CEMENTO"])
+
+        # Modello Secondaria (solo Radiologia Diagnostica)
+        modello_secondario = SECONDARY_MODELS[0]
+        if tipo_immagine == "RADIOLOGIA DIAGNOSTICA" and tipo_barriera == "SECONDARIA":
+            modello_secondario = st.selectbox(
+                "Modello Secondaria",
+                SECONDARY_MODELS,
+                index=0,
+                help="COMBINATO: Ksec1 combinato (Tab. 4.7). FUGA+DIFFUSIONE: somma delle trasmissioni di Fuga (Tab. C.1) e Diffusione (Tab. B.1)."
+            )
+
+        # Spettro di carico (solo Primaria di Radiologia Diagnostica): sostituisce il fit della modalità
+        spettro_carico = None
+        if tipo_immagine == "RADIOLOGIA DIAGNOSTICA" and tipo_barriera == "PRIMARIA" and st.checkbox(
+            "Spettro di Carico Personalizzato (mA·min per kVp)",
+            help="Trasmissione integrata sulla distribuzione di carico per kVp (fit a singolo kVp del fascio primario, NCRP 147 Tab. A.1)."
+        ):
+            carichi = {
+                kvp: st.number_input(
+                    f"Carico a {kvp} kVp [mA·min/settimana]",
+                    value=100.0 if kvp == 100 else 0.0,
+                    min_value=0.0,
+                    format="%.1f",
+                    key=f"carico_{kvp}_kvp"
+                )
+                for kvp in ATTENUATION_DATA_KVP[materiale_schermatura]
+            }
+            if sum(carichi.values()) > 0:
+                spettro_carico = normalizza_spettro_carico(carichi)
+            else:
+                st.warning("Carico totale nullo: viene usato il fit della modalità.")
         
         # CAMPO kVp PER TC
         kvp_tc = "N/A" # Default per non-TC
@@ -619,11 +368,43 @@ def main_app():
         weekly_n_head = 0
         weekly_n_body = 0
         contrast_factor = 1.0
+        dlp_head_mGy_cm = DLP_TC_FIXED_VALUES["HEAD"]
+        dlp_body_mGy_cm = DLP_TC_FIXED_VALUES["BODY"]
+        carico_registro = None
         
         if tipo_immagine == "TC":
             st.markdown("---") 
             st.subheader("Ripartizione Esami Settimanali (N)")
-            
+
+            file_registro = st.file_uploader(
+                "Registro Dosi TC (RIS/DICOM)",
+                type=["csv", "parquet"],
+                key="file_registro_dlp",
+                help="Esportazione con una riga per esame o per serie: data e DLP obbligatori; apparecchiatura, kVp, "
+                     "fantoccio/regione/protocollo (Testa/Corpo), mezzo di contrasto e identificativo esame se presenti."
+            )
+            if file_registro is not None:
+                statistica = st.radio("Carico Settimanale dal Registro", REGISTRO_STATISTICHE, horizontal=True)
+                try:
+                    carico = carico_tc_registro(file_registro.getvalue(), file_registro.name, statistica)
+                except ValueError as exc:
+                    st.error(str(exc))
+                else:
+                    scanner = st.selectbox("Apparecchiatura", carico['scanner'].unique())
+                    carico_registro = params_carico_tc(carico, scanner)
+                    st.dataframe(carico[carico['scanner'] == scanner], hide_index=True)
+                    st.caption(
+                        f"Carico di tutti i kVp attribuito a {carico_registro['kvp_tc']} (il più alto registrato). "
+                        "Il DLP registrato include le fasi con contrasto: $K_c$ = 1."
+                    )
+
+        if carico_registro is not None:
+            weekly_n_head = carico_registro['weekly_n_head']
+            weekly_n_body = carico_registro['weekly_n_body']
+            dlp_head_mGy_cm = carico_registro['dlp_head_mGy_cm']
+            dlp_body_mGy_cm = carico_registro['dlp_body_mGy_cm']
+            kvp_tc = carico_registro['kvp_tc']
+        elif tipo_immagine == "TC":
             weekly_n_head = st.number_input(
                 "WEEKLY N HEAD PROCED", 
                 value=0, 
@@ -700,10 +481,22 @@ def main_app():
             'weekly_n_head': weekly_n_head,
             'weekly_n_body': weekly_n_body,
             'contrast_factor': contrast_factor,
-            'kvp_tc': kvp_tc
+            'dlp_head_mGy_cm': dlp_head_mGy_cm,
+            'dlp_body_mGy_cm': dlp_body_mGy_cm,
+            'kvp_tc': kvp_tc,
+            'modello_secondario': modello_secondario,
+            'spettro_carico': spettro_carico,
         }
         
-        if st.button("🟡 ESEGUI CALCOLO SCHERMATURA", type="primary"):
+        calcolo_live = st.toggle(
+            "Calcolo Automatico (Live)",
+            key="calcolo_live",
+            help="Ricalcola i risultati a ogni modifica degli input, senza premere il pulsante."
+        )
+        if calcolo_live:
+            st.session_state['results'] = run_shielding_calculation(params)
+            st.session_state['run'] = True
+        elif st.button("🟡 ESEGUI CALCOLO SCHERMATURA", type="primary"):
             # Resetta lo stato di esecuzione per forzare l'aggiornamento
             st.session_state['results'] = None
             st.session_state['run'] = False
@@ -737,12 +530,13 @@ def main_app():
             if results['ramo_logico'] == 'RAMO 3: TC (Calcolo Spessore)':
                   st.info(results['dettaglio'])
                   st.markdown("**Valori di Kerma $K_{1sec}$ calcolati (a 1 metro):**")
-                  st.write(f"- $K_{{1sec}}(\\text{{Head}})$: {results.get('K1sec_head_mGy_paz', 0.0):.2e} mGy/paziente (DLP fisso: {DLP_TC_FIXED_VALUES['HEAD']} mGy·cm)")
-                  st.write(f"- $K_{{1sec}}(\\text{{Body}})$: {results.get('K1sec_body_mGy_paz', 0.0):.2e} mGy/paziente (DLP fisso: {DLP_TC_FIXED_VALUES['BODY']} mGy·cm)")
+                  origine_dlp = "DLP medio da registro" if carico_registro is not None else "DLP fisso"
+                  st.write(f"- $K_{{1sec}}(\\text{{Head}})$: {results.get('K1sec_head_mGy_paz', 0.0):.2e} mGy/paziente ({origine_dlp}: {params['dlp_head_mGy_cm']:g} mGy·cm)")
+                  st.write(f"- $K_{{1sec}}(\\text{{Body}})$: {results.get('K1sec_body_mGy_paz', 0.0):.2e} mGy/paziente ({origine_dlp}: {params['dlp_body_mGy_cm']:g} mGy·cm)")
                   st.markdown("**Parametri TC utilizzati:**")
                   st.write(f"- $K_c$ (Fattore Contrasto): {params['contrast_factor']:.1f}")
-                  st.write(f"- N Testa/settimana: {params['weekly_n_head']}")
-                  st.write(f"- N Corpo/settimana: {params['weekly_n_body']}")
+                  st.write(f"- N Testa/settimana: {params['weekly_n_head']:g}")
+                  st.write(f"- N Corpo/settimana: {params['weekly_n_body']:g}")
                   st.write(f"- $X_{{pre}}$ (Pre-schermatura): {params['X_PRE_mm']:.2f} mm (Selezionato: {X_PRE_selection_key})")
               
             else: # Ramo 1 e 2
@@ -760,14 +554,439 @@ def main_app():
                 st.write(f"- $X_{{pre}}$ (Pre-schermatura): {params['X_PRE_mm']:.2f} mm (Selezionato: {X_PRE_selection_key})")
                 
                 if params['tipo_barriera'] == "SECONDARIA":
-                    st.markdown("**Componenti Secondarie (Modello $K_{s1}$ Combinato):**")
+                    etichetta_modello = "Fuga + Diffusione" if params['modello_secondario'] == "FUGA+DIFFUSIONE" else "$K_{s1}$ Combinato"
+                    st.markdown(f"**Componenti Secondarie (Modello {etichetta_modello}):**")
                     st.write(f"- Spessore Fuga ($X_L$): {results.get('X_fuga_mm', 0.0):.2f} mm")
                     st.write(f"- Spessore Diffusione ($X_S$): {results.get('X_diffusione_mm', 0.0):.2f} mm")
-                
+
+    st.markdown("---")
+
+    # --- Sezione Curve di Trasmissione ---
+    with st.expander("4. Curve di Trasmissione B(x)"):
+        tabelle_curve = st.multiselect(
+            "Tabelle da visualizzare",
+            ["PRIMARIA", "SECONDARIA", "TC"],
+            default=["PRIMARIA", "SECONDARIA", "TC"],
+        )
+        punto = None
+        if st.session_state.get('run'):
+            punto = punto_soluzione_corrente(params, st.session_state['results'])
+        # Ricostruita solo se cambiano le tabelle o la curva evidenziata; altrimenti si sposta il marker
+        chiave_figura = ('curve', tuple(tabelle_curve), punto[:3] if punto else None)
+        fig_curve = figura_sessione(chiave_figura, lambda: figura_curve_trasmissione(tabelle_curve, punto))
+        if punto is not None:
+            aggiorna_marker_soluzione(fig_curve, punto)
+        st.plotly_chart(fig_curve, use_container_width=True)
+
+    # --- Sezione Analisi Parametrica (Sweep) ---
+    with st.expander("5. Analisi Parametrica (Sweep)"):
+        assi = list(SWEEP_AXES.keys())
+        etichetta_asse = lambda k: SWEEP_AXES[k][0]
+        col_sx, col_sy = st.columns(2)
+        with col_sx:
+            asse_x = st.selectbox("Asse X", assi, index=0, format_func=etichetta_asse)
+            x_min, x_max = st.slider("Intervallo X", *SWEEP_AXES[asse_x][1], SWEEP_AXES[asse_x][2])
+            n_x = st.number_input("Punti X", value=200, min_value=2, max_value=2000)
+        with col_sy:
+            asse_y = st.selectbox("Asse Y", [a for a in assi if a != asse_x], index=0, format_func=etichetta_asse)
+            y_min, y_max = st.slider("Intervallo Y", *SWEEP_AXES[asse_y][1], SWEEP_AXES[asse_y][2])
+            n_y = st.number_input("Punti Y", value=200, min_value=2, max_value=2000)
+
+        valori_x = tuple(np.linspace(x_min, x_max, int(n_x)).tolist())
+        valori_y = tuple(np.linspace(y_min, y_max, int(n_y)).tolist())
+        # I valori correnti dei due assi non entrano nella chiave: cambiarli sposta solo il marker
+        params_griglia = tuple(sorted((k, v) for k, v in params.items() if k not in (asse_x, asse_y)))
+        # Calcolata solo se richiesta: anche con l'expander chiuso lo script è rieseguito a ogni interazione
+        if st.toggle("Calcola mappa di spessore", key="sweep_attivo"):
+            griglia = griglia_sweep(params_griglia, asse_x, valori_x, asse_y, valori_y)
+            if 'errore' in griglia:
+                st.error(f"❌ Errore Logico/Implementazione: {griglia['errore']}")
+            else:
+                punto_sweep = (params[asse_x], params[asse_y])
+                fig_sweep = figura_sessione(
+                    repr(('sweep', params_griglia, asse_x, valori_x, asse_y, valori_y)),
+                    lambda: figura_sweep(griglia, asse_x, valori_x, asse_y, valori_y, materiale_schermatura, punto_sweep),
+                )
+                fig_sweep.data[-1].update(x=[punto_sweep[0]], y=[punto_sweep[1]])
+                st.plotly_chart(fig_sweep, use_container_width=True)
+
+    # --- Sezione Barriere Multi-Sorgente (Stanza) ---
+    with st.expander("6. Barriere Multi-Sorgente (Stanza)"):
+        st.caption(
+            f"Carica una tabella CSV con un contributo per riga e la colonna '{MULTISOURCE_WALL_COLUMN}' "
+            "che identifica la parete: i contributi della stessa parete (es. FLUOROSCOPIA (R&F) SECONDARIA + "
+            "RADIOGRAFIA (TUBO R&F) PRIMARIA) sono sommati e risolti con un unico spessore. "
+            "P, T e materiale sono letti dalla prima riga di ogni parete."
+        )
+        file_stanza = st.file_uploader("Tabella Contributi", type=["csv"], key="file_multisorgente")
+
+        if file_stanza is not None and st.button("ESEGUI CALCOLO MULTI-SORGENTE"):
+            risultati_stanza = calculate_multisource_walls(pd.read_csv(file_stanza))
+            st.dataframe(risultati_stanza)
+            st.download_button(
+                "Scarica Risultati (CSV)",
+                risultati_stanza.to_csv().encode("utf-8"),
+                file_name="risultati_multisorgente.csv",
+                mime="text/csv",
+            )
+
+    # --- Sezione Mappa di Dose (Planimetria) ---
+    with st.expander("7. Mappa di Dose (Planimetria)"):
+        planimetria_json = st.text_area(
+            "Sorgenti e Barriere (JSON)",
+            value=json.dumps(DOSE_MAP_EXAMPLE, indent=2),
+            height=300,
+            help="Coordinate in metri; le barriere sono segmenti con spessore [mm] e materiale.",
+        )
+        col_m1, col_m2, col_m3 = st.columns(3)
+        x_lim = col_m1.slider("Intervallo x [m]", -20.0, 40.0, (-3.0, 8.0))
+        y_lim = col_m2.slider("Intervallo y [m]", -20.0, 40.0, (-3.0, 8.0))
+        passo_m = col_m3.number_input("Passo griglia [m]", value=0.01, min_value=0.005, format="%.3f")
+
+        if st.button("CALCOLA MAPPA DI DOSE"):
+            try:
+                x_m, y_m, dose_m, n_celle = mappa_dose_visualizzata(planimetria_json, x_lim, y_lim, passo_m, tasso_occupazione_T)
+            except (ValueError, KeyError, TypeError) as exc:
+                st.error(f"❌ Errore Logico/Implementazione: {exc}")
+            else:
+                st.caption(f"Celle calcolate: {n_celle:,} (T = {tasso_occupazione_T:.2f}). Dose massima sulla griglia: {np.max(dose_m):.2e} mGy/settimana.")
+                st.plotly_chart(figura_mappa_dose(x_m, y_m, dose_m, json.loads(planimetria_json), P_mSv_wk), use_container_width=True)
+
+    # --- Sezione Ottimizzazione Spessori ---
+    with st.expander("8. Ottimizzazione Spessori (Costo / Peso)"):
+        st.caption(
+            "Usa sorgenti, barriere e punti occupati del JSON della Mappa di Dose. Le barriere possono indicare "
+            "'spessore_min_mm', 'spessore_max_mm', 'altezza_m' e, per l'obiettivo costo, 'costo_m2_mm'."
+        )
+        obiettivo_opt = st.selectbox("Obiettivo", OPTIMIZER_OBJECTIVES, format_func=lambda o: f"Minimizza {o}")
+
+        if st.button("OTTIMIZZA SPESSORI"):
+            try:
+                planimetria = json.loads(planimetria_json)
+                ottimo = ottimizza_spessori(planimetria['sorgenti'], planimetria['barriere'], planimetria['punti'], obiettivo_opt)
+            except (ValueError, KeyError, TypeError) as exc:
+                st.error(f"❌ Errore Logico/Implementazione: {exc}")
+            else:
+                if ottimo['successo']:
+                    st.success(f"✅ Ottimo trovato: {obiettivo_opt} = {ottimo['obiettivo']:.1f}")
+                else:
+                    st.error(f"❌ Ottimizzazione non riuscita: {ottimo['messaggio']}")
+                st.dataframe(pd.DataFrame({
+                    'materiale_schermatura': [b['materiale_schermatura'] for b in planimetria['barriere']],
+                    'spessore_ottimo_mm': ottimo['spessori_mm'],
+                }))
+                st.dataframe(pd.DataFrame({
+                    'x': [p['x'] for p in planimetria['punti']],
+                    'y': [p['y'] for p in planimetria['punti']],
+                    'dose_mGy_wk': ottimo['dose_punti'],
+                    'P_mSv_wk': [p['P_mSv_wk'] for p in planimetria['punti']],
+                }))
+
+    # --- Sezione Incertezza (Monte Carlo) ---
+    with st.expander("9. Incertezza (Monte Carlo)"):
+        st.caption(
+            "Incertezza relativa (CV, distribuzione normale troncata ai limiti fisici) sugli input della "
+            "configurazione corrente; Wnorm agisce come fattore sul kerma (Ramo 1/2)."
+        )
+        cv_parametri = {}
+        colonne_cv = st.columns(5)
+        for colonna, (parametro, etichetta) in zip(colonne_cv, [
+            ('pazienti_settimana_N', "CV N [%]"), ('distanza_d', "CV d [%]"), ('fattore_uso_U', "CV U [%]"),
+            ('tasso_occupazione_T', "CV T [%]"), ('Wnorm', "CV Wnorm [%]"),
+        ]):
+            cv_parametri[parametro] = colonna.number_input(etichetta, value=0.0, min_value=0.0, max_value=100.0, format="%.1f", key=f"cv_{parametro}")
+        n_campioni = st.number_input("Numero di campioni", value=1_000_000, min_value=1000, step=100_000)
+        seme_mc = st.number_input("Seme", value=0, min_value=0)
+
+        if st.button("ESEGUI MONTE CARLO"):
+            distribuzioni = {k: ('normale', 1.0, cv / 100) for k, cv in cv_parametri.items() if cv > 0}
+            istogramma = IstogrammaStreaming()
+            try:
+                riepilogo = mc_spessore(params, distribuzioni, int(n_campioni), int(seme_mc), relativo=True, istogramma=istogramma)
+            except ValueError as exc:
+                st.error(f"❌ Errore Logico/Implementazione: {exc}")
+            else:
+                col_mc = st.columns(4)
+                col_mc[0].metric("Spessore Nominale", f"{riepilogo['nominale']:.2f} mm")
+                for colonna, q in zip(col_mc[1:], MC_PERCENTILES):
+                    colonna.metric(f"P{q}", f"{riepilogo[f'P{q}']:.2f} mm")
+                st.caption(
+                    f"Media {riepilogo['media']:.3f} mm, sd {riepilogo['sd']:.3f} mm, campioni validi "
+                    f"{riepilogo['frazione_valida']:.1%}, risoluzione {riepilogo['risoluzione_mm']:.1e} mm."
+                )
+                ultimo = max(int(np.flatnonzero(istogramma.conteggi).max(initial=0)) + 1, 1)
+                conteggi = istogramma.conteggi[:ultimo]
+                passo = -(-len(conteggi) // 200)
+                conteggi = np.add.reduceat(conteggi, np.arange(0, len(conteggi), passo))
+                st.plotly_chart(go.Figure(
+                    go.Bar(x=(np.arange(len(conteggi)) + 0.5) * passo * istogramma.larghezza, y=conteggi / istogramma.n),
+                    layout={'xaxis_title': f"Spessore finale [mm] {materiale_schermatura}", 'yaxis_title': "Frazione", 'bargap': 0},
+                ), use_container_width=True)
+
+    # --- Sezione Barriere Composte (Stratificate) ---
+    with st.expander("10. Barriere Composte (Stratificate)"):
+        st.caption(
+            "Parete a più strati (es. CEMENTO esistente + lamina di PIOMBO): la trasmissione è il prodotto delle "
+            "trasmissioni dei singoli strati. Lasciare vuoto lo spessore dello strato da dimensionare; "
+            "gli altri parametri sono quelli della barriera corrente."
+        )
+        strati = st.data_editor(
+            pd.DataFrame({
+                'materiale_schermatura': ["CEMENTO", "PIOMBO"],
+                COMPOSITE_LAYER_COLUMN: [100.0, None],
+            }),
+            num_rows="dynamic",
+            column_config={
+                'materiale_schermatura': st.column_config.SelectboxColumn("Materiale", options=list(COEFF_STORE.materiali)),
+                COMPOSITE_LAYER_COLUMN: st.column_config.NumberColumn("Spessore [mm]", min_value=0.0),
+            },
+            key="strati_barriera",
+        )
+        if st.button("CALCOLA STRATO INCOGNITO"):
+            risultato_strati = run_composite_calculation(params, strati.to_dict('records'))
+            if 'errore' in risultato_strati:
+                st.error(f"❌ Errore Logico/Implementazione: {risultato_strati['errore']}")
+            elif not risultato_strati['spessore_valido']:
+                st.warning("Spessore non calcolabile: verificare i parametri.")
+            else:
+                st.metric(
+                    "Spessore Strato Incognito",
+                    f"{risultato_strati['spessore_finale_mm']:.2f} mm {risultato_strati['materiale_strato_incognito']}",
+                )
+                if np.isfinite(risultato_strati['trasmissione_strati_noti']):
+                    st.caption(f"Trasmissione degli strati noti: {risultato_strati['trasmissione_strati_noti']:.4e}")
+
+        st.caption(
+            f"Per un impianto: tabella CSV con uno strato per riga, la colonna '{COMPOSITE_WALL_COLUMN}' che "
+            f"identifica la parete e '{COMPOSITE_LAYER_COLUMN}' (vuota per lo strato incognito). "
+            "I parametri della barriera sono letti dalla prima riga di ogni parete."
+        )
+        file_strati = st.file_uploader("Tabella Strati", type=["csv"], key="file_stratificate")
+
+        if file_strati is not None and st.button("ESEGUI CALCOLO BARRIERE COMPOSTE"):
+            risultati_strati = calculate_composite_walls(pd.read_csv(file_strati))
+            st.dataframe(risultati_strati)
+            st.download_button(
+                "Scarica Risultati (CSV)",
+                risultati_strati.to_csv().encode("utf-8"),
+                file_name="risultati_stratificate.csv",
+                mime="text/csv",
+            )
+
+    # --- Sezione Batch (Impianto) ---
+    with st.expander("11. Calcolo Batch (Impianto / Facility)"):
+        st.caption(
+            "Carica una tabella di barriere (CSV o Parquet) con le colonne: "
+            + ", ".join(BATCH_COLUMN_DEFAULTS.keys())
+            + ". Colonne assenti o celle vuote assumono i valori di default."
+        )
+        file_batch = st.file_uploader("Tabella Barriere", type=["csv", "parquet"])
+        genera_relazione = st.checkbox(
+            "Genera relazione (Excel + PDF per stanza)",
+            help="Colonne opzionali 'impianto' e 'stanza' per raggruppare le barriere nelle pagine della relazione.",
+        )
+        registra_archivio = st.checkbox(
+            "Registra nell'archivio di progetto",
+            help="Aggiunge ingressi e risultati allo storico Parquet (partizionato per impianto e stanza).",
+        )
+
+        if file_batch is not None and st.button("ESEGUI CALCOLO BATCH"):
+            risultati_batch = pd.concat(run_batch_calculation(file_batch), ignore_index=True)
+            n_errori = int(risultati_batch['errore'].notna().sum())
+            st.success(f"✅ Barriere elaborate: {len(risultati_batch)} (errori: {n_errori})")
+            if cache is not None:
+                stat = cache.statistiche()
+                st.caption(
+                    f"Cache risultati: {stat['voci']} voci, {stat['byte'] / 1e6:.1f} MB "
+                    f"(hit {stat['hit']}, miss {stat['miss']})."
+                )
+            st.dataframe(risultati_batch.head(1000))
+            st.download_button(
+                "Scarica Risultati (CSV)",
+                risultati_batch.to_csv(index=False).encode("utf-8"),
+                file_name="risultati_schermatura.csv",
+                mime="text/csv",
+            )
+
+            if genera_relazione:
+                relazione_xlsx, relazione_pdf = io.BytesIO(), io.BytesIO()
+                file_batch.seek(0)
+                try:
+                    write_facility_report(file_batch, xlsx=relazione_xlsx, pdf=relazione_pdf)
+                except ImportError as exc:
+                    st.warning(f"{exc} Viene generato solo il PDF.")
+                    relazione_xlsx = None
+                    file_batch.seek(0)
+                    relazione_pdf = io.BytesIO()
+                    write_facility_report(file_batch, pdf=relazione_pdf)
+                col_rel1, col_rel2 = st.columns(2)
+                if relazione_xlsx is not None:
+                    col_rel1.download_button(
+                        "Scarica Relazione (Excel)",
+                        relazione_xlsx.getvalue(),
+                        file_name="relazione_schermatura.xlsx",
+                        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                    )
+                col_rel2.download_button(
+                    "Scarica Relazione (PDF)",
+                    relazione_pdf.getvalue(),
+                    file_name="relazione_schermatura.pdf",
+                    mime="application/pdf",
+                )
+
+            if registra_archivio:
+                file_batch.seek(0)
+                try:
+                    calcolo_id, n_archiviate = ArchivioProgetto().registra(file_batch)
+                except ImportError as exc:
+                    st.warning(str(exc))
+                else:
+                    st.caption(f"Archivio di progetto: registrate {n_archiviate} barriere (calcolo {calcolo_id}).")
+
+    # --- Sezione Archivio di Progetto ---
+    with st.expander("12. Archivio di Progetto (Storico)"):
+        st.caption("Storico delle barriere registrate dal calcolo batch, filtrato per impianto e stanza.")
+        col_arc1, col_arc2 = st.columns(2)
+        filtro_impianto = col_arc1.text_input("Impianto", key="archivio_impianto")
+        filtro_stanza = col_arc2.text_input("Stanza", key="archivio_stanza")
+        solo_ultimo = st.checkbox("Solo l'ultima registrazione di ogni barriera", value=True)
+        if st.button("CARICA STORICO"):
+            try:
+                storico = ArchivioProgetto().leggi(
+                    impianto=filtro_impianto or None, stanza=filtro_stanza or None, ultimo=solo_ultimo,
+                )
+            except ImportError as exc:
+                st.warning(str(exc))
+            else:
+                st.caption(f"Righe: {len(storico)}")
+                st.dataframe(storico.head(1000))
+                st.download_button(
+                    "Scarica Storico (CSV)",
+                    storico.to_csv(index=False).encode("utf-8"),
+                    file_name="storico_schermatura.csv",
+                    mime="text/csv",
+                )
+
+    # --- Sezione Progetto (Ricalcolo Incrementale) ---
+    with st.expander("13. Progetto (Ricalcolo Incrementale)"):
+        st.caption(
+            "Tabella di barriere modificabile: a ogni modifica sono ricalcolate solo le barriere con ingressi "
+            "cambiati (impronte per riga) e viene mostrato il rapporto delle variazioni di spessore."
+        )
+        file_progetto = st.file_uploader("Tabella Barriere del Progetto", type=["csv"], key="file_progetto")
+        if file_progetto is not None and st.session_state.get('progetto_file') != file_progetto.file_id:
+            st.session_state['progetto'] = ProgettoIncrementale(pd.read_csv(file_progetto))
+            st.session_state['progetto_tabella'] = st.session_state['progetto'].barriere
+            st.session_state['progetto_file'] = file_progetto.file_id
+
+        progetto = st.session_state.get('progetto')
+        if progetto is not None:
+            # Ricalcolo solo se richiesto: anche con l'expander chiuso lo script è rieseguito a ogni interazione
+            if st.toggle("Modifica e ricalcolo del progetto", key="progetto_attivo"):
+                barriere_modificate = st.data_editor(st.session_state['progetto_tabella'], num_rows="dynamic", key="editor_progetto")
+                variazioni = progetto.aggiorna_tabella(barriere_modificate.reset_index())
+                if len(variazioni):
+                    st.caption(f"Barriere ricalcolate: {int(variazioni['causa'].isin(PROGETTO_CAUSE).sum())}")
+                    st.dataframe(variazioni)
+                st.dataframe(progetto.risultati.head(1000))
+                st.download_button(
+                    "Scarica Risultati del Progetto (CSV)",
+                    progetto.risultati.to_csv().encode("utf-8"),
+                    file_name="risultati_progetto.csv",
+                    mime="text/csv",
+                )
+            else:
+                # Alla riattivazione l'editor riparte dalla tabella corrente (modifiche già applicate)
+                st.session_state['progetto_tabella'] = progetto.barriere.copy()
+
+    # --- Sezione Verifica di Conformità (calcolo diretto) ---
+    with st.expander("14. Verifica di Conformità (Spessori Installati)"):
+        st.caption(
+            "Calcolo diretto: dato lo spessore installato, trasmissione B(x), kerma trasmesso e dose settimanale "
+            "dietro la barriera (con T), confrontata con P. Lo spessore di pre-schermatura X_PRE si somma."
+        )
+        spessore_installato = st.number_input(
+            f"Spessore installato [mm] {materiale_schermatura}", value=0.0, min_value=0.0, format="%.2f",
+        )
+        # Calcolata solo se richiesta, come lo sweep
+        if st.toggle("Verifica la barriera corrente", key="verifica_attiva"):
+            verifica = run_compliance_calculation(params, spessore_installato)
+            if 'errore' in verifica:
+                st.error(f"❌ Errore Logico/Implementazione: {verifica['errore']}")
+            else:
+                col_ver1, col_ver2, col_ver3 = st.columns(3)
+                col_ver1.metric("Trasmissione B", f"{verifica['trasmittanza_B']:.3e}")
+                col_ver2.metric("Dose settimanale (T incluso)", f"{verifica['dose_settimanale']:.4g} mSv/sett.")
+                col_ver3.metric("Dose / P", f"{verifica['rapporto_dose_P']:.3g}")
+                if verifica['conforme']:
+                    st.success("✅ Barriera conforme (dose settimanale <= P).")
+                else:
+                    st.error("❌ Barriera non conforme: dose settimanale superiore a P.")
+
+        st.caption(
+            f"Per un impianto: tabella CSV o Parquet come per il calcolo batch, con la colonna "
+            f"'{COMPLIANCE_THICKNESS_COLUMN}' (celle vuote: nessuna barriera)."
+        )
+        file_verifica = st.file_uploader("Tabella Barriere Installate", type=["csv", "parquet"], key="file_verifica")
+        if file_verifica is not None and st.button("ESEGUI VERIFICA IMPIANTO"):
+            esiti = pd.concat(run_compliance_check(file_verifica), ignore_index=True)
+            non_conformi = esiti[~esiti['conforme']]
+            st.success(f"✅ Barriere verificate: {len(esiti)} (non conformi: {len(non_conformi)})")
+            st.dataframe(non_conformi.sort_values('rapporto_dose_P', ascending=False).head(1000))
+            st.download_button(
+                "Scarica Verifica (CSV)",
+                esiti.to_csv(index=False).encode("utf-8"),
+                file_name="verifica_conformita.csv",
+                mime="text/csv",
+            )
+
+    # --- Sezione Tasso di Dose nel Tempo (programma degli esami) ---
+    with st.expander("15. Tasso di Dose nel Tempo (Programma Esami)"):
+        st.caption(
+            f"Tabella delle barriere installate (come per la verifica, con la colonna '{BATCH_ROOM_COLUMN}') e "
+            f"programma degli esami ordinato per orario: colonne '{DOSE_RATE_TIME_COLUMN}', '{BATCH_ROOM_COLUMN}' "
+            f"e facoltative '{BATCH_FACILITY_COLUMN}', '{DOSE_RATE_COUNT_COLUMN}'. "
+            f"TADR = kerma trasmesso settimanale / {DOSE_RATE_WORK_HOURS:g} h; picco = massimo in un'ora."
+        )
+        col_td1, col_td2 = st.columns(2)
+        file_barriere_td = col_td1.file_uploader("Tabella Barriere Installate", type=["csv", "parquet"], key="file_barriere_td")
+        file_programma = col_td2.file_uploader("Programma Esami", type=["csv", "parquet"], key="file_programma")
+        if file_barriere_td is not None and file_programma is not None and st.button("CALCOLA TASSO DI DOSE"):
+            try:
+                tasso = run_dose_rate_calculation(pd.concat(iter_barrier_table(file_barriere_td)), file_programma)
+            except ValueError as exc:
+                st.error(f"❌ {exc}")
+            else:
+                risultati_td = tasso.risultati()
+                st.caption(
+                    f"Programma: {tasso.n_settimane} settimane; esami di stanze senza barriere: {tasso.esami_ignorati:g}."
+                )
+                n_senza_esami = int(risultati_td['senza_esami'].sum())
+                if n_senza_esami:
+                    st.warning(f"Barriere in stanze senza esami nel programma (non verificabili): {n_senza_esami}.")
+                st.dataframe(risultati_td.sort_values('picco_orario_uGy_h', ascending=False).head(1000))
+                if risultati_td['picco_orario_uGy_h'].notna().any():
+                    peggiore = int(np.nanargmax(risultati_td['picco_orario_uGy_h'].to_numpy()))
+                    profilo = tasso.profilo_settimanale([peggiore]).iloc[:, 0]
+                    st.plotly_chart(go.Figure(
+                        go.Bar(x=profilo.index / 24, y=profilo.to_numpy()),
+                        layout={
+                            'title': f"Settimana tipo - barriera {risultati_td.index[peggiore]} (picco orario massimo)",
+                            'xaxis_title': "Giorno della settimana (0 = lunedì)", 'yaxis_title': "Tasso di kerma [µGy/h]",
+                            'bargap': 0,
+                        },
+                    ), use_container_width=True)
+                st.download_button(
+                    "Scarica Tasso di Dose (CSV)",
+                    risultati_td.to_csv().encode("utf-8"),
+                    file_name="tasso_dose.csv",
+                    mime="text/csv",
+                )
+
 if __name__ == "__main__":
     if 'run' not in st.session_state:
         st.session_state['run'] = False
     if 'results' not in st.session_state:
         st.session_state['results'] = None
         
-    main_app()
\ No newline at end of file
+    main_app()
@@ -0,0 +1,4 @@
+"""
+Benchmark dei percorsi di calcolo del pacchetto shielding (scalari e vettoriali), con baseline di throughput
+e verifiche di equivalenza numerica rispetto all'implementazione scalare. Esecuzione: python -m benchmarks
+"""
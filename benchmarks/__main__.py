@@ -0,0 +1,3 @@
+from .esegui import main
+
+raise SystemExit(main())
@@ -0,0 +1,285 @@
+"""
+Casi di benchmark dei percorsi di calcolo.
+
+Ogni caso genera ingressi casuali riproducibili e definisce l'implementazione scalare di riferimento
+(una chiamata per riga, come nell'interfaccia) e la controparte vettoriale usata dal motore batch.
+Entrambe restituiscono le stesse grandezze, confrontate riga per riga nelle verifiche di equivalenza.
+"""
+
+import numpy as np
+
+from shielding.analitica import (
+    SPESSORE_NON_VALIDO_MM,
+    calcola_kerma_incidente,
+    calcola_kerma_incidente_array,
+    calcola_spessore_x,
+    calcola_spessore_x_array,
+)
+from shielding.calcolo import calcola_schermatura, run_shielding_calculation, run_shielding_calculation_array
+from shielding.coefficienti import COEFF_STORE
+from shielding.tabelle_inverse import INVERSE_TABLE_MAX_ERROR_MM, tabelle_spessore_inverso
+from shielding.spessori import (
+    calculate_primary_thickness,
+    calculate_secondary_thickness,
+    calculate_special_secondary_thickness,
+    calculate_tc_thickness,
+)
+
+
+# Uscite confrontate per i casi basati sul dizionario params
+USCITE_SPESSORE = ('spessore_finale_mm', 'kerma_non_schermato')
+USCITE_SECONDARIA = ('spessore_finale_mm', 'X_fuga_mm', 'X_diffusione_mm', 'kerma_non_schermato')
+
+# Combinazioni Tipo Immagine/Modalità/Barriera/Materiale per ramo logico
+DIAGNOSTICA_RAMO_1 = {
+    'tipo_immagine': "RADIOLOGIA DIAGNOSTICA",
+    'modalita_radiografia': "STANZA RADIOGRAFICA (CHEST BUCKY)",
+    'materiale_schermatura': "PIOMBO",
+}
+DIAGNOSTICA_RAMO_2 = {
+    'tipo_immagine': "RADIOLOGIA DIAGNOSTICA",
+    'modalita_radiografia': "FLUOROSCOPIA (R&F)",
+    'materiale_schermatura': "CEMENTO",
+}
+TC_RAMO_3 = {
+    'tipo_immagine': "TC",
+    'modalita_radiografia': "",
+    'materiale_schermatura': "PIOMBO",
+    'kvp_tc': "120 kVp",
+}
+
+
+class CasoBenchmark:
+    """
+    Un percorso di calcolo da misurare.
+    genera(rng, n) -> dict degli ingressi (array di n righe o valori fissi);
+    scalare(riga) -> tupla di uscite per una riga (argomenti preparati da righe_scalari);
+    vettoriale(ingressi) -> tupla di array con le stesse uscite, per tutte le righe.
+    tolleranza_mm: differenza assoluta ammessa nell'equivalenza per le implementazioni approssimate.
+    """
+
+    def __init__(self, nome, uscite, genera, scalare, vettoriale, argomenti_riga=None, tolleranza_mm=None):
+        self.nome = nome
+        self.tolleranza_mm = tolleranza_mm
+        self.uscite = uscite
+        self.genera = genera
+        self.scalare = scalare
+        self.vettoriale = vettoriale
+        self._argomenti_riga = argomenti_riga or _params_riga
+
+    def righe_scalari(self, ingressi, righe):
+        """ Argomenti delle chiamate scalari per le righe indicate (preparati fuori dalla misura). """
+        return [self._argomenti_riga(ingressi, i) for i in righe]
+
+    def esegui_scalare(self, argomenti):
+        """ Esegue l'implementazione scalare riga per riga; restituisce un array (righe, uscite). """
+        return np.array([self.scalare(a) for a in argomenti], dtype=float).reshape(len(argomenti), len(self.uscite))
+
+    def esegui_vettoriale(self, ingressi):
+        """ Esegue l'implementazione vettoriale; restituisce un array (righe, uscite). """
+        return np.column_stack([np.asarray(u, dtype=float) for u in self.vettoriale(ingressi)])
+
+
+def _params_riga(ingressi, i):
+    """ Dizionario params (tipi Python nativi) della riga i. """
+    return {k: (v.item(i) if isinstance(v, np.ndarray) else v) for k, v in ingressi.items()}
+
+
+def _tupla_riga(chiavi):
+    return lambda ingressi, i: tuple(ingressi[k].item(i) for k in chiavi)
+
+
+# --- Generatori di ingressi ---
+
+def _numerici_barriera(rng, n):
+    """ Parametri numerici di una barriera Ramo 1/2, con una quota di casi nulli (P = 0). """
+    return {
+        'P_mSv_wk': rng.choice([0.0, 0.02, 0.1, 0.4], n, p=[0.02, 0.38, 0.3, 0.3]),
+        'tasso_occupazione_T': rng.choice([1.0, 0.5, 0.2, 0.05, 0.025], n),
+        'distanza_d': rng.uniform(0.5, 8.0, n),
+        'fattore_uso_U': rng.choice([1.0, 0.5, 0.25, 0.0625], n),
+        'pazienti_settimana_N': rng.integers(5, 400, n).astype(float),
+        'X_PRE_mm': rng.choice([0.0, 0.3, 0.85], n),
+    }
+
+
+def _numerici_tc(rng, n):
+    """ Parametri numerici di una barriera TC (Ramo 3). """
+    return {
+        'P_mSv_wk': rng.choice([0.0, 0.02, 0.1], n, p=[0.02, 0.49, 0.49]),
+        'tasso_occupazione_T': rng.choice([1.0, 0.5, 0.2, 0.05], n),
+        'distanza_d': rng.uniform(1.0, 10.0, n),
+        'X_PRE_mm': rng.choice([0.0, 0.3], n),
+        'weekly_n_head': rng.integers(0, 300, n).astype(float),
+        'weekly_n_body': rng.integers(0, 500, n).astype(float),
+        'contrast_factor': rng.choice([1.0, 1.2, 1.4], n),
+    }
+
+
+def _genera_formula_inversa(rng, n):
+    """ Coefficienti di tutte le tabelle di attenuazione e trasmittanze su 7 decadi (anche B > 1). """
+    att = np.concatenate([
+        COEFF_STORE.att_primaria[:-1, :-1].reshape(-1, 3),
+        COEFF_STORE.att_secondaria[:-1, :-1].reshape(-1, 3),
+        COEFF_STORE.att_tc[:-1, :-1].reshape(-1, 3),
+    ])
+    scelta = att[rng.integers(0, len(att), n)]
+    return {'alpha': scelta[:, 0], 'beta': scelta[:, 1], 'gamma': scelta[:, 2], 'B': 10.0 ** rng.uniform(-7.0, 0.5, n)}
+
+
+def _genera_tabelle_inverse(rng, n):
+    """ Indici dei fit delle tabelle inverse e trasmittanze su 7 decadi (anche B > 1). """
+    tabelle = tabelle_spessore_inverso()
+    fit = rng.integers(0, len(tabelle.att), n)
+    return {'fit': fit, 'att': tabelle.att[fit], 'B': 10.0 ** rng.uniform(-7.0, 0.5, n)}
+
+
+def _genera_kerma(rng, n):
+    """ Fattori di kerma tabulati, con una quota di distanze nulle. """
+    K = np.concatenate([COEFF_STORE.Kp1, COEFF_STORE.Ksec1_Comb])
+    K = K[~np.isnan(K)]
+    d = rng.uniform(0.5, 8.0, n)
+    d[rng.random(n) < 0.01] = 0.0
+    return {
+        'K_val': rng.choice(K, n),
+        'U': rng.choice([1.0, 0.5, 0.25, 0.0625], n),
+        'N': rng.integers(5, 400, n).astype(float),
+        'd': d,
+    }
+
+
+def _genera_params(fissi, numerici):
+    return lambda rng, n: {**fissi, **numerici(rng, n)}
+
+
+def _genera_mista(rng, n):
+    """ Tabella di barriere con tutti i rami e tipi di barriera (ingresso del motore batch). """
+    combinazioni = [
+        {**DIAGNOSTICA_RAMO_1, 'tipo_barriera': "PRIMARIA", 'kvp_tc': "", 'modello_secondario': "COMBINATO"},
+        {**DIAGNOSTICA_RAMO_1, 'tipo_barriera': "SECONDARIA", 'kvp_tc': "", 'modello_secondario': "COMBINATO"},
+        {**DIAGNOSTICA_RAMO_1, 'tipo_barriera': "SECONDARIA", 'kvp_tc': "", 'modello_secondario': "FUGA+DIFFUSIONE"},
+        {**DIAGNOSTICA_RAMO_2, 'tipo_barriera': "PRIMARIA", 'kvp_tc': "", 'modello_secondario': "COMBINATO"},
+        {**DIAGNOSTICA_RAMO_2, 'tipo_barriera': "SECONDARIA", 'kvp_tc': "", 'modello_secondario': "COMBINATO"},
+        {**TC_RAMO_3, 'tipo_barriera': "PRIMARIA", 'modello_secondario': "COMBINATO"},
+        {**TC_RAMO_3, 'tipo_barriera': "SECONDARIA", 'modello_secondario': "COMBINATO"},
+    ]
+    scelta = rng.integers(0, len(combinazioni), n)
+    ingressi = {
+        k: np.array([c[k] for c in combinazioni], dtype=object)[scelta] for k in combinazioni[0]
+    }
+    ingressi.update(_numerici_barriera(rng, n))
+    tc = _numerici_tc(rng, n)
+    for k in ('weekly_n_head', 'weekly_n_body', 'contrast_factor'):
+        ingressi[k] = tc[k]
+    return ingressi
+
+
+# --- Implementazioni scalari e vettoriali ---
+
+def _formula_inversa_array(ing):
+    x, valido = calcola_spessore_x_array(ing['alpha'], ing['beta'], ing['gamma'], ing['B'])
+    return (np.where(valido, x, SPESSORE_NON_VALIDO_MM),)
+
+
+def _tabelle_inverse_array(ing):
+    x, valido = tabelle_spessore_inverso().spessore_array(ing['fit'], ing['B'])
+    return (np.where(valido, x, SPESSORE_NON_VALIDO_MM),)
+
+
+def _calcolo_array(uscite):
+    def vettoriale(ing):
+        risultati = run_shielding_calculation_array(ing)
+        return tuple(risultati[k] for k in uscite)
+    return vettoriale
+
+
+def _calcolo_scalare(uscite):
+    def scalare(params):
+        risultati = run_shielding_calculation(params)
+        return tuple(risultati.get(k, 0.0) for k in uscite)
+    return scalare
+
+
+def _record_scalare(params):
+    risultato = calcola_schermatura(params)
+    return risultato.spessore_finale_mm, risultato.kerma_non_schermato
+
+
+def _batch_mista(ing):
+    import pandas as pd  # il motore batch richiede pandas; gli altri casi soltanto NumPy
+
+    from shielding.batch import calculate_batch_chunk
+
+    risultati = calculate_batch_chunk(pd.DataFrame(ing))
+    return tuple(risultati[k].to_numpy() for k in USCITE_SPESSORE)
+
+
+def _caso_calcolo(etichetta, fissi, numerici, uscite):
+    """ run_shielding_calculation su una combinazione (ramo/barriera) contro run_shielding_calculation_array. """
+    return CasoBenchmark(
+        f"run_shielding_calculation[{etichetta}]", uscite,
+        _genera_params(fissi, numerici), _calcolo_scalare(uscite), _calcolo_array(uscite),
+    )
+
+
+CASI_BENCHMARK = [
+    CasoBenchmark(
+        "calcola_spessore_x", ('Xref_mm',), _genera_formula_inversa,
+        lambda a: (calcola_spessore_x(*a),), _formula_inversa_array,
+        argomenti_riga=_tupla_riga(('alpha', 'beta', 'gamma', 'B')),
+    ),
+    CasoBenchmark(
+        "calcola_spessore_x / TabelleSpessoreInverso", ('Xref_mm',), _genera_tabelle_inverse,
+        lambda a: (calcola_spessore_x(*a),), _tabelle_inverse_array,
+        argomenti_riga=lambda ing, i: (*ing['att'][i].tolist(), ing['B'].item(i)),
+        tolleranza_mm=INVERSE_TABLE_MAX_ERROR_MM,
+    ),
+    CasoBenchmark(
+        "calcola_kerma_incidente", ('kerma_non_schermato',), _genera_kerma,
+        lambda a: (calcola_kerma_incidente(*a),),
+        lambda ing: (calcola_kerma_incidente_array(ing['K_val'], ing['U'], ing['N'], ing['d']),),
+        argomenti_riga=_tupla_riga(('K_val', 'U', 'N', 'd')),
+    ),
+    CasoBenchmark(
+        "calculate_primary_thickness[RAMO 1]", USCITE_SPESSORE,
+        _genera_params({**DIAGNOSTICA_RAMO_1, 'tipo_barriera': "PRIMARIA"}, _numerici_barriera),
+        lambda p: calculate_primary_thickness(p)[:2], _calcolo_array(USCITE_SPESSORE),
+    ),
+    CasoBenchmark(
+        "calculate_secondary_thickness[RAMO 1, COMBINATO]", USCITE_SECONDARIA,
+        _genera_params({**DIAGNOSTICA_RAMO_1, 'tipo_barriera': "SECONDARIA"}, _numerici_barriera),
+        lambda p: calculate_secondary_thickness(p)[:4], _calcolo_array(USCITE_SECONDARIA),
+    ),
+    CasoBenchmark(
+        "calculate_secondary_thickness[RAMO 1, FUGA+DIFFUSIONE]", USCITE_SECONDARIA,
+        _genera_params(
+            {**DIAGNOSTICA_RAMO_1, 'tipo_barriera': "SECONDARIA", 'modello_secondario': "FUGA+DIFFUSIONE"},
+            _numerici_barriera,
+        ),
+        lambda p: calculate_secondary_thickness(p)[:4], _calcolo_array(USCITE_SECONDARIA),
+    ),
+    CasoBenchmark(
+        "calculate_special_secondary_thickness[RAMO 2]", USCITE_SECONDARIA,
+        _genera_params({**DIAGNOSTICA_RAMO_2, 'tipo_barriera': "SECONDARIA"}, _numerici_barriera),
+        lambda p: calculate_special_secondary_thickness(p)[:4], _calcolo_array(USCITE_SECONDARIA),
+    ),
+    CasoBenchmark(
+        "calculate_tc_thickness[RAMO 3]", USCITE_SPESSORE,
+        _genera_params({**TC_RAMO_3, 'tipo_barriera': "SECONDARIA"}, _numerici_tc),
+        lambda p: calculate_tc_thickness(p)[:2], _calcolo_array(USCITE_SPESSORE),
+    ),
+    _caso_calcolo("RAMO 1, PRIMARIA", {**DIAGNOSTICA_RAMO_1, 'tipo_barriera': "PRIMARIA"}, _numerici_barriera, USCITE_SPESSORE),
+    _caso_calcolo("RAMO 1, SECONDARIA", {**DIAGNOSTICA_RAMO_1, 'tipo_barriera': "SECONDARIA"}, _numerici_barriera, USCITE_SECONDARIA),
+    _caso_calcolo("RAMO 2, PRIMARIA", {**DIAGNOSTICA_RAMO_2, 'tipo_barriera': "PRIMARIA"}, _numerici_barriera, USCITE_SPESSORE),
+    _caso_calcolo("RAMO 2, SECONDARIA", {**DIAGNOSTICA_RAMO_2, 'tipo_barriera': "SECONDARIA"}, _numerici_barriera, USCITE_SECONDARIA),
+    _caso_calcolo("RAMO 3, PRIMARIA", {**TC_RAMO_3, 'tipo_barriera': "PRIMARIA"}, _numerici_tc, USCITE_SPESSORE),
+    _caso_calcolo("RAMO 3, SECONDARIA", {**TC_RAMO_3, 'tipo_barriera': "SECONDARIA"}, _numerici_tc, USCITE_SPESSORE),
+    CasoBenchmark(
+        "run_shielding_calculation[tutti i rami] / calculate_batch_chunk", USCITE_SPESSORE, _genera_mista,
+        _calcolo_scalare(USCITE_SPESSORE), _batch_mista,
+    ),
+    CasoBenchmark(
+        "calcola_schermatura[tutti i rami] / calculate_batch_chunk", USCITE_SPESSORE, _genera_mista,
+        _record_scalare, _batch_mista,
+    ),
+]
@@ -0,0 +1,203 @@
+"""
+Esecuzione dei benchmark, verifiche di equivalenza e confronto con la baseline.
+
+    python -m benchmarks [--dimensioni 1 1e3 1e6] [--soglia 0.30] [--casi testo] [--aggiorna-baseline]
+
+Per ogni caso e dimensione misura il throughput (righe/s) dell'implementazione scalare (fino a
+--max-scalare righe: oltre, un ciclo Python richiederebbe minuti) e di quella vettoriale, verifica che le
+due diano gli stessi risultati su un campione di righe e confronta le uscite scalari con i valori di
+riferimento salvati nella baseline. Esce con codice 1 se un throughput scende sotto (1 - soglia) volte la
+baseline o se una verifica numerica fallisce. La baseline dipende dalla macchina: va rigenerata con
+--aggiorna-baseline quando cambia l'ambiente di esecuzione.
+"""
+
+import argparse
+import json
+import platform
+import sys
+import timeit
+from pathlib import Path
+
+import numpy as np
+
+from .casi import CASI_BENCHMARK
+
+
+BASELINE_PATH = Path(__file__).with_name("baseline.json")
+
+SEME_BENCHMARK = 147
+DIMENSIONI_DEFAULT = (1, 1_000, 1_000_000)
+MAX_RIGHE_SCALARE = 1_000
+RIGHE_RIFERIMENTO = 1_000
+
+# Soglia di regressione del throughput (frazione) e tolleranze dell'equivalenza numerica
+SOGLIA_REGRESSIONE = 0.30
+# Nuove misure prima di confermare una regressione (le misure brevi risentono del carico della macchina)
+CONFERME_REGRESSIONE = 2
+RTOL_EQUIVALENZA = 1e-9
+ATOL_EQUIVALENZA_MM = 1e-9
+
+
+def _misura(funzione, ripetizioni):
+    """ Tempo per chiamata (s): minimo su più ripetizioni, ognuna lunga almeno 0.2 s (timeit.autorange). """
+    timer = timeit.Timer(funzione)
+    numero, _ = timer.autorange()
+    return min(timer.repeat(ripetizioni, numero)) / numero
+
+
+def _confronta(attesi, ottenuti, atol=ATOL_EQUIVALENZA_MM):
+    """ (equivalenti, massima differenza assoluta) tra due array di uscite; NaN coincidenti sono uguali. """
+    equivalenti = np.allclose(ottenuti, attesi, rtol=RTOL_EQUIVALENZA, atol=atol, equal_nan=True)
+    with np.errstate(invalid='ignore'):
+        diff = np.abs(ottenuti - attesi)
+    diff = diff[~np.isnan(diff)]
+    return bool(equivalenti), float(diff.max()) if diff.size else 0.0
+
+
+def riferimento_scalare(caso):
+    """ Somme per uscita dei risultati scalari su RIGHE_RIFERIMENTO righe generate con il seme fisso. """
+    ingressi = caso.genera(np.random.default_rng(SEME_BENCHMARK), RIGHE_RIFERIMENTO)
+    uscite = caso.esegui_scalare(caso.righe_scalari(ingressi, range(RIGHE_RIFERIMENTO)))
+    return {'righe': RIGHE_RIFERIMENTO, 'somme': dict(zip(caso.uscite, np.nansum(uscite, axis=0).tolist()))}
+
+
+def esegui_caso(caso, dimensioni, max_scalare, ripetizioni, campione):
+    """
+    Misura un caso alle dimensioni indicate. Restituisce {'scalare': {n: righe/s}, 'vettoriale': {n: righe/s},
+    'equivalenza': {n: (equivalenti, differenza massima)}}.
+    """
+    esito = {'scalare': {}, 'vettoriale': {}, 'equivalenza': {}}
+    for n in dimensioni:
+        rng = np.random.default_rng(SEME_BENCHMARK)
+        ingressi = caso.genera(rng, n)
+
+        # Vettoriale: tutte le n righe
+        vettoriali = caso.esegui_vettoriale(ingressi)
+        esito['vettoriale'][n] = n / _misura(lambda: caso.esegui_vettoriale(ingressi), ripetizioni)
+
+        # Scalare: tutte le righe fino a max_scalare (misura del throughput)
+        if n <= max_scalare:
+            argomenti = caso.righe_scalari(ingressi, range(n))
+            esito['scalare'][n] = n / _misura(lambda: caso.esegui_scalare(argomenti), ripetizioni)
+
+        # Equivalenza vettoriale/scalare su tutte le righe o su un campione
+        righe = np.arange(n) if n <= campione else np.sort(rng.choice(n, campione, replace=False))
+        scalari = caso.esegui_scalare(caso.righe_scalari(ingressi, righe))
+        esito['equivalenza'][n] = _confronta(scalari, vettoriali[righe], caso.tolleranza_mm or ATOL_EQUIVALENZA_MM)
+    return esito
+
+
+def rimisura(caso, impl, n, ripetizioni):
+    """ Nuova misura del throughput (righe/s) di una sola implementazione, per confermare una regressione. """
+    ingressi = caso.genera(np.random.default_rng(SEME_BENCHMARK), n)
+    if impl == 'scalare':
+        argomenti = caso.righe_scalari(ingressi, range(n))
+        return n / _misura(lambda: caso.esegui_scalare(argomenti), ripetizioni)
+    return n / _misura(lambda: caso.esegui_vettoriale(ingressi), ripetizioni)
+
+
+def _leggi_baseline(percorso):
+    if not percorso.exists():
+        return {'prestazioni': {}, 'riferimento': {}}
+    with open(percorso, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _scrivi_baseline(percorso, baseline):
+    baseline['ambiente'] = {
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'macchina': platform.machine(),
+        'processore': platform.processor() or platform.machine(),
+    }
+    with open(percorso, "w", encoding="utf-8") as f:
+        json.dump(baseline, f, indent=2, ensure_ascii=False)
+        f.write("\n")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks",
+        description="Benchmark dei percorsi di calcolo con soglie di regressione e verifiche di equivalenza.",
+    )
+    parser.add_argument(
+        "--dimensioni", nargs="+", type=lambda s: int(float(s)), default=list(DIMENSIONI_DEFAULT),
+        help="numero di righe per misura (default: 1 1e3 1e6)",
+    )
+    parser.add_argument(
+        "--max-scalare", type=lambda s: int(float(s)), default=MAX_RIGHE_SCALARE,
+        help=f"dimensione massima per la misura scalare (default: {MAX_RIGHE_SCALARE})",
+    )
+    parser.add_argument(
+        "--soglia", type=float, default=SOGLIA_REGRESSIONE,
+        help=f"calo di throughput tollerato rispetto alla baseline (default: {SOGLIA_REGRESSIONE})",
+    )
+    parser.add_argument("--ripetizioni", type=int, default=3, help="ripetizioni per misura (default: 3)")
+    parser.add_argument("--campione", type=int, default=1_000, help="righe per la verifica di equivalenza (default: 1000)")
+    parser.add_argument("--casi", default="", help="esegue solo i casi il cui nome contiene questo testo")
+    parser.add_argument("--baseline", type=Path, default=BASELINE_PATH, help="file JSON della baseline")
+    parser.add_argument(
+        "--aggiorna-baseline", action="store_true",
+        help="salva throughput e valori di riferimento misurati come nuova baseline",
+    )
+    args = parser.parse_args(argv)
+
+    baseline = _leggi_baseline(args.baseline)
+    prestazioni_base = baseline.setdefault('prestazioni', {})
+    riferimento_base = baseline.setdefault('riferimento', {})
+    fallimenti = []
+
+    casi = [c for c in CASI_BENCHMARK if args.casi in c.nome]
+    print(f"{'caso':<62} {'impl.':<10} {'righe':>9} {'righe/s':>12} {'baseline':>12} {'rapp.':>6}  esito")
+    for caso in casi:
+        # Riferimento numerico dell'implementazione scalare
+        riferimento = riferimento_scalare(caso)
+        atteso = riferimento_base.get(caso.nome)
+        if args.aggiorna_baseline:
+            riferimento_base[caso.nome] = riferimento
+        elif atteso is not None:
+            for uscita, somma in riferimento['somme'].items():
+                somma_attesa = atteso['somme'].get(uscita)
+                if somma_attesa is not None and not np.isclose(somma, somma_attesa, rtol=RTOL_EQUIVALENZA, atol=0.0):
+                    fallimenti.append(f"{caso.nome}: somma di '{uscita}' = {somma!r}, attesa {somma_attesa!r}")
+
+        esito = esegui_caso(caso, args.dimensioni, args.max_scalare, args.ripetizioni, args.campione)
+        base_caso = prestazioni_base.setdefault(caso.nome, {}) if args.aggiorna_baseline else prestazioni_base.get(caso.nome, {})
+        for impl in ('scalare', 'vettoriale'):
+            for n, throughput in esito[impl].items():
+                base = base_caso.get(impl, {}).get(str(n))
+                rapporto = throughput / base if base else float('nan')
+                stato = "ok"
+                if args.aggiorna_baseline:
+                    base_caso.setdefault(impl, {})[str(n)] = throughput
+                    stato = "baseline"
+                elif base is None:
+                    stato = "nuovo"
+                elif rapporto < 1 - args.soglia:
+                    for _ in range(CONFERME_REGRESSIONE):
+                        throughput = max(throughput, rimisura(caso, impl, n, args.ripetizioni))
+                        rapporto = throughput / base
+                        if rapporto >= 1 - args.soglia:
+                            break
+                    else:
+                        stato = "REGRESSIONE"
+                        fallimenti.append(f"{caso.nome} ({impl}, {n} righe): {throughput:.4g} righe/s, baseline {base:.4g}")
+                print(
+                    f"{caso.nome:<62} {impl:<10} {n:>9} {throughput:>12.4g} "
+                    f"{(base or float('nan')):>12.4g} {rapporto:>6.2f}  {stato}"
+                )
+
+        for n, (equivalenti, diff) in esito['equivalenza'].items():
+            if not equivalenti:
+                fallimenti.append(f"{caso.nome} ({n} righe): vettoriale diverso dallo scalare (diff. max {diff:.3g})")
+            print(f"{caso.nome:<62} {'equival.':<10} {n:>9} {'diff. max':>12} {diff:>12.3g} {'':>6}  {'ok' if equivalenti else 'DIVERSO'}")
+        sys.stdout.flush()
+
+    if args.aggiorna_baseline:
+        _scrivi_baseline(args.baseline, baseline)
+        print(f"Baseline aggiornata: {args.baseline}")
+
+    if fallimenti:
+        print("\nFALLIMENTI:\n" + "\n".join(f"- {f}" for f in fallimenti))
+        return 1
+    return 0
@@ -0,0 +1,36 @@
+"""
+Motore di calcolo delle schermature NCRP 147, indipendente dall'interfaccia Streamlit.
+
+L'import del pacchetto carica soltanto NumPy: pandas (batch, multi-sorgente, Monte Carlo) e SciPy
+(ottimizzazione, Monte Carlo) sono importati dai rispettivi moduli solo quando questi vengono usati.
+"""
+
+from .analitica import SPESSORE_NON_VALIDO_MM, calcola_spessore_x, calcola_spessore_x_array
+from .calcolo import (
+    CALC_ERROR_MESSAGES,
+    RAMO_LOGICO_LABELS,
+    calcola_schermatura,
+    run_shielding_calculation,
+    run_shielding_calculation_array,
+)
+from .coefficienti import COEFF_STORE
+from .profilo import CONTATORI_RAMI
+from .risultati import RisultatoCalcolo
+from .spessori import SECONDARY_MODELS
+from .spettro import normalizza_spettro_carico
+
+__all__ = [
+    "CALC_ERROR_MESSAGES",
+    "COEFF_STORE",
+    "CONTATORI_RAMI",
+    "RAMO_LOGICO_LABELS",
+    "RisultatoCalcolo",
+    "SECONDARY_MODELS",
+    "SPESSORE_NON_VALIDO_MM",
+    "calcola_schermatura",
+    "calcola_spessore_x",
+    "calcola_spessore_x_array",
+    "normalizza_spettro_carico",
+    "run_shielding_calculation",
+    "run_shielding_calculation_array",
+]
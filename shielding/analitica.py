@@ -0,0 +1,173 @@
+"""
+Funzioni analitiche base: formula di Archer (diretta e inversa), somma di trasmissioni, kerma incidente.
+"""
+
+import math
+
+import numpy as np
+
+
+# Valore sentinella restituito dalla versione scalare quando lo spessore non è calcolabile
+SPESSORE_NON_VALIDO_MM = 999.0
+
+
+def calcola_spessore_x_array(alpha, beta, gamma, B):
+    """
+    Versione vettoriale (NumPy) della formula inversa NCRP 147.
+    Accetta array (o scalari) broadcastabili per alpha, beta, gamma e B.
+    Restituisce (x, valido): x è l'array degli spessori (0.0 dove non valido),
+    valido è la maschera booleana dei casi calcolabili, al posto della sentinella 999.0.
+    """
+    alpha, beta, gamma, B = np.broadcast_arrays(
+        np.asarray(alpha, dtype=float),
+        np.asarray(beta, dtype=float),
+        np.asarray(gamma, dtype=float),
+        np.asarray(B, dtype=float),
+    )
+
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        # Formula: X = (1 / (alpha * gamma)) * ln( [ B^(-gamma) + (beta / alpha) ] / [ 1 + (beta / alpha) ] )
+        beta_su_alpha = beta / alpha
+        numeratore_ln = B ** (-gamma) + beta_su_alpha
+        denominatore_ln = 1 + beta_su_alpha
+
+        valido = (
+            (B > 0) & (alpha != 0) & (gamma != 0)
+            & (denominatore_ln != 0) & (numeratore_ln > 0)
+        )
+        x = (1 / (alpha * gamma)) * np.log(numeratore_ln / denominatore_ln)
+
+    valido &= np.isfinite(x)
+    x = np.where(valido, np.maximum(x, 0.0), 0.0)
+    return x, valido
+
+
+def calcola_spessore_x(alpha, beta, gamma, B):
+    """
+    Calcola lo spessore x richiesto data la trasmittanza B (formula inversa NCRP 147).
+    Versione scalare (math) con la stessa validazione di calcola_spessore_x_array: restituisce 999.0 se non
+    calcolabile, altrimenti max(0, x).
+    """
+    try:
+        alpha, beta, gamma, B = float(alpha), float(beta), float(gamma), float(B)
+        if not B > 0 or alpha == 0 or gamma == 0:
+            return SPESSORE_NON_VALIDO_MM
+
+        # Formula: X = (1 / (alpha * gamma)) * ln( [ B^(-gamma) + (beta / alpha) ] / [ 1 + (beta / alpha) ] )
+        beta_su_alpha = beta / alpha
+        numeratore_ln = B ** (-gamma) + beta_su_alpha
+        denominatore_ln = 1 + beta_su_alpha
+
+        if denominatore_ln == 0 or not numeratore_ln > 0:
+            return SPESSORE_NON_VALIDO_MM
+
+        x = (1 / (alpha * gamma)) * math.log(numeratore_ln / denominatore_ln)
+        if not math.isfinite(x):
+            return SPESSORE_NON_VALIDO_MM
+        return max(0.0, x)
+
+    except Exception:
+        return SPESSORE_NON_VALIDO_MM
+
+
+def calcola_trasmissione_array(alpha, beta, gamma, x):
+    """
+    Trasmissione B(x) di Archer (formula diretta NCRP 147), vettoriale su array broadcastabili.
+    Formula: B = [ (1 + beta/alpha) * exp(alpha*gamma*x) - beta/alpha ]^(-1/gamma)
+    """
+    alpha = np.asarray(alpha, dtype=float)
+    gamma = np.asarray(gamma, dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        beta_su_alpha = np.asarray(beta, dtype=float) / alpha
+        base = (1 + beta_su_alpha) * np.exp(alpha * gamma * np.asarray(x, dtype=float)) - beta_su_alpha
+        return base ** (-1 / gamma)
+
+
+def _log_trasmissione_e_derivata(alpha, beta, gamma, x):
+    """ log B(x) di Archer e la sua derivata d(log B)/dx, vettoriali. """
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        beta_su_alpha = beta / alpha
+        esponenziale = (1 + beta_su_alpha) * np.exp(alpha * gamma * x)
+        base = esponenziale - beta_su_alpha
+        return -np.log(base) / gamma, -alpha * esponenziale / base
+
+
+def risolvi_spessore_somma_array(K, alpha, beta, gamma, x_off, obiettivo, tol_mm=1e-9, max_iter=60):
+    """
+    Risolve, una incognita per riga, lo spessore x tale che
+        somma_j K[:, j] * B_j(x + x_off[:, j]) = obiettivo
+    con B_j trasmissione di Archer (alpha, beta, gamma della colonna j). I termini con K <= 0 sono ignorati.
+    Metodo di Newton su log(somma) protetto da bisezione entro un intervallo garantito:
+    - x_min: nessun termine da solo può superare l'obiettivo;
+    - x_max: ogni termine vale al più obiettivo / (numero di termini).
+    Con un solo termine usa direttamente la formula inversa. Restituisce (x, valido).
+    """
+    K = np.atleast_2d(np.asarray(K, dtype=float))
+    alpha, beta, gamma, x_off = (np.broadcast_to(np.asarray(a, dtype=float), K.shape) for a in (alpha, beta, gamma, x_off))
+    obiettivo = np.broadcast_to(np.asarray(obiettivo, dtype=float), K.shape[:1])
+
+    attivi = K > 0
+    n_attivi = attivi.sum(axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        x_min_j, ok_min = calcola_spessore_x_array(alpha, beta, gamma, obiettivo[:, None] / K)
+        x_max_j, ok_max = calcola_spessore_x_array(alpha, beta, gamma, obiettivo[:, None] / (n_attivi[:, None] * K))
+
+    valido = (obiettivo > 0) & np.all(~attivi | (ok_min & ok_max), axis=1)
+    x_min = np.maximum(0.0, np.where(attivi, x_min_j - x_off, -np.inf).max(axis=1, initial=0.0))
+    x_max = np.maximum(0.0, np.where(attivi, x_max_j - x_off, -np.inf).max(axis=1, initial=0.0))
+    x = x_min.copy()
+
+    log_obiettivo = np.log(np.where(obiettivo > 0, obiettivo, 1.0))
+    attivo = valido & (n_attivi > 1) & (x_max - x_min > tol_mm)
+    for _ in range(max_iter):
+        if not attivo.any():
+            break
+        righe = np.flatnonzero(attivo)
+        xr = x[righe]
+        log_B, d_log_B = _log_trasmissione_e_derivata(alpha[righe], beta[righe], gamma[righe], xr[:, None] + x_off[righe])
+        termini = np.where(attivi[righe], K[righe] * np.exp(log_B), 0.0)
+        somma = termini.sum(axis=1)
+        g = np.log(somma) - log_obiettivo[righe]
+        dg = (termini * d_log_B).sum(axis=1) / somma
+
+        # Aggiorna l'intervallo (g decrescente in x) e applica il passo di Newton, o la bisezione se esce dall'intervallo
+        lo = np.where(g > 0, xr, x_min[righe])
+        hi = np.where(g > 0, x_max[righe], xr)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            x_newton = xr - g / dg
+        fuori = ~np.isfinite(x_newton) | (x_newton <= lo) | (x_newton >= hi)
+        x_nuovo = np.where(fuori, 0.5 * (lo + hi), x_newton)
+
+        x[righe], x_min[righe], x_max[righe] = x_nuovo, lo, hi
+        attivo[righe] = (np.abs(x_nuovo - xr) > tol_mm) & (hi - lo > tol_mm)
+
+    # Un solo termine: soluzione esatta con la formula inversa
+    singolo = valido & (n_attivi == 1)
+    x = np.where(singolo, x_min, x)
+    return np.where(valido, x, 0.0), valido
+
+
+def calcola_kerma_incidente(K_val, U, N, d):
+    """
+    Calcola il kerma in aria non schermato alla distanza d per unità di tempo.
+    Formula: kerma_non_schermato = K_val * U * N / d^2 
+    """
+    try:
+        if d <= 0: return 0.0
+        # $K_{incidente}$ (mGy/settimana)
+        # $K_{tu} = (K_{val} \cdot U \cdot N) / d^2$
+        kerma = (K_val * U * N) / (d ** 2)
+        return kerma
+    except Exception:
+        return 0.0
+
+
+def calcola_kerma_incidente_array(K_val, U, N, d):
+    """
+    Versione vettoriale di calcola_kerma_incidente (array broadcastabili).
+    Restituisce 0.0 dove d <= 0, come la versione scalare.
+    """
+    d = np.asarray(d, dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        kerma = (np.asarray(K_val, dtype=float) * U * N) / (d ** 2)
+    return np.where(d > 0, kerma, 0.0)
@@ -0,0 +1,237 @@
+"""
+Archivio di progetto colonnare (Parquet, partizionato per impianto e stanza) di ingressi, valori intermedi
+(K_tu, B, Xref) e risultati di ogni barriera calcolata, con storico delle registrazioni.
+
+    <percorso>/impianto=<impianto>/stanza=<stanza>/<calcolo_id>-<blocco>-<n>.parquet
+
+Ogni registrazione aggiunge nuovi file (i file esistenti non vengono riscritti, salvo compatta()).
+Le letture usano pyarrow.dataset su file mappati in memoria, con potatura delle partizioni e filtri
+applicati ai row group: uno storico di milioni di righe si filtra per impianto/stanza senza caricarlo.
+Richiede il pacchetto opzionale 'pyarrow'.
+"""
+
+import datetime
+import os
+import uuid
+
+from .batch import (
+    BATCH_BARRIER_COLUMN,
+    BATCH_CHUNK_SIZE,
+    BATCH_COLUMN_DEFAULTS,
+    BATCH_FACILITY_COLUMN,
+    BATCH_ROOM_COLUMN,
+    iter_barrier_table,
+    tabella_ingressi_risultati,
+)
+from .cache_persistente import versione_coefficienti
+
+
+# Variabile d'ambiente con il percorso dell'archivio e percorso di default
+ARCHIVIO_PATH_ENV = "SHIELDING_ARCHIVIO"
+ARCHIVIO_DEFAULT_PATH = os.path.join(os.path.expanduser("~"), ".local", "share", "shielding-app", "archivio")
+
+# Colonne di partizione (cartelle Hive) e valore usato per impianto/stanza vuoti
+ARCHIVIO_PARTIZIONI = (BATCH_FACILITY_COLUMN, BATCH_ROOM_COLUMN)
+ARCHIVIO_PARTIZIONE_VUOTA = "N/D"
+
+# Colonne dei risultati (calculate_batch_chunk) con il tipo: 'f' float64, 'b' booleano, 's' stringa
+ARCHIVIO_COLONNE_RISULTATI = {
+    'ramo_logico': 's',
+    'spessore_finale_mm': 'f',
+    'kerma_non_schermato': 'f',
+    'trasmittanza_B': 'f',
+    'Xref_mm': 'f',
+    'spessore_valido': 'b',
+    'X_fuga_mm': 'f',
+    'X_diffusione_mm': 'f',
+    'K1sec_head_mGy_paz': 'f',
+    'K1sec_body_mGy_paz': 'f',
+    'errore': 's',
+}
+
+# Righe per row group dei file Parquet (granularità dei filtri in lettura)
+ARCHIVIO_RIGHE_ROW_GROUP = 128 * 1024
+
+
+def _importa_pyarrow():
+    try:
+        import pyarrow as pa
+        import pyarrow.compute as pc
+        import pyarrow.dataset as ds
+        import pyarrow.fs as pafs
+    except ImportError as exc:
+        raise ImportError("L'archivio di progetto richiede il pacchetto 'pyarrow'.") from exc
+    return pa, pc, ds, pafs
+
+
+def schema_archivio():
+    """
+    Schema Arrow fisso dell'archivio (partizioni incluse): colonne identificative, ingressi di calcolo
+    (BATCH_COLUMN_DEFAULTS), risultati e metadati della registrazione (calcolo_id, registrato_il UTC,
+    versione dei coefficienti). Le altre colonne della tabella delle barriere non sono archiviate.
+    """
+    pa = _importa_pyarrow()[0]
+    tipi = {'f': pa.float64(), 'b': pa.bool_(), 's': pa.string()}
+    campi = [pa.field(col, pa.string()) for col in (*ARCHIVIO_PARTIZIONI, BATCH_BARRIER_COLUMN)]
+    campi += [
+        pa.field(col, pa.string() if isinstance(default, str) else pa.float64())
+        for col, default in BATCH_COLUMN_DEFAULTS.items()
+    ]
+    campi += [pa.field(col, tipi[tipo]) for col, tipo in ARCHIVIO_COLONNE_RISULTATI.items()]
+    campi += [
+        pa.field('calcolo_id', pa.string()),
+        pa.field('registrato_il', pa.timestamp('ms', tz='UTC')),
+        pa.field('versione_coefficienti', pa.string()),
+    ]
+    return pa.schema(campi)
+
+
+class ArchivioProgetto:
+    """
+    Archivio di un progetto (cartella): registra() calcola e aggiunge una tabella di barriere, leggi()
+    restituisce lo storico filtrato; dataset() espone il pyarrow.dataset per interrogazioni dirette.
+    """
+
+    def __init__(self, percorso=None):
+        self.pa, self.pc, self.ds, pafs = _importa_pyarrow()
+        self.percorso = os.path.abspath(percorso or os.environ.get(ARCHIVIO_PATH_ENV) or ARCHIVIO_DEFAULT_PATH)
+        os.makedirs(self.percorso, exist_ok=True)
+        self.schema = schema_archivio()
+        self._partizionamento = self.ds.partitioning(
+            self.pa.schema([self.schema.field(col) for col in ARCHIVIO_PARTIZIONI]), flavor='hive',
+        )
+        self._filesystem = pafs.LocalFileSystem(use_mmap=True)
+
+    def _tabella_arrow(self, blocco, calcolo_id, registrato_il):
+        """ Blocco di tabella_ingressi_risultati convertito nello schema dell'archivio. """
+        blocco = blocco.assign(
+            calcolo_id=calcolo_id, registrato_il=registrato_il, versione_coefficienti=versione_coefficienti(),
+        )
+        for col in ARCHIVIO_PARTIZIONI:
+            blocco[col] = blocco[col].mask(blocco[col] == "", ARCHIVIO_PARTIZIONE_VUOTA)
+        colonne = []
+        for campo in self.schema:
+            serie = blocco[campo.name]
+            if self.pa.types.is_string(campo.type):
+                serie = serie.astype(object).where(serie.notna(), None).map(lambda v: v if v is None else str(v))
+            colonne.append(self.pa.array(serie, type=campo.type, from_pandas=True))
+        return self.pa.Table.from_arrays(colonne, schema=self.schema)
+
+    def registra(self, source, chunk_size=BATCH_CHUNK_SIZE, calcolo_id=None):
+        """
+        Calcola la tabella delle barriere (DataFrame/CSV/Parquet, a blocchi) e la aggiunge all'archivio come
+        una registrazione: nuovi file per le partizioni toccate, senza riscrivere quelli esistenti.
+        Restituisce (calcolo_id, numero di barriere).
+        """
+        calcolo_id = calcolo_id or uuid.uuid4().hex
+        adesso = datetime.datetime.now(datetime.timezone.utc)
+        registrato_il = adesso.replace(microsecond=adesso.microsecond // 1000 * 1000)
+        n_righe = 0
+        for n_blocco, chunk in enumerate(iter_barrier_table(source, chunk_size)):
+            tabella = self._tabella_arrow(tabella_ingressi_risultati(chunk, n_righe), calcolo_id, registrato_il)
+            self.ds.write_dataset(
+                tabella, self.percorso, format='parquet', partitioning=self._partizionamento,
+                basename_template=f"{calcolo_id}-{n_blocco}-{{i}}.parquet",
+                existing_data_behavior='overwrite_or_ignore',
+                max_rows_per_group=ARCHIVIO_RIGHE_ROW_GROUP,
+            )
+            n_righe += len(chunk)
+        return calcolo_id, n_righe
+
+    def dataset(self):
+        """ pyarrow.dataset.Dataset dell'archivio (file mappati in memoria, schema fisso). """
+        return self.ds.dataset(
+            self.percorso, schema=self.schema, format='parquet',
+            partitioning=self._partizionamento, filesystem=self._filesystem,
+        )
+
+    def filtro(self, impianto=None, stanza=None, calcolo_id=None, dal=None, al=None):
+        """
+        Espressione pyarrow per impianto, stanza, registrazione (valore o lista) e intervallo [dal, al) di
+        registrato_il; None se non ci sono condizioni.
+        """
+        campo = self.ds.field
+        condizioni = []
+        for col, valore in ((BATCH_FACILITY_COLUMN, impianto), (BATCH_ROOM_COLUMN, stanza), ('calcolo_id', calcolo_id)):
+            if valore is not None:
+                valori = [valore] if isinstance(valore, str) else list(valore)
+                if col in ARCHIVIO_PARTIZIONI:
+                    valori = [v or ARCHIVIO_PARTIZIONE_VUOTA for v in valori]
+                condizioni.append(campo(col).isin(valori))
+        tipo_tempo = self.schema.field('registrato_il').type
+        if dal is not None:
+            condizioni.append(campo('registrato_il') >= self.pa.scalar(_utc(dal), type=tipo_tempo))
+        if al is not None:
+            condizioni.append(campo('registrato_il') < self.pa.scalar(_utc(al), type=tipo_tempo))
+        espressione = None
+        for condizione in condizioni:
+            espressione = condizione if espressione is None else espressione & condizione
+        return espressione
+
+    def leggi(self, impianto=None, stanza=None, calcolo_id=None, dal=None, al=None, colonne=None, ultimo=False):
+        """
+        Storico come DataFrame, filtrato per impianto/stanza (valore o lista), registrazione e intervallo
+        di date; colonne limita le colonne lette. Con ultimo=True restituisce per ogni barriera (impianto,
+        stanza, barriera) solo la registrazione più recente.
+        """
+        filtro = self.filtro(impianto, stanza, calcolo_id, dal, al)
+        chiavi = [*ARCHIVIO_PARTIZIONI, BATCH_BARRIER_COLUMN]
+        da_leggere = None if colonne is None else list(dict.fromkeys([*colonne, *(chiavi + ['registrato_il'] if ultimo else [])]))
+        tabella = self.dataset().to_table(columns=da_leggere, filter=filtro)
+        if ultimo and tabella.num_rows:
+            ordine = self.pc.sort_indices(tabella, [(col, 'ascending') for col in chiavi] + [('registrato_il', 'descending')])
+            tabella = tabella.take(ordine)
+            chiave = self.pc.binary_join_element_wise(*[tabella[col] for col in chiavi], "\x1f")
+            primo = self.pc.not_equal(chiave.slice(1), chiave.slice(0, len(chiave) - 1))
+            maschera = self.pa.concat_arrays([self.pa.array([True]), primo.combine_chunks()])
+            tabella = tabella.filter(maschera)
+            if colonne is not None:
+                tabella = tabella.select(list(colonne))
+        return tabella.to_pandas()
+
+    def partizioni(self):
+        """ Righe archiviate per impianto e stanza (DataFrame), dai soli metadati dei file Parquet. """
+        import pandas as pd
+
+        conteggi = {}
+        for frammento in self.dataset().get_fragments():
+            chiave = tuple(self.ds.get_partition_keys(frammento.partition_expression).get(col) for col in ARCHIVIO_PARTIZIONI)
+            conteggi[chiave] = conteggi.get(chiave, 0) + frammento.metadata.num_rows
+        return pd.DataFrame(
+            [(*chiave, righe) for chiave, righe in sorted(conteggi.items())],
+            columns=[*ARCHIVIO_PARTIZIONI, 'righe'],
+        )
+
+    def compatta(self, min_file=8):
+        """
+        Riscrive in un solo file le partizioni con almeno min_file file (molte piccole registrazioni).
+        Da eseguire senza registrazioni concorrenti. Restituisce il numero di partizioni compattate.
+        """
+        import pyarrow.parquet as pq
+
+        schema_file = self.pa.schema([campo for campo in self.schema if campo.name not in ARCHIVIO_PARTIZIONI])
+        partizioni = {}
+        for frammento in self.dataset().get_fragments():
+            partizioni.setdefault(os.path.dirname(frammento.path), []).append(frammento)
+        compattate = 0
+        for cartella, frammenti in partizioni.items():
+            if len(frammenti) < min_file:
+                continue
+            tabella = self.pa.concat_tables([frammento.to_table(schema=schema_file) for frammento in frammenti])
+            tabella = tabella.sort_by('registrato_il')
+            nome = os.path.join(cartella, f"compattato-{uuid.uuid4().hex}.parquet")
+            pq.write_table(tabella, nome + ".tmp", row_group_size=ARCHIVIO_RIGHE_ROW_GROUP)
+            os.replace(nome + ".tmp", nome)
+            for frammento in frammenti:
+                os.remove(frammento.path)
+            compattate += 1
+        return compattate
+
+
+def _utc(istante):
+    """ datetime (naive = UTC) o stringa ISO 8601 come datetime UTC. """
+    if isinstance(istante, str):
+        istante = datetime.datetime.fromisoformat(istante)
+    if istante.tzinfo is None:
+        istante = istante.replace(tzinfo=datetime.timezone.utc)
+    return istante.astimezone(datetime.timezone.utc)
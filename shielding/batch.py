@@ -0,0 +1,419 @@
+"""
+Motore batch (impianto / facility): tabelle di barriere CSV/Parquet elaborate a blocchi.
+"""
+
+import io
+import time
+
+import numpy as np
+import pandas as pd
+
+from .analitica import calcola_kerma_incidente_array
+from .cache_persistente import cache_persistente
+from .calcolo import CALC_ERROR_MESSAGES, RAMO_LOGICO_LABELS
+from .coefficienti import COEFF_STORE
+from .dati import DLP_TC_FIXED_VALUES
+from .profilo import CONTATORI_RAMI
+from .spessori import (
+    SECONDARY_MODELS,
+    calcola_componenti_secondaria_array,
+    calcola_kerma_tc_array,
+    calcola_spessore_barriera_array,
+    calcola_spessore_tc_array,
+)
+
+
+# Colonne della tabella barriere (stesse chiavi del dizionario params) con i default di run_shielding_calculation
+BATCH_COLUMN_DEFAULTS = {
+    'tipo_immagine': "",
+    'modalita_radiografia': "",
+    'tipo_barriera': "",
+    'materiale_schermatura': "",
+    'P_mSv_wk': 0.0,
+    'tasso_occupazione_T': 1.0,
+    'distanza_d': 2.0,
+    'fattore_uso_U': 0.25,
+    'pazienti_settimana_N': 100,
+    'X_PRE_mm': 0.0,
+    'weekly_n_head': 0,
+    'weekly_n_body': 0,
+    'contrast_factor': 1.0,
+    'dlp_head_mGy_cm': DLP_TC_FIXED_VALUES["HEAD"],
+    'dlp_body_mGy_cm': DLP_TC_FIXED_VALUES["BODY"],
+    'kvp_tc': "",
+    'modello_secondario': SECONDARY_MODELS[0],
+}
+
+# Nomi brevi accettati nelle intestazioni CSV/Parquet
+BATCH_COLUMN_ALIASES = {
+    'materiale': 'materiale_schermatura',
+    'P': 'P_mSv_wk',
+    'T': 'tasso_occupazione_T',
+    'd': 'distanza_d',
+    'U': 'fattore_uso_U',
+    'N': 'pazienti_settimana_N',
+    'Xpre': 'X_PRE_mm',
+    'N_head': 'weekly_n_head',
+    'N_body': 'weekly_n_body',
+    'Kc': 'contrast_factor',
+    'DLP_head': 'dlp_head_mGy_cm',
+    'DLP_body': 'dlp_body_mGy_cm',
+    'kvp': 'kvp_tc',
+}
+
+# Colonne identificative facoltative (non usate dal calcolo); senza 'barriera' si usa il numero di riga
+BATCH_FACILITY_COLUMN = 'impianto'
+BATCH_ROOM_COLUMN = 'stanza'
+BATCH_BARRIER_COLUMN = 'barriera'
+
+BATCH_CHUNK_SIZE = 200_000
+
+# Categorie delle colonne categoriche dei risultati (codici nella cache persistente)
+_CATEGORIE_RISULTATI = {'ramo_logico': RAMO_LOGICO_LABELS, 'errore': CALC_ERROR_MESSAGES[1:]}
+
+
+def _normalizza_tabella_barriere(df):
+    """ Applica gli alias di colonna e i valori di default (colonne assenti o celle vuote). """
+    df = df.rename(columns=BATCH_COLUMN_ALIASES)
+    for col, default in BATCH_COLUMN_DEFAULTS.items():
+        if col not in df.columns:
+            df[col] = default
+        elif df[col].hasnans:
+            df[col] = df[col].fillna(default)
+    return df
+
+
+def _codifica_risultati(risultati):
+    """ Risultati di un blocco in formato .npz (colonne categoriche come codici), per la cache persistente. """
+    buffer = io.BytesIO()
+    np.savez(buffer, **{
+        col: risultati[col].cat.codes.to_numpy() if col in _CATEGORIE_RISULTATI else risultati[col].to_numpy()
+        for col in risultati.columns
+    })
+    return buffer.getvalue()
+
+
+def _decodifica_risultati(valore, indice):
+    with np.load(io.BytesIO(valore), allow_pickle=False) as colonne:
+        return pd.DataFrame({
+            col: pd.Categorical.from_codes(colonne[col], categories=_CATEGORIE_RISULTATI[col])
+            if col in _CATEGORIE_RISULTATI else colonne[col]
+            for col in colonne.files
+        }, index=indice)
+
+
+def _impronta_colonne(df, colonne):
+    """
+    Parti in byte che identificano il contenuto delle colonne (chiave della cache persistente): i byte delle
+    colonne numeriche, codici e valori distinti (repr) delle altre. Più rapido di pd.util.hash_pandas_object.
+    """
+    for col in colonne:
+        serie = df[col]
+        yield col.encode()
+        if serie.dtype.kind in 'biuf':
+            yield serie.dtype.str.encode()
+            yield np.ascontiguousarray(serie.to_numpy()).tobytes()
+        else:
+            codici, valori = pd.factorize(serie)
+            yield codici.astype(np.int64, copy=False).tobytes()
+            yield "\x1f".join(map(repr, valori)).encode()
+
+
+def calculate_batch_chunk(df, coefficienti=None):
+    """
+    Esegue run_shielding_calculation in forma vettoriale su un DataFrame di barriere (una riga per barriera).
+    Le righe sono raggruppate per ramo (RAMO 1/2/3) e tipo di barriera; ogni gruppo è valutato con un'unica
+    operazione NumPy. Restituisce un DataFrame di risultati con lo stesso indice di df.
+    Con la cache persistente attiva il blocco è cercato per contenuto (colonne di calcolo, indice escluso).
+    coefficienti (CoefficientStore) sostituisce COEFF_STORE, ad esempio con dati NCRP 147 modificati:
+    in tal caso la cache persistente non è usata.
+    """
+    df = _normalizza_tabella_barriere(df)
+    if coefficienti is not None and coefficienti is not COEFF_STORE:
+        return _calcola_blocco(df, coefficienti)
+    cache = cache_persistente()
+    if cache is None:
+        return _calcola_blocco(df)
+
+    chiave = cache.chiave(b'B', *_impronta_colonne(df, BATCH_COLUMN_DEFAULTS))
+    return cache.ottieni(
+        chiave, lambda: _calcola_blocco(df), _codifica_risultati, lambda v: _decodifica_risultati(v, df.index)
+    )
+
+
+def _rami_componenti(df, cod_mod, cod_mat, cod_kvp, coefficienti=COEFF_STORE, strato_barriera=None):
+    """
+    Ramo logico, codici di errore e componenti di kerma di una tabella di barriere già normalizzata (stessa
+    precedenza di run_shielding_calculation), comuni al batch, alla verifica e alle barriere composte.
+    cod_mod e cod_kvp sono gli ID per barriera; cod_mat per riga dei coefficienti: una per barriera oppure,
+    con strato_barriera (indice della barriera di ogni strato), una per strato.
+    Restituisce (ramo, errore, kerma, att, componenti):
+      - ramo e errore (codici 1-7, 0 = nessun errore) per barriera;
+      - kerma[n, 2]: kerma non schermato per componente [combinato o Fuga, Diffusione] (TC: K_tu);
+      - att[m, 2, 3]: coefficienti di Archer per componente (fit TC, Primario o Secondario; Diffusione con
+        il fit Primario), per barriera o per strato;
+      - componenti[n, 2]: componenti da calcolare, False per le barriere con errore o non richieste
+        (Primaria TC, Primaria del Ramo 2 senza Kp1).
+    """
+    n = len(df)
+    diagnostica = (df['tipo_immagine'] == "RADIOLOGIA DIAGNOSTICA").to_numpy(dtype=bool)
+    tc = (df['tipo_immagine'] == "TC").to_numpy(dtype=bool)
+    primaria = (df['tipo_barriera'] == "PRIMARIA").to_numpy(dtype=bool)
+    secondaria = (df['tipo_barriera'] == "SECONDARIA").to_numpy(dtype=bool)
+    modello = df['modello_secondario']
+    N = df['pazienti_settimana_N'].to_numpy(dtype=float)
+    d = df['distanza_d'].to_numpy(dtype=float)
+
+    # --- Assegnazione del ramo logico ed errori di combinazione ---
+    ramo = np.where(diagnostica, coefficienti.ramo[cod_mod], 0).astype(np.int8)
+    ramo[(ramo == 0) & tc] = 3
+    diag = (ramo == 1) | (ramo == 2)
+    tc = ramo == 3
+    fuga_diffusione = diag & secondaria & (modello == "FUGA+DIFFUSIONE").to_numpy(dtype=bool)
+
+    errore = np.zeros(n, dtype=np.int8)
+    errore[ramo == 0] = 1
+    for r in (1, 2, 3):
+        errore[(ramo == r) & ~primaria & ~secondaria] = r + 1
+    # Primaria senza Kp1: errore nel Ramo 1, calcolo omesso nel Ramo 2; Primaria TC non richiesta
+    senza_kp1 = diag & primaria & np.isnan(coefficienti.Kp1[cod_mod])
+    errore[senza_kp1 & (ramo == 1)] = 5
+
+    # --- Kerma non schermato per componente: Primaria (Kp1, U), Secondaria (Ksec1, U=1), TC ---
+    K1 = np.stack([
+        np.where(
+            primaria, coefficienti.Kp1[cod_mod],
+            np.where(fuga_diffusione, coefficienti.Ksec1_LeakSide[cod_mod], coefficienti.Ksec1_Comb[cod_mod]),
+        ),
+        np.where(fuga_diffusione, coefficienti.Ksec1_ForBack[cod_mod], 0.0),
+    ], axis=1)
+    U = np.where(primaria, df['fattore_uso_U'].to_numpy(dtype=float), 1.0)
+    kerma = calcola_kerma_incidente_array(K1, U[:, None], N[:, None], d[:, None])
+    if tc.any():
+        kerma[tc, 0] = calcola_kerma_tc_array(
+            d[tc],
+            df['weekly_n_head'].to_numpy(dtype=float)[tc],
+            df['weekly_n_body'].to_numpy(dtype=float)[tc],
+            df['contrast_factor'].to_numpy(dtype=float)[tc],
+            df['dlp_head_mGy_cm'].to_numpy(dtype=float)[tc],
+            df['dlp_body_mGy_cm'].to_numpy(dtype=float)[tc],
+        )[0]
+
+    # --- Coefficienti per componente (per barriera o per strato) ---
+    w = np.arange(n) if strato_barriera is None else strato_barriera
+    att_primaria = coefficienti.att_primaria[cod_mod[w], cod_mat]
+    att = np.empty((len(w), 2, 3))
+    att[:, 0] = np.where(
+        tc[w, None], coefficienti.att_tc[cod_mat, cod_kvp[w]],
+        np.where(primaria[w, None], att_primaria, coefficienti.att_secondaria[cod_mod[w], cod_mat]),
+    )
+    att[:, 1] = att_primaria
+
+    # Coefficienti mancanti (fit o Ksec1/Kp1) per una componente calcolata: errore 6; poi modello secondario
+    calcolata = (errore == 0) & ~senza_kp1 & ~(tc & primaria)
+    componenti = np.stack([calcolata, calcolata & fuga_diffusione], axis=1)
+    mancanti = np.bincount(w, weights=(np.isnan(att).any(axis=2) & componenti[w]).any(axis=1), minlength=n) > 0
+    mancanti |= (np.isnan(K1) & componenti & ~tc[:, None]).any(axis=1)
+    errore[mancanti] = 6
+    errore[(errore == 0) & diag & secondaria & ~fuga_diffusione & (modello != "COMBINATO").to_numpy(dtype=bool)] = 7
+    componenti &= (errore == 0)[:, None]
+    return ramo, errore, kerma, att, componenti
+
+
+def _calcola_blocco(df, coefficienti=COEFF_STORE):
+    """ Corpo di calculate_batch_chunk su una tabella già normalizzata. """
+    n = len(df)
+    cod_mod = coefficienti.ids_modalita(df['modalita_radiografia'])
+    cod_mat = coefficienti.ids_materiale(df['materiale_schermatura'])
+    cod_kvp = coefficienti.ids_kvp(df['kvp_tc'])
+
+    P = df['P_mSv_wk'].to_numpy(dtype=float)
+    T = df['tasso_occupazione_T'].to_numpy(dtype=float)
+    d = df['distanza_d'].to_numpy(dtype=float)
+    Xpre = df['X_PRE_mm'].to_numpy(dtype=float)
+
+    profila = CONTATORI_RAMI.attivi
+    inizio = time.perf_counter() if profila else 0.0
+    ramo, errore, kerma, att, componenti = _rami_componenti(df, cod_mod, cod_mat, cod_kvp, coefficienti)
+    diag = (ramo == 1) | (ramo == 2)
+    secondaria = (df['tipo_barriera'] == "SECONDARIA").to_numpy(dtype=bool)
+
+    spessore = np.zeros(n)
+    kerma_out = np.zeros(n)
+    B_out = np.full(n, np.nan)
+    Xref_out = np.zeros(n)
+    valido_out = np.ones(n, dtype=bool)
+    K1sec_head = np.full(n, np.nan)
+    K1sec_body = np.full(n, np.nan)
+    X_fuga = np.full(n, np.nan)
+    X_diffusione = np.full(n, np.nan)
+
+    # --- RAMO 1/2: Primaria e Secondaria a fascio combinato valutate insieme ---
+    idx = np.flatnonzero(componenti[:, 0] & ~componenti[:, 1] & diag)
+    if len(idx):
+        X, K, B, Xref, valido = calcola_spessore_barriera_array(
+            kerma[idx, 0], P[idx], T[idx], Xpre[idx], att[idx, 0, 0], att[idx, 0, 1], att[idx, 0, 2]
+        )
+        spessore[idx], kerma_out[idx], B_out[idx], Xref_out[idx], valido_out[idx] = X, K, B, Xref, valido
+
+    # Secondaria: componenti Fuga/Diffusione e, se richiesto, soluzione a due componenti
+    idx = np.flatnonzero(componenti[:, 0] & diag & secondaria)
+    if len(idx):
+        N = df['pazienti_settimana_N'].to_numpy(dtype=float)[idx]
+        kerma_L = calcola_kerma_incidente_array(coefficienti.Ksec1_LeakSide[cod_mod[idx]], 1.0, N, d[idx])
+        kerma_S = calcola_kerma_incidente_array(coefficienti.Ksec1_ForBack[cod_mod[idx]], 1.0, N, d[idx])
+        X_L, X_S, X_LS, valido_LS = calcola_componenti_secondaria_array(
+            kerma_L, kerma_S, P[idx], T[idx], Xpre[idx], att[idx, 0], att[idx, 1],
+        )
+        X_fuga[idx], X_diffusione[idx] = X_L, X_S
+        due_componenti = componenti[idx, 1]
+        idx, K = idx[due_componenti], (kerma_L + kerma_S)[due_componenti]
+        X_LS, valido_LS = X_LS[due_componenti], valido_LS[due_componenti]
+        nullo = (K * T[idx] == 0) | (P[idx] == 0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            B = np.where(nullo, np.nan, P[idx] / (K * T[idx]))
+        K = np.where(nullo, 0.0, K)
+        spessore[idx], kerma_out[idx], B_out[idx], Xref_out[idx], valido_out[idx] = X_LS, K, B, X_LS + Xpre[idx], valido_LS
+
+    if profila:
+        CONTATORI_RAMI.registra("batch - RAMO 1/2", time.perf_counter() - inizio, int(diag.sum()))
+        inizio = time.perf_counter()
+
+    # --- RAMO 3: TC Secondaria (la Primaria TC non è richiesta: spessore 0.0) ---
+    idx = np.flatnonzero(componenti[:, 0] & (ramo == 3))
+    if len(idx):
+        X, K_tu, B, Xref, valido, K1h, K1b = calcola_spessore_tc_array(
+            P[idx], T[idx], d[idx], Xpre[idx],
+            df['weekly_n_head'].to_numpy(dtype=float)[idx],
+            df['weekly_n_body'].to_numpy(dtype=float)[idx],
+            df['contrast_factor'].to_numpy(dtype=float)[idx],
+            att[idx, 0, 0], att[idx, 0, 1], att[idx, 0, 2],
+            df['dlp_head_mGy_cm'].to_numpy(dtype=float)[idx],
+            df['dlp_body_mGy_cm'].to_numpy(dtype=float)[idx],
+        )
+        spessore[idx], kerma_out[idx], B_out[idx], Xref_out[idx], valido_out[idx] = X, K_tu, B, Xref, valido
+        K1sec_head[idx], K1sec_body[idx] = K1h, K1b
+
+    if profila:
+        CONTATORI_RAMI.registra("batch - RAMO 3", time.perf_counter() - inizio, len(idx))
+
+    # Modello secondario non riconosciuto: spessore non calcolato, kerma del fascio combinato riportato
+    modello_ignoto = errore == 7
+    kerma_out[modello_ignoto] = kerma[modello_ignoto, 0]
+    valido_out &= errore == 0
+    return pd.DataFrame({
+        'ramo_logico': pd.Categorical.from_codes(ramo, categories=RAMO_LOGICO_LABELS),
+        'spessore_finale_mm': spessore,
+        'kerma_non_schermato': kerma_out,
+        'trasmittanza_B': B_out,
+        'Xref_mm': Xref_out,
+        'spessore_valido': valido_out,
+        'X_fuga_mm': X_fuga,
+        'X_diffusione_mm': X_diffusione,
+        'K1sec_head_mGy_paz': K1sec_head,
+        'K1sec_body_mGy_paz': K1sec_body,
+        'errore': pd.Categorical.from_codes(errore - 1, categories=CALC_ERROR_MESSAGES[1:]),
+    }, index=df.index)
+
+
+def tabella_ingressi_risultati(chunk, primo_indice=0):
+    """
+    Blocco normalizzato con colonne identificative (impianto e stanza vuoti se assenti, barriera numerata
+    da primo_indice + 1 se assente), ingressi di calcolo, altre colonne e risultati di calculate_batch_chunk.
+    """
+    df = _normalizza_tabella_barriere(chunk)
+    for col in (BATCH_FACILITY_COLUMN, BATCH_ROOM_COLUMN):
+        df[col] = df[col].fillna("").astype(str) if col in df.columns else ""
+    if BATCH_BARRIER_COLUMN not in df.columns:
+        df[BATCH_BARRIER_COLUMN] = np.arange(primo_indice + 1, primo_indice + len(df) + 1)
+
+    ingressi = [BATCH_FACILITY_COLUMN, BATCH_ROOM_COLUMN, BATCH_BARRIER_COLUMN] + list(BATCH_COLUMN_DEFAULTS)
+    ingressi += [col for col in df.columns if col not in ingressi]
+    return df[ingressi].join(calculate_batch_chunk(df), rsuffix='_risultato')
+
+
+def iter_barrier_table(source, chunk_size=BATCH_CHUNK_SIZE):
+    """
+    Legge la tabella delle barriere a blocchi (memoria limitata).
+    source può essere un DataFrame, un percorso/file CSV o un file Parquet (richiede pyarrow).
+    """
+    if isinstance(source, pd.DataFrame):
+        for start in range(0, len(source), chunk_size):
+            yield source.iloc[start:start + chunk_size]
+        return
+
+    nome = str(getattr(source, 'name', source))
+    if nome.lower().endswith(('.parquet', '.pq')):
+        try:
+            import pyarrow.parquet as pq
+        except ImportError as exc:
+            raise ImportError("La lettura di file Parquet richiede il pacchetto 'pyarrow'.") from exc
+        for batch in pq.ParquetFile(source).iter_batches(batch_size=chunk_size):
+            yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(source, chunksize=chunk_size)
+
+
+def run_batch_calculation(source, chunk_size=BATCH_CHUNK_SIZE):
+    """
+    Motore batch: legge le barriere di un impianto da DataFrame/CSV/Parquet e restituisce
+    (in streaming, un blocco alla volta) i DataFrame con le colonne di input e i risultati.
+    """
+    for chunk in iter_barrier_table(source, chunk_size):
+        yield chunk.join(calculate_batch_chunk(chunk), rsuffix='_risultato')
+
+
+def _schema_parquet(table, numeriche):
+    """
+    Schema del file Parquet dal primo blocco, valido anche per i successivi: interi come float (possono
+    comparire NaN o decimali), colonne interamente vuote come testo, salvo quelle in numeriche.
+    """
+    import pyarrow as pa
+
+    campi = []
+    for campo, colonna in zip(table.schema, table.columns):
+        if pa.types.is_integer(campo.type):
+            campo = campo.with_type(pa.float64())
+        elif colonna.null_count == len(colonna) and campo.name not in numeriche:
+            campo = campo.with_type(pa.string())
+        campi.append(campo)
+    return pa.schema(campi)
+
+
+def write_batch_results(source, dest, chunk_size=BATCH_CHUNK_SIZE):
+    """
+    Esegue il batch e scrive i risultati su dest (CSV o Parquet) blocco per blocco.
+    In Parquet lo schema è quello del primo blocco (vedi _schema_parquet), a cui sono convertiti gli altri.
+    Restituisce il numero di barriere elaborate.
+    """
+    n_righe = 0
+    parquet = str(dest).lower().endswith(('.parquet', '.pq'))
+    if parquet:
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError as exc:
+            raise ImportError("La scrittura di file Parquet richiede il pacchetto 'pyarrow'.") from exc
+
+    writer = None
+    try:
+        for chunk in iter_barrier_table(source, chunk_size):
+            calcolati = calculate_batch_chunk(chunk)
+            risultati = chunk.join(calcolati, rsuffix='_risultato')
+            if parquet:
+                table = pa.Table.from_pandas(risultati, preserve_index=False)
+                if writer is None:
+                    # Ingressi numerici e risultati restano float anche se vuoti nel primo blocco
+                    numeriche = {col for col, default in BATCH_COLUMN_DEFAULTS.items() if not isinstance(default, str)}
+                    numeriche |= {alias for alias, col in BATCH_COLUMN_ALIASES.items() if col in numeriche}
+                    numeriche |= set(risultati.columns[len(chunk.columns):])
+                    schema = _schema_parquet(table, numeriche)
+                    writer = pq.ParquetWriter(dest, schema)
+                writer.write_table(table.cast(schema))
+            else:
+                risultati.to_csv(dest, mode='w' if n_righe == 0 else 'a', header=n_righe == 0, index=False)
+            n_righe += len(risultati)
+    finally:
+        if writer is not None:
+            writer.close()
+    return n_righe
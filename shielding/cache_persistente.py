@@ -0,0 +1,245 @@
+"""
+Cache persistente su disco (SQLite) dei risultati di calcolo, condivisa tra sessioni Streamlit e job batch.
+
+Le chiavi sono hash SHA-256 del contenuto (params canonici o tabella di barriere normalizzata) e della
+versione dei dati di calcolo: una modifica di KERMA_DATA, di una tabella ATTENUATION_DATA_* o degli altri
+dati NCRP 147 cambia la versione, e all'apertura una cache di versione diversa viene svuotata.
+La dimensione su disco è limitata (byte) con espulsione LRU.
+
+La cache è disattivata di default: attiva_cache_persistente() la abilita per il processo (e la variabile
+d'ambiente SHIELDING_CACHE=<percorso> la abilita già all'import del pacchetto).
+"""
+
+import atexit
+import hashlib
+import json
+import os
+import threading
+import time
+
+import numpy as np
+
+from . import dati
+from .spettro import WORKLOAD_GRID_POINTS, WORKLOAD_OUTPUT_KVP_EXPONENT, WORKLOAD_X_MAX_MM
+
+
+# Versione della logica di calcolo: va incrementata quando, a parità di dati, cambiano i risultati
+CACHE_SCHEMA_VERSION = 2
+
+# Dimensione massima della cache su disco (byte); dopo un'espulsione resta CACHE_EVICT_TARGET * massimo
+CACHE_MAX_BYTES = 256 * 1024 * 1024
+CACHE_EVICT_TARGET = 0.9
+
+# Accessi (hit) accumulati in memoria prima di aggiornare l'ordine LRU su disco
+CACHE_TOUCH_BATCH = 256
+
+# Variabile d'ambiente con il percorso del file di cache e percorso di default
+CACHE_PATH_ENV = "SHIELDING_CACHE"
+CACHE_DEFAULT_PATH = os.path.join(os.path.expanduser("~"), ".cache", "shielding-app", "risultati.sqlite")
+
+
+def versione_coefficienti():
+    """ Hash SHA-256 (esadecimale) dei dati NCRP 147 usati dai calcoli e di CACHE_SCHEMA_VERSION. """
+    contenuto = {
+        'schema': CACHE_SCHEMA_VERSION,
+        'KERMA_DATA': dati.KERMA_DATA,
+        'ATTENUATION_DATA_PRIMARY': dati.ATTENUATION_DATA_PRIMARY,
+        'ATTENUATION_DATA_SECONDARY': dati.ATTENUATION_DATA_SECONDARY,
+        'ATTENUATION_DATA_TC': dati.ATTENUATION_DATA_TC,
+        'ATTENUATION_DATA_KVP': dati.ATTENUATION_DATA_KVP,
+        'RAMO_1_MODES': dati.RAMO_1_MODES,
+        'DLP_TC_FIXED_VALUES': dati.DLP_TC_FIXED_VALUES,
+        'K_DIFF': [dati.K_HEAD_DIFF, dati.K_BODY_DIFF],
+        'spettro': [WORKLOAD_OUTPUT_KVP_EXPONENT, WORKLOAD_X_MAX_MM, WORKLOAD_GRID_POINTS],
+    }
+    return hashlib.sha256(json.dumps(contenuto, sort_keys=True, default=repr).encode()).hexdigest()
+
+
+def _converti_json(valore):
+    if isinstance(valore, np.generic):
+        return valore.item()
+    raise TypeError(f"Valore non serializzabile nella chiave di cache: {valore!r}")
+
+
+def json_canonico(params):
+    """ Serializzazione JSON canonica (chiavi ordinate, separatori compatti) del dizionario params. """
+    return json.dumps(params, sort_keys=True, separators=(',', ':'), ensure_ascii=False, default=_converti_json)
+
+
+class CacheRisultatiPersistente:
+    """
+    Archivio chiave -> byte su SQLite (WAL), sicuro tra thread e processi, con espulsione LRU a dimensione
+    limitata. Le chiavi includono la versione dei dati di calcolo (vedi versione_coefficienti).
+    """
+
+    def __init__(self, percorso=CACHE_DEFAULT_PATH, max_byte=CACHE_MAX_BYTES):
+        import sqlite3  # solo con la cache attiva: l'import del pacchetto resta leggero
+
+        cartella = os.path.dirname(os.path.abspath(percorso))
+        os.makedirs(cartella, exist_ok=True)
+        self.percorso = percorso
+        self.max_byte = max_byte
+        self.versione = versione_coefficienti()
+        self._prefisso = bytes.fromhex(self.versione)
+        self._lock = threading.Lock()
+        self._toccati = {}
+        self.hit = 0
+        self.miss = 0
+        self.espulsi = 0
+
+        self._conn = sqlite3.connect(percorso, timeout=30.0, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (chiave TEXT PRIMARY KEY, valore TEXT NOT NULL)")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS risultati ("
+            "chiave BLOB PRIMARY KEY, valore BLOB NOT NULL, dimensione INTEGER NOT NULL, accesso INTEGER NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS risultati_accesso ON risultati (accesso)")
+        self._verifica_versione()
+        self._byte = self._conn.execute("SELECT COALESCE(SUM(dimensione), 0) FROM risultati").fetchone()[0]
+
+    def _verifica_versione(self):
+        """ Svuota la cache se è stata scritta con dati di calcolo di versione diversa. """
+        with self._conn:
+            self._conn.execute("BEGIN IMMEDIATE")
+            riga = self._conn.execute("SELECT valore FROM meta WHERE chiave = 'versione'").fetchone()
+            if riga is None or riga[0] != self.versione:
+                self._conn.execute("DELETE FROM risultati")
+                self._conn.execute("INSERT OR REPLACE INTO meta VALUES ('versione', ?)", (self.versione,))
+
+    def chiave(self, tipo, *parti):
+        """ Chiave di contenuto: SHA-256 di versione, tipo (es. b'S', b'B') e parti in byte (con la loro lunghezza). """
+        h = hashlib.sha256(self._prefisso)
+        h.update(tipo)
+        for parte in parti:
+            h.update(len(parte).to_bytes(8, 'little'))
+            h.update(parte)
+        return h.digest()
+
+    def leggi(self, chiave):
+        """ Valore (byte) per la chiave, o None; l'accesso aggiorna l'ordine LRU. """
+        with self._lock:
+            riga = self._conn.execute("SELECT valore FROM risultati WHERE chiave = ?", (chiave,)).fetchone()
+            if riga is None:
+                self.miss += 1
+                return None
+            self.hit += 1
+            self._toccati[chiave] = time.time_ns()
+            if len(self._toccati) >= CACHE_TOUCH_BATCH:
+                self._registra_accessi()
+            return riga[0]
+
+    def scrivi(self, chiave, valore):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO risultati VALUES (?, ?, ?, ?)", (chiave, valore, len(valore), time.time_ns())
+            )
+            self._byte += len(valore)
+            if self._byte > self.max_byte:
+                self._espelli()
+
+    def ottieni(self, chiave, calcola, codifica, decodifica):
+        """ decodifica(valore in cache) se presente, altrimenti calcola(), memorizzato come codifica(risultato). """
+        valore = self.leggi(chiave)
+        if valore is not None:
+            return decodifica(valore)
+        risultato = calcola()
+        self.scrivi(chiave, codifica(risultato))
+        return risultato
+
+    def risultato_scalare(self, params, calcola):
+        """
+        Dizionario dei risultati di params (JSON) dalla cache, o calcola() se assente.
+        I params non serializzabili in JSON canonico sono calcolati senza cache.
+        """
+        try:
+            chiave = self.chiave(b'S', json_canonico(params).encode())
+        except (TypeError, ValueError):
+            return calcola()
+        return self.ottieni(chiave, calcola, lambda r: json.dumps(r).encode(), json.loads)
+
+    def _registra_accessi(self):
+        if self._toccati:
+            with self._conn:
+                self._conn.execute("BEGIN")
+                self._conn.executemany(
+                    "UPDATE risultati SET accesso = ? WHERE chiave = ?", [(t, k) for k, t in self._toccati.items()]
+                )
+            self._toccati.clear()
+
+    def _espelli(self):
+        """ Elimina le voci usate meno di recente fino a CACHE_EVICT_TARGET * max_byte. """
+        self._registra_accessi()
+        with self._conn:
+            self._conn.execute("BEGIN IMMEDIATE")
+            # Altri processi possono aver scritto: il totale è ricalcolato
+            self._byte = self._conn.execute("SELECT COALESCE(SUM(dimensione), 0) FROM risultati").fetchone()[0]
+            if self._byte <= self.max_byte:
+                return
+            eliminati = self._conn.execute(
+                "DELETE FROM risultati WHERE chiave IN ("
+                " SELECT chiave FROM (SELECT chiave, SUM(dimensione) OVER (ORDER BY accesso DESC, chiave) AS cumulato"
+                " FROM risultati) WHERE cumulato > ?)",
+                (int(self.max_byte * CACHE_EVICT_TARGET),),
+            ).rowcount
+            self.espulsi += eliminati
+            self._byte = self._conn.execute("SELECT COALESCE(SUM(dimensione), 0) FROM risultati").fetchone()[0]
+
+    def svuota(self):
+        with self._lock:
+            self._toccati.clear()
+            self._conn.execute("DELETE FROM risultati")
+            self._byte = 0
+
+    def statistiche(self):
+        with self._lock:
+            voci = self._conn.execute("SELECT COUNT(*) FROM risultati").fetchone()[0]
+            return {
+                'percorso': self.percorso, 'versione': self.versione[:12], 'voci': voci, 'byte': self._byte,
+                'max_byte': self.max_byte, 'hit': self.hit, 'miss': self.miss, 'espulsi': self.espulsi,
+            }
+
+    def chiudi(self):
+        with self._lock:
+            if self._conn is not None:
+                self._registra_accessi()
+                self._conn.close()
+                self._conn = None
+
+
+_cache_attiva = None
+
+
+def cache_persistente():
+    """ Cache persistente attiva per il processo, o None. """
+    return _cache_attiva
+
+
+def attiva_cache_persistente(percorso=None, max_byte=CACHE_MAX_BYTES):
+    """
+    Attiva la cache persistente per run_shielding_calculation e calculate_batch_chunk.
+    Percorso di default: variabile d'ambiente SHIELDING_CACHE, altrimenti CACHE_DEFAULT_PATH.
+    """
+    global _cache_attiva
+    percorso = percorso or os.environ.get(CACHE_PATH_ENV) or CACHE_DEFAULT_PATH
+    if _cache_attiva is not None:
+        if _cache_attiva.percorso == percorso:
+            _cache_attiva.max_byte = max_byte
+            return _cache_attiva
+        _cache_attiva.chiudi()
+    _cache_attiva = CacheRisultatiPersistente(percorso, max_byte)
+    return _cache_attiva
+
+
+def disattiva_cache_persistente():
+    global _cache_attiva
+    if _cache_attiva is not None:
+        _cache_attiva.chiudi()
+        _cache_attiva = None
+
+
+atexit.register(disattiva_cache_persistente)
+
+if os.environ.get(CACHE_PATH_ENV):
+    attiva_cache_persistente()
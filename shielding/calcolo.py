@@ -0,0 +1,246 @@
+"""
+Logica di backend principale (if/then/else sui rami) in forma scalare e vettoriale.
+"""
+
+import time
+
+import numpy as np
+
+from .analitica import calcola_kerma_incidente_array
+from .cache_persistente import cache_persistente
+from .coefficienti import COEFF_STORE
+from .dati import DLP_TC_FIXED_VALUES
+from .profilo import CONTATORI_RAMI
+from .risultati import (
+    BARRIERA_LABELS,
+    BARRIERA_PRIMARIA,
+    CALC_ERROR_MESSAGES,
+    ESITO_KP1_ASSENTE,
+    ESITO_NON_RICHIESTO,
+    RAMO_LOGICO_LABELS,
+    RisultatoCalcolo,
+)
+from .spessori import (
+    SECONDARY_MODELS,
+    calcola_componenti_secondaria_array,
+    calcola_primaria,
+    calcola_secondaria,
+    calcola_spessore_barriera_array,
+    calcola_spessore_tc_array,
+    calcola_tc,
+)
+from .spettro import tabella_spettro
+
+
+# Dizionario di run_shielding_calculation per la Primaria TC (calcolo non richiesto)
+_RISULTATO_TC_PRIMARIA = RisultatoCalcolo(
+    {}, ramo=3, barriera=BARRIERA_PRIMARIA, esito=ESITO_NON_RICHIESTO,
+).come_dizionario()
+
+
+def _calcola_schermatura(params):
+    """ Logica if-then-else sui rami (vedi calcola_schermatura). """
+    tipo_immagine = params.get('tipo_immagine')
+    tipo_barriera = params.get('tipo_barriera')
+    modalita_radiografia = params.get('modalita_radiografia')
+    ramo_modalita = COEFF_STORE.ramo_di(modalita_radiografia)
+    
+    # -------------------------------------------------------------------------
+    # RAMO 1: DIAGNOSTICA STANDARD (Le 4 modalità definite dall'utente con Kp1)
+    # RAMO 2: DIAGNOSTICA SPECIALIZZATA/GENERICA (Tutte le altre voci, inclusa TUTTE BARRIERE)
+    # -------------------------------------------------------------------------
+    if tipo_immagine == "RADIOLOGIA DIAGNOSTICA" and ramo_modalita in (1, 2):
+        
+        if tipo_barriera == "PRIMARIA":
+            risultato = calcola_primaria(params)
+            # Kp1 non definito: errore nel Ramo 1; nel Ramo 2 (TUTTE BARRIERE, Mammo, Angio, Fluoro) il
+            # calcolo Primario è omesso (spessore 0.0)
+            if ramo_modalita == 1 and risultato.esito == ESITO_KP1_ASSENTE:
+                risultato.errore = 5
+        
+        elif tipo_barriera == "SECONDARIA":
+            risultato = calcola_secondaria(params)
+        
+        else:
+            risultato = RisultatoCalcolo(params, errore=ramo_modalita + 1)
+
+        risultato.ramo = ramo_modalita
+
+    # -------------------------------------------------------------------------
+    # RAMO 3: TC (Tomografia Computerizzata)
+    # -------------------------------------------------------------------------
+    elif tipo_immagine == "TC": 
+        
+        if tipo_barriera == "PRIMARIA":
+            risultato = RisultatoCalcolo(params, ramo=3, barriera=BARRIERA_PRIMARIA, esito=ESITO_NON_RICHIESTO)
+        
+        elif tipo_barriera == "SECONDARIA":
+            risultato = calcola_tc(params)
+            
+        else:
+            risultato = RisultatoCalcolo(params, ramo=3, errore=4)
+    
+    else:
+        risultato = RisultatoCalcolo(params, errore=1)
+        
+    return risultato
+
+
+def calcola_schermatura(params):
+    """
+    Come run_shielding_calculation, ma restituisce un RisultatoCalcolo (campi numerici, codici di ramo,
+    errore ed esito): il testo 'dettaglio' è generato solo se letto. Con CONTATORI_RAMI attivi registra
+    il tempo di ogni chiamata per ramo logico e tipo di barriera.
+    """
+    if not CONTATORI_RAMI.attivi:
+        return _calcola_schermatura(params)
+    inizio = time.perf_counter()
+    risultato = _calcola_schermatura(params)
+    CONTATORI_RAMI.registra(
+        f"{RAMO_LOGICO_LABELS[risultato.ramo]} - {BARRIERA_LABELS[risultato.barriera] or 'NESSUNA'}",
+        time.perf_counter() - inizio,
+    )
+    return risultato
+
+
+def run_shielding_calculation(params, dettaglio=True):
+    """
+    Funzione principale che gestisce la logica if-then-else e indirizza i calcoli.
+    Restituisce il dizionario dei risultati, con il testo 'dettaglio' se richiesto (vedi calcola_schermatura).
+    Con la cache persistente attiva (attiva_cache_persistente) il dizionario è letto dalla cache se presente.
+    """
+    # Primaria TC (calcolo non richiesto): risultato costante, senza record né cache
+    if (params.get('tipo_immagine') == "TC" and params.get('tipo_barriera') == "PRIMARIA"
+            and not CONTATORI_RAMI.attivi):
+        risultati = dict(_RISULTATO_TC_PRIMARIA)
+        if not dettaglio:
+            del risultati['dettaglio']
+        return risultati
+    cache = cache_persistente()
+    if cache is None:
+        return calcola_schermatura(params).come_dizionario(dettaglio)
+    risultati = cache.risultato_scalare(params, lambda: calcola_schermatura(params).come_dizionario())
+    if not dettaglio:
+        risultati.pop('dettaglio', None)
+    return risultati
+
+
+def run_shielding_calculation_array(params, tabelle=None):
+    """
+    Variante vettoriale di run_shielding_calculation per una sola combinazione Tipo Immagine/Modalità/
+    Barriera/Materiale: i parametri numerici (P, T, d, U, N, X_PRE_mm, campi TC) possono essere array
+    broadcastabili. Restituisce 'ramo_logico', l'eventuale 'errore' e gli array 'spessore_finale_mm',
+    'kerma_non_schermato', 'trasmittanza_B', 'Xref_mm' e 'spessore_valido' con la forma del broadcast
+    (più 'X_fuga_mm' e 'X_diffusione_mm' per la Secondaria diagnostica). 'spettro_carico' come nello scalare (solo Primaria).
+    Con tabelle (TabelleSpessoreInverso) la formula inversa a singola componente usa le tabelle
+    precalcolate (errore entro tabelle.errore_max_mm); senza, la formula esatta.
+    """
+    tipo_immagine = params.get('tipo_immagine')
+    tipo_barriera = params.get('tipo_barriera')
+    modalita = params.get('modalita_radiografia')
+    materiale = params.get('materiale_schermatura')
+
+    P = np.asarray(params.get('P_mSv_wk', 0.0), dtype=float)
+    T = np.asarray(params.get('tasso_occupazione_T', 1.0), dtype=float)
+    d = np.asarray(params.get('distanza_d', 2.0), dtype=float)
+    U = np.asarray(params.get('fattore_uso_U', 0.25), dtype=float)
+    N = np.asarray(params.get('pazienti_settimana_N', 100), dtype=float)
+    Xpre = np.asarray(params.get('X_PRE_mm', 0.0), dtype=float)
+    N_head = np.asarray(params.get('weekly_n_head', 0), dtype=float)
+    N_body = np.asarray(params.get('weekly_n_body', 0), dtype=float)
+    Kc = np.asarray(params.get('contrast_factor', 1.0), dtype=float)
+    DLP_head = np.asarray(params.get('dlp_head_mGy_cm', DLP_TC_FIXED_VALUES["HEAD"]), dtype=float)
+    DLP_body = np.asarray(params.get('dlp_body_mGy_cm', DLP_TC_FIXED_VALUES["BODY"]), dtype=float)
+    forma = np.broadcast_shapes(
+        P.shape, T.shape, d.shape, U.shape, N.shape, Xpre.shape, N_head.shape, N_body.shape, Kc.shape,
+        DLP_head.shape, DLP_body.shape,
+    )
+
+    def _risultato(ramo, X=0.0, K=0.0, B=np.nan, Xref=0.0, valido=True, errore=None, componenti=None):
+        risultati = {
+            'ramo_logico': RAMO_LOGICO_LABELS[ramo],
+            'spessore_finale_mm': np.broadcast_to(X, forma),
+            'kerma_non_schermato': np.broadcast_to(K, forma),
+            'trasmittanza_B': np.broadcast_to(B, forma),
+            'Xref_mm': np.broadcast_to(Xref, forma),
+            'spessore_valido': np.broadcast_to(valido, forma),
+        }
+        if errore is not None:
+            risultati['errore'] = errore
+            risultati['spessore_valido'] = np.zeros(forma, dtype=bool)
+        if componenti is not None:
+            risultati['X_fuga_mm'] = np.broadcast_to(componenti[0], forma)
+            risultati['X_diffusione_mm'] = np.broadcast_to(componenti[1], forma)
+        return risultati
+
+    if tipo_immagine == "RADIOLOGIA DIAGNOSTICA" and COEFF_STORE.ramo_di(modalita) in (1, 2):
+        ramo = COEFF_STORE.ramo_di(modalita)
+        i_mod = COEFF_STORE.modalita_id[modalita]
+        i_mat = COEFF_STORE.materiale_id.get(materiale, -1)
+
+        if tipo_barriera == "PRIMARIA":
+            K_val = COEFF_STORE.Kp1[i_mod]
+            if np.isnan(K_val):
+                # Ramo 1: errore; Ramo 2: calcolo primario omesso (spessore 0.0)
+                if ramo == 1:
+                    return _risultato(ramo, errore=CALC_ERROR_MESSAGES[5])
+                return _risultato(ramo)
+            att = COEFF_STORE.att_primaria[i_mod, i_mat]
+        elif tipo_barriera == "SECONDARIA":
+            K_val = COEFF_STORE.Ksec1_Comb[i_mod]
+            U = 1.0 # U è tipicamente 1.0 per la secondaria (NCRP 147 Eq. 4.4)
+            att = COEFF_STORE.att_secondaria[i_mod, i_mat]
+        else:
+            return _risultato(ramo, errore=CALC_ERROR_MESSAGES[ramo + 1])
+
+        if i_mat < 0:
+            return _risultato(ramo, errore=CALC_ERROR_MESSAGES[6])
+
+        spettro = params.get('spettro_carico') if tipo_barriera == "PRIMARIA" else None
+        if spettro:
+            tabella = tabella_spettro(materiale, spettro)
+        elif tabelle is not None:
+            fit = tabelle.fit_primaria if tipo_barriera == "PRIMARIA" else tabelle.fit_secondaria
+            tabella = tabelle.tabella(fit[i_mod, i_mat])
+        else:
+            tabella = None
+        kerma = calcola_kerma_incidente_array(K_val, U, N, d)
+        X, K, B, Xref, valido = calcola_spessore_barriera_array(kerma, P, T, Xpre, *att, tabella=tabella)
+        if tipo_barriera == "PRIMARIA":
+            return _risultato(ramo, X, K, B, Xref, valido)
+
+        modello = params.get('modello_secondario', SECONDARY_MODELS[0])
+        if modello not in SECONDARY_MODELS:
+            return _risultato(ramo, K=kerma, errore=CALC_ERROR_MESSAGES[7])
+        kerma_L = calcola_kerma_incidente_array(COEFF_STORE.Ksec1_LeakSide[i_mod], U, N, d)
+        kerma_S = calcola_kerma_incidente_array(COEFF_STORE.Ksec1_ForBack[i_mod], U, N, d)
+        X_L, X_S, X_LS, valido_LS = calcola_componenti_secondaria_array(
+            kerma_L, kerma_S, P, T, Xpre, att, COEFF_STORE.att_primaria[i_mod, i_mat],
+        )
+        if modello == "FUGA+DIFFUSIONE":
+            K = kerma_L + kerma_S
+            nullo = (K * T == 0) | (P == 0)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                B = np.where(nullo, np.nan, P / (K * T))
+            K = np.where(nullo, 0.0, K)
+            X, Xref, valido = X_LS, X_LS + Xpre, valido_LS
+        return _risultato(ramo, X, K, B, Xref, valido, componenti=(X_L, X_S))
+
+    elif tipo_immagine == "TC":
+        if tipo_barriera == "PRIMARIA":
+            return _risultato(3)
+        if tipo_barriera != "SECONDARIA":
+            return _risultato(3, errore=CALC_ERROR_MESSAGES[4])
+
+        i_mat = COEFF_STORE.materiale_id.get(materiale, -1)
+        i_kvp = COEFF_STORE.kvp_id.get(params.get('kvp_tc'), -1)
+        if i_mat < 0 or i_kvp < 0:
+            return _risultato(3, errore=CALC_ERROR_MESSAGES[6])
+
+        X, K_tu, B, Xref, valido, _, _ = calcola_spessore_tc_array(
+            P, T, d, Xpre, N_head, N_body, Kc, *COEFF_STORE.att_tc[i_mat, i_kvp], DLP_head, DLP_body,
+            tabella=tabelle.tabella(tabelle.fit_tc[i_mat, i_kvp]) if tabelle is not None else None,
+        )
+        return _risultato(3, X, K_tu, B, Xref, valido)
+
+    return _risultato(0, errore=CALC_ERROR_MESSAGES[1])
@@ -0,0 +1,89 @@
+"""
+Interfaccia a riga di comando: parametri JSON Lines in ingresso, risultati JSON Lines in uscita.
+
+    python -m shielding [ingresso.jsonl] [-o uscita.jsonl]
+
+Ogni riga di ingresso è un dizionario params (stesse chiavi di run_shielding_calculation) e produce una
+riga di uscita con il dizionario dei risultati, nello stesso ordine. Senza file si usano stdin/stdout.
+Con --senza-dettaglio il testo descrittivo non viene generato; con --profilo i tempi per ramo sono
+riportati su stderr al termine; con --cache i risultati sono letti e scritti nella cache persistente.
+Carica soltanto il motore di calcolo (NumPy): niente Streamlit, plotly o pandas all'avvio.
+"""
+
+import argparse
+import json
+import sys
+
+from .cache_persistente import attiva_cache_persistente
+from .calcolo import run_shielding_calculation
+from .profilo import CONTATORI_RAMI
+
+
+def elabora_jsonl(ingresso, uscita, flush=True, dettaglio=True):
+    """
+    Scrive su uscita una riga di risultati per ogni riga non vuota di ingresso. Il campo opzionale 'id'
+    dei parametri è riportato nel risultato. Le righe non elaborabili (JSON non valido, valori non numerici)
+    producono {'errore': ...} senza interrompere il flusso. Con dettaglio=False il testo descrittivo è omesso.
+    Restituisce il numero di righe non elaborabili.
+    """
+    righe_errate = 0
+    for n_riga, riga in enumerate(ingresso, 1):
+        if not riga.strip():
+            continue
+        params = None
+        try:
+            params = json.loads(riga)
+            if not isinstance(params, dict):
+                raise ValueError("la riga non è un oggetto JSON.")
+            risultati = run_shielding_calculation(params, dettaglio)
+        except (ValueError, TypeError) as exc:
+            righe_errate += 1
+            params = params if isinstance(params, dict) else {}
+            risultati = {'errore': f"Riga {n_riga}: {exc}"}
+        if 'id' in params:
+            risultati = {'id': params['id'], **risultati}
+
+        uscita.write(json.dumps(risultati) + "\n")
+        if flush:
+            uscita.flush()
+    return righe_errate
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m shielding",
+        description="Calcolo degli spessori di schermatura NCRP 147 da parametri JSON Lines.",
+    )
+    parser.add_argument("ingresso", nargs="?", default="-", help="file JSON Lines dei parametri (default: stdin)")
+    parser.add_argument("-o", "--output", default="-", help="file JSON Lines dei risultati (default: stdout)")
+    parser.add_argument(
+        "--no-flush", action="store_true",
+        help="non svuota l'uscita dopo ogni riga (più veloce su file grandi, ma non interattivo)",
+    )
+    parser.add_argument(
+        "--senza-dettaglio", action="store_true",
+        help="omette il testo descrittivo 'dettaglio' (restano i campi numerici e gli errori)",
+    )
+    parser.add_argument("--profilo", action="store_true", help="riporta su stderr i tempi di calcolo per ramo")
+    parser.add_argument(
+        "--cache", nargs="?", const="", default=None, metavar="PERCORSO",
+        help="attiva la cache persistente dei risultati (default: $SHIELDING_CACHE o ~/.cache/shielding-app)",
+    )
+    args = parser.parse_args(argv)
+    if args.cache is not None:
+        attiva_cache_persistente(args.cache or None)
+    CONTATORI_RAMI.attivi = args.profilo
+
+    ingresso = sys.stdin if args.ingresso == "-" else open(args.ingresso, encoding="utf-8")
+    uscita = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+    try:
+        righe_errate = elabora_jsonl(ingresso, uscita, flush=not args.no_flush, dettaglio=not args.senza_dettaglio)
+    finally:
+        if ingresso is not sys.stdin:
+            ingresso.close()
+        if uscita is not sys.stdout:
+            uscita.close()
+    if args.profilo:
+        json.dump(CONTATORI_RAMI.riepilogo(), sys.stderr, indent=2, ensure_ascii=False)
+        sys.stderr.write("\n")
+    return 1 if righe_errate else 0
@@ -0,0 +1,118 @@
+"""
+Archivio indicizzato dei coefficienti NCRP 147 (costruito una volta all'import).
+"""
+
+import numpy as np
+
+from .dati import (
+    ATTENUATION_DATA_PRIMARY,
+    ATTENUATION_DATA_SECONDARY,
+    ATTENUATION_DATA_TC,
+    KERMA_DATA,
+    RAMO_1_MODES,
+)
+
+
+class CoefficientStore:
+    """
+    Compila KERMA_DATA e ATTENUATION_DATA_* in array NumPy contigui indicizzati da ID interi
+    (modalità, materiale, kVp) e ne verifica la completezza all'import.
+    Ogni array ha una posizione finale aggiuntiva (NaN, ramo 0): un ID -1 (chiave sconosciuta)
+    la seleziona, così le ricerche vettoriali non richiedono controlli riga per riga.
+    """
+
+    KERMA_FIELDS = ('Wnorm', 'Kp1', 'Ksec1_LeakSide', 'Ksec1_ForBack', 'Ksec1_Comb')
+
+    def __init__(self, kerma_data, att_primary, att_secondary, att_tc, ramo_1_modes):
+        self.modalita = tuple(kerma_data)
+        self.materiali = tuple(att_tc)
+        self.kvp = tuple(dict.fromkeys(k for per_kvp in att_tc.values() for k in per_kvp))
+
+        self.modalita_id = {m: i for i, m in enumerate(self.modalita)}
+        self.materiale_id = {m: i for i, m in enumerate(self.materiali)}
+        self.kvp_id = {k: i for i, k in enumerate(self.kvp)}
+
+        self._valida(kerma_data, att_primary, att_secondary, att_tc, ramo_1_modes)
+
+        n_mod, n_mat, n_kvp = len(self.modalita), len(self.materiali), len(self.kvp)
+
+        # Kerma e carico di lavoro (Kp1 None -> NaN: barriera primaria non prevista)
+        for campo in self.KERMA_FIELDS:
+            valori = np.full(n_mod + 1, np.nan)
+            for i, m in enumerate(self.modalita):
+                if kerma_data[m][campo] is not None:
+                    valori[i] = kerma_data[m][campo]
+            setattr(self, campo, valori)
+
+        # Parametri di fitting (..., 3) = (alpha, beta, gamma)
+        self.att_primaria = np.full((n_mod + 1, n_mat + 1, 3), np.nan)
+        self.att_secondaria = np.full((n_mod + 1, n_mat + 1, 3), np.nan)
+        for tabella, dest in ((att_primary, self.att_primaria), (att_secondary, self.att_secondaria)):
+            for i, m in enumerate(self.modalita):
+                for j, mat in enumerate(self.materiali):
+                    data = tabella[m][mat]
+                    dest[i, j] = (data['alpha'], data['beta'], data['gamma'])
+
+        self.att_tc = np.full((n_mat + 1, n_kvp + 1, 3), np.nan)
+        for j, mat in enumerate(self.materiali):
+            for k, kvp in enumerate(self.kvp):
+                data = att_tc[mat][kvp]
+                self.att_tc[j, k] = (data['alpha'], data['beta'], data['gamma'])
+
+        # Ramo logico per modalità (1 = RAMO_1_MODES, 2 = tutte le altre, 0 = sconosciuta)
+        self.ramo = np.zeros(n_mod + 1, dtype=np.int8)
+        for i, m in enumerate(self.modalita):
+            self.ramo[i] = 1 if m in ramo_1_modes else 2
+        self.ramo_per_modalita = {m: int(self.ramo[i]) for i, m in enumerate(self.modalita)}
+
+        for campo in self.KERMA_FIELDS + ('att_primaria', 'att_secondaria', 'att_tc', 'ramo'):
+            getattr(self, campo).flags.writeable = False
+
+    def _valida(self, kerma_data, att_primary, att_secondary, att_tc, ramo_1_modes):
+        """ Verifica che ogni combinazione richiesta dal calcolo abbia dati completi. """
+        mancanti = []
+        for m in self.modalita:
+            # Kp1 può essere None (barriera primaria non prevista), gli altri campi no
+            mancanti += [
+                f"KERMA_DATA['{m}']['{c}']" for c in self.KERMA_FIELDS
+                if c not in kerma_data[m] or (c != 'Kp1' and kerma_data[m][c] is None)
+            ]
+            for nome, tabella in (("ATTENUATION_DATA_PRIMARY", att_primary), ("ATTENUATION_DATA_SECONDARY", att_secondary)):
+                mancanti += [f"{nome}['{m}']['{mat}']" for mat in self.materiali if mat not in tabella.get(m, {})]
+        for mat in self.materiali:
+            mancanti += [f"ATTENUATION_DATA_TC['{mat}']['{k}']" for k in self.kvp if k not in att_tc[mat]]
+        mancanti += [f"RAMO_1_MODES: '{m}'" for m in ramo_1_modes if m not in self.modalita_id]
+
+        if mancanti:
+            raise ValueError("Dati NCRP 147 incompleti: " + ", ".join(mancanti))
+
+    def ramo_di(self, modalita):
+        """ Ramo logico (1/2) della modalità, 0 se sconosciuta. """
+        return self.ramo_per_modalita.get(modalita, 0)
+
+    @staticmethod
+    def _codifica(indice, valori):
+        """ Converte una sequenza di chiavi in ID interi (-1 per le chiavi sconosciute). """
+        import pandas as pd  # solo per i calcoli batch: il pacchetto non importa pandas all'avvio
+
+        codici, uniche = pd.factorize(pd.Series(valori, dtype=object, copy=False))
+        mappa = np.array([indice.get(u, -1) for u in uniche] + [-1], dtype=np.intp)
+        return mappa[codici]
+
+    def ids_modalita(self, valori):
+        return self._codifica(self.modalita_id, valori)
+
+    def ids_materiale(self, valori):
+        return self._codifica(self.materiale_id, valori)
+
+    def ids_kvp(self, valori):
+        return self._codifica(self.kvp_id, valori)
+
+
+COEFF_STORE = CoefficientStore(
+    KERMA_DATA,
+    ATTENUATION_DATA_PRIMARY,
+    ATTENUATION_DATA_SECONDARY,
+    ATTENUATION_DATA_TC,
+    RAMO_1_MODES,
+)
@@ -0,0 +1,85 @@
+"""
+Curve di trasmissione B(x) di tutte le tabelle e sottocampionamento LTTB per la visualizzazione.
+"""
+
+import numpy as np
+
+from .analitica import calcola_trasmissione_array
+from .coefficienti import COEFF_STORE
+
+
+# Spessore massimo (mm) della griglia delle curve, per materiale
+CURVE_X_MAX_MM = {"PIOMBO": 4.0, "CEMENTO": 300.0}
+
+# Trasmissione minima rappresentata (i valori inferiori sono troncati per la scala logaritmica)
+CURVE_B_MIN = 1e-9
+
+
+def elenco_curve_trasmissione():
+    """
+    Elenca tutte le curve disponibili come (tabella, chiave, materiale) e i relativi (alpha, beta, gamma),
+    nell'ordine: Primaria (Tab. B.1), Secondaria (Tab. C.1), TC per kVp.
+    """
+    etichette, coeff = [], []
+    for tabella, att in (("PRIMARIA", COEFF_STORE.att_primaria), ("SECONDARIA", COEFF_STORE.att_secondaria)):
+        for i, modalita in enumerate(COEFF_STORE.modalita):
+            for j, materiale in enumerate(COEFF_STORE.materiali):
+                etichette.append((tabella, modalita, materiale))
+                coeff.append(att[i, j])
+    for j, materiale in enumerate(COEFF_STORE.materiali):
+        for k, kvp in enumerate(COEFF_STORE.kvp):
+            etichette.append(("TC", kvp, materiale))
+            coeff.append(COEFF_STORE.att_tc[j, k])
+    return etichette, np.array(coeff)
+
+
+def calcola_curve_trasmissione(n_punti=4000):
+    """
+    Calcola in un'unica operazione vettoriale B(x) per tutte le curve su una griglia densa di spessori.
+    Restituisce (etichette, x, B) con x e B di forma (n_curve, n_punti); la griglia dipende dal materiale.
+    """
+    etichette, coeff = elenco_curve_trasmissione()
+    x_max = np.array([CURVE_X_MAX_MM.get(materiale, 1.0) for _, _, materiale in etichette])
+    x = x_max[:, None] * np.linspace(0.0, 1.0, n_punti)[None, :]
+    B = calcola_trasmissione_array(coeff[:, 0:1], coeff[:, 1:2], coeff[:, 2:3], x)
+    return etichette, x, np.clip(B, CURVE_B_MIN, 1.0)
+
+
+def downsample_lttb(x, y, n_out):
+    """
+    Sottocampionamento Largest-Triangle-Three-Buckets per la visualizzazione.
+    x, y di forma (n,) oppure (n_curve, n) con lo stesso numero di punti per riga: le curve sono
+    elaborate insieme, bucket per bucket. Primo e ultimo punto sono sempre conservati.
+    """
+    monodimensionale = np.ndim(y) == 1
+    x = np.atleast_2d(np.asarray(x, dtype=float))
+    y = np.atleast_2d(np.asarray(y, dtype=float))
+    n = x.shape[1]
+    if n_out >= n or n_out < 3:
+        return (x[0], y[0]) if monodimensionale else (x, y)
+
+    righe = np.arange(x.shape[0])
+    # n_out - 2 bucket interni tra il primo e l'ultimo punto
+    bordi = np.linspace(1, n - 1, n_out - 1).astype(int)
+    scelti = np.empty((x.shape[0], n_out), dtype=np.intp)
+    scelti[:, 0] = 0
+    scelti[:, -1] = n - 1
+
+    for b in range(n_out - 2):
+        inizio, fine = bordi[b], bordi[b + 1]
+        # Media del bucket successivo (o ultimo punto)
+        succ_inizio, succ_fine = (bordi[b + 1], bordi[b + 2]) if b + 2 < len(bordi) else (n - 1, n)
+        x_medio = x[:, succ_inizio:succ_fine].mean(axis=1, keepdims=True)
+        y_medio = y[:, succ_inizio:succ_fine].mean(axis=1, keepdims=True)
+
+        a = scelti[:, b]
+        x_a, y_a = x[righe, a][:, None], y[righe, a][:, None]
+        area = np.abs(
+            (x_a - x_medio) * (y[:, inizio:fine] - y_a)
+            - (x_a - x[:, inizio:fine]) * (y_medio - y_a)
+        )
+        scelti[:, b + 1] = inizio + np.argmax(area, axis=1)
+
+    x_out = np.take_along_axis(x, scelti, axis=1)
+    y_out = np.take_along_axis(y, scelti, axis=1)
+    return (x_out[0], y_out[0]) if monodimensionale else (x_out, y_out)
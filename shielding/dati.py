@@ -0,0 +1,255 @@
+"""
+Dati NCRP 147 consolidati (kerma non schermato, parametri di attenuazione, pre-schermatura, TC)
+e mappature logiche delle modalità sui rami di calcolo.
+"""
+
+
+# Struttura dati unificata per Modalità Radiografica (RAMO 1/2/4)
+# Include Kp1 (Primario), Wnorm (Carico di Lavoro), e le 3 componenti Ksec1 (Secondario/Fuga)
+# I valori di Ksec1 (LeakSide, ForBack, Comb) e Wnorm sono da Tabella 4.7, Kp1 da Tabella 4.5.
+KERMA_DATA = {
+    # 1. STANZA RADIOGRAFICA (TUTTE BARRIERE)
+    "STANZA RADIOGRAFICA (TUTTE BARRIERE)": {
+        'Wnorm': 2.5,
+        'Kp1': None, # Usato per barriere secondarie/generiche (Kp1 da Tab 4.5 non applicabile qui)
+        'Ksec1_LeakSide': 3.4e-2, # 3.4*10^-2
+        'Ksec1_ForBack': 4.8e-2, # 4.8*10^-2
+        'Ksec1_Comb': 4.9e-2,    # VALORE COMBINATO
+    },
+    # 2. STANZA RADIOGRAFICA GENERICA (CHEST BUCKY - PARETE PRIMARIA)
+    "STANZA RADIOGRAFICA (CHEST BUCKY)": {
+        'Wnorm': 0.60,
+        'Kp1': 2.3, # Kp1 da Tab 4.5
+        'Ksec1_LeakSide': 5.3e-3, # 5.3*10^-3
+        'Ksec1_ForBack': 6.9e-3, # 6.9*10^-3
+        'Ksec1_Comb': 7.3e-3,
+    },
+    # 3. STANZA RADIOGRAFICA (PAVIMENTO/ALTRE BARRIERE - ES: PARETE PRIMARIA)
+    "STANZA RADIOGRAFICA (PIANO/ALTRE BARRIERE)": {
+        'Wnorm': 1.9,
+        'Kp1': 5.2, # Kp1 da Tab 4.5
+        'Ksec1_LeakSide': 2.3e-2, # 2.3*10^-2
+        'Ksec1_ForBack': 3.3e-2, # 3.3*10^-2
+        'Ksec1_Comb': 3.3e-2,
+    },
+    # 4. TUBO FLUOROSCOPICO STANZA R&F
+    "FLUOROSCOPIA (R&F)": {
+        'Wnorm': 13.0,
+        'Kp1': None, # Usato per barriere secondarie
+        'Ksec1_LeakSide': 3.2e-1, # 3.2*10^-1
+        'Ksec1_ForBack': 4.4e-1, # 4.4*10^-1
+        'Ksec1_Comb': 4.6e-1,
+    },
+    # 5. TUBO RADIOGENO STANZA R&F
+    "RADIOGRAFIA (TUBO R&F)": {
+        'Wnorm': 1.5,
+        'Kp1': 5.9, # Kp1 da Tab 4.5 (Se la barriera è primaria)
+        'Ksec1_LeakSide': 2.9e-2, # 2.9*10^-2
+        'Ksec1_ForBack': 3.9e-2, # 3.9*10^-2
+        'Ksec1_Comb': 4.0e-2, # Corretto 4.0*0-2 a 4.0*10^-2
+    },
+    # 6. STANZA RADIOGRAFICA TORACE (CHEST ROOM) - NOME AGGIORNATO
+    "STANZA RADIOGRAFICA TORACE(CHEST ROOM)": {
+        'Wnorm': 0.22,
+        'Kp1': 1.2, # Kp1 da Tab 4.5 (Se la barriera è primaria)
+        'Ksec1_LeakSide': 2.7e-3, # 2.7*10^-3
+        'Ksec1_ForBack': 3.2e-3, # 3.2*10^-3
+        'Ksec1_Comb': 3.6e-3,
+    },
+    # 7. MAMMOGRAFIA
+    "MAMMOGRAFIA": {
+        'Wnorm': 6.7,
+        'Kp1': None, # Solo calcolo secondario per NCRP 147
+        'Ksec1_LeakSide': 1.1e-2, # 1.1*10^-2
+        'Ksec1_ForBack': 4.9e-2, # 4.9*10^-2
+        'Ksec1_Comb': 4.9e-2,
+    },
+    # 8. ANGIOGRAFIA CARDIACA
+    "ANGIO CARDIACA": {
+        'Wnorm': 160.0,
+        'Kp1': None, # Solo calcolo secondario
+        'Ksec1_LeakSide': 2.7,
+        'Ksec1_ForBack': 3.7,
+        'Ksec1_Comb': 3.8,
+    },
+    # 9. ANGIOGRAFIA PERIFERICA
+    "ANGIO PERIFERICA": {
+        'Wnorm': 64.0,
+        'Kp1': None, # Solo calcolo secondario
+        'Ksec1_LeakSide': 6.6e-1, # 6.6*10^-1
+        'Ksec1_ForBack': 9.5e-1, # 9.5*10^-1
+        'Ksec1_Comb': 9.5e-1,
+    }
+}
+
+
+# Parametri di Fitting (Alfa, Beta, Gamma) per Barriera Primaria (Tabella B.1)
+ATTENUATION_DATA_PRIMARY = {
+    "STANZA RADIOGRAFICA (TUTTE BARRIERE)": {
+        "PIOMBO": {'alpha': 2.346, 'beta': 1.59e+01, 'gamma': 4.982e-01}, 
+        "CEMENTO": {'alpha': 3.626e-02, 'beta': 1.429e-01, 'gamma': 4.931e-01}
+    },
+    "STANZA RADIOGRAFICA (CHEST BUCKY)": {
+        "PIOMBO": {'alpha': 2.264, 'beta': 1.308e+01, 'gamma': 5.6e-01},
+        "CEMENTO": {'alpha': 3.552e-02, 'beta': 1.177e-01, 'gamma': 6.007e-01}
+    },
+    "STANZA RADIOGRAFICA (PIANO/ALTRE BARRIERE)": {
+        "PIOMBO": {'alpha': 2.651, 'beta': 1.656e+01, 'gamma': 4.585e-01},
+        "CEMENTO": {'alpha': 3.994e-02, 'beta': 1.448e-01, 'gamma': 4.231e-01}
+    },
+    "FLUOROSCOPIA (R&F)": {
+        "PIOMBO": {'alpha': 2.347, 'beta': 1.267e+01, 'gamma': 6.149e-01},
+        "CEMENTO": {'alpha': 3.616e-02, 'beta': 9.721e-02, 'gamma': 5.186e-01}
+    },
+    "RADIOGRAFIA (TUBO R&F)": {
+        "PIOMBO": {'alpha': 2.295, 'beta': 1.3e+01, 'gamma': 5.573e-01},
+        "CEMENTO": {'alpha': 3.549e-02, 'beta': 1.164e-01, 'gamma': 5.774e-01}
+    },
+    "STANZA RADIOGRAFICA TORACE(CHEST ROOM)": {
+        "PIOMBO": {'alpha': 2.283, 'beta': 1.074e+01, 'gamma': 6.37e-01},
+        "CEMENTO": {'alpha': 3.622e-02, 'beta': 7.766e-02, 'gamma': 5.404e-01}
+    },
+    "MAMMOGRAFIA": {
+        "PIOMBO": {'alpha': 30.6, 'beta': 1.776e+02, 'gamma': 3.308e-01},
+        "CEMENTO": {'alpha': 2.577e-01, 'beta': 1.765, 'gamma': 3.644e-01} 
+    },
+    "ANGIO CARDIACA": {
+        "PIOMBO": {'alpha': 2.389, 'beta': 1.426e+01, 'gamma': 5.948e-01},
+        "CEMENTO": {'alpha': 3.717e-02, 'beta': 1.087e-01, 'gamma': 4.879e-01} 
+    },
+    "ANGIO PERIFERICA": {
+        "PIOMBO": {'alpha': 2.728, 'beta': 1.852e+01, 'gamma': 4.614e-01},
+        "CEMENTO": {'alpha': 4.292e-02, 'beta': 1.538e+02, 'gamma': 4.236e-01}
+    }
+}
+
+
+# Parametri di Fitting (Alfa, Beta, Gamma) per Barriera Secondaria (Tabella C.1)
+ATTENUATION_DATA_SECONDARY = {
+    "STANZA RADIOGRAFICA (TUTTE BARRIERE)": {
+        "PIOMBO": {'alpha': 2.298, 'beta': 1.738e+01, 'gamma': 6.193e-01},
+        "CEMENTO": {'alpha': 3.610e-02, 'beta': 1.433e-01, 'gamma': 5.600e-01}
+    },
+    "STANZA RADIOGRAFICA (CHEST BUCKY)": {
+        "PIOMBO": {'alpha': 2.256, 'beta': 1.38e+01, 'gamma': 8.837e-01},
+        "CEMENTO": {'alpha': 3.56e-02, 'beta': 1.79e-01, 'gamma': 7.705e-01}
+    },
+    "STANZA RADIOGRAFICA (PIANO/ALTRE BARRIERE)": {
+        "PIOMBO": {'alpha': 2.513, 'beta': 1.734e+01, 'gamma': 4.994e-01},
+        "CEMENTO": {'alpha': 3.920e-02, 'beta': 1.464e-01, 'gamma': 4.486e-01} 
+    },
+    "FLUOROSCOPIA (R&F)": {
+        "PIOMBO": {'alpha': 2.322, 'beta': 1.291e+01, 'gamma': 7.575e-01},
+        "CEMENTO": {'alpha': 3.630e-02, 'beta': 9.360e+02, 'gamma': 5.955e-01}
+    },
+    "RADIOGRAFIA (TUBO R&F)": {
+        "PIOMBO": {'alpha': 2.272, 'beta': 1.360e+01, 'gamma': 7.184e-01},
+        "CEMENTO": {'alpha': 3.560e-02, 'beta': 1.114e-01, 'gamma': 6.620e-01}
+    },
+    "STANZA RADIOGRAFICA TORACE(CHEST ROOM)": {
+        "PIOMBO": {'alpha': 2.288, 'beta': 9.848, 'gamma': 1.054},
+        "CEMENTO": {'alpha': 3.640e-02, 'beta': 6.590e-02, 'gamma': 7.543e-01}
+    },
+    "MAMMOGRAFIA": {
+        "PIOMBO": {'alpha': 29.91, 'beta': 1.844e+02, 'gamma': 3.550e-01},
+        "CEMENTO": {'alpha': 2.539e-01, 'beta': 1.8411, 'gamma': 3.924e-01}
+    },
+    "ANGIO CARDIACA": {
+        "PIOMBO": {'alpha': 2.354, 'beta': 1.494e+01, 'gamma': 7.481e-01},
+        "CEMENTO": {'alpha': 3.710e-02, 'beta': 1.067e-01, 'gamma': 5.733e-01}
+    },
+    "ANGIO PERIFERICA": {
+        "PIOMBO": {'alpha': 2.661, 'beta': 1.954e+01, 'gamma': 5.094e-01},
+        "CEMENTO": {'alpha': 4.219e-02, 'beta': 1.559e-01, 'gamma': 4.472e-01}
+    }
+}
+
+
+# Parametri di Fitting (Alfa, Beta, Gamma) per Barriera TC (RAMO 3)
+ATTENUATION_DATA_TC = {
+    "PIOMBO": {
+        "120 kVp": {'alpha': 2.246, 'beta': 8.95, 'gamma': 5.873e-01},
+        "140 kVp": {'alpha': 2.009, 'beta': 5.916, 'gamma':4.018e-01}
+    },
+    "CEMENTO": {
+        "120 kVp": {'alpha': 3.566e-02, 'beta': 7.109e-02, 'gamma': 6.073e-01},
+        "140 kVp": {'alpha': 3.345e-02, 'beta': 7.476e-02, 'gamma': 1.047}
+    }
+}
+
+# Fit di Archer del fascio primario a singolo kVp in mm^-1, usati per integrare la trasmissione su uno
+# spettro di carico dell'utente. Fonte: NCRP Report No. 147 (2004), Appendice A, Tab. A.1
+# (trasmissione del fascio primario attraverso piombo e calcestruzzo, fit di Archer et al.)
+ATTENUATION_DATA_KVP = {
+    "PIOMBO": {
+        50: {'alpha': 8.801, 'beta': 27.28, 'gamma': 0.2957},
+        70: {'alpha': 5.369, 'beta': 23.49, 'gamma': 0.5881},
+        100: {'alpha': 2.507, 'beta': 15.33, 'gamma': 0.9124},
+        125: {'alpha': 2.219, 'beta': 7.923, 'gamma': 0.5386},
+        150: {'alpha': 1.757, 'beta': 5.177, 'gamma': 0.3156},
+    },
+    "CEMENTO": {
+        50: {'alpha': 9.032e-02, 'beta': 1.712e-01, 'gamma': 0.2324},
+        70: {'alpha': 5.087e-02, 'beta': 1.696e-01, 'gamma': 0.3847},
+        100: {'alpha': 3.950e-02, 'beta': 8.440e-02, 'gamma': 0.5191},
+        125: {'alpha': 3.502e-02, 'beta': 7.113e-02, 'gamma': 0.6974},
+        150: {'alpha': 3.243e-02, 'beta': 8.599e-02, 'gamma': 0.9658},
+    },
+}
+
+
+# NUOVO DIZIONARIO PER LE SCELTE DELL'UTENTE (PRESHIELDING_XPRE_OPTIONS)
+# Spessore di Preshielding (Xpre) in mm (Tabella 4.6 - NCRP 147)
+PRESHIELDING_XPRE_OPTIONS = {
+    # Image receptor in table/holder attenuation by grid and cassette and image receptor
+    "NESSUNO (0.0 mm) - Table/Holder": 0.0,
+    "PIOMBO (0.85 mm) - Table/Holder": 0.85,
+    "CEMENTO (72.0 mm) - Table/Holder": 72.0,
+    "ACCIAIO (7.0 mm) - Table/Holder": 7.0,
+
+    # Cross-table lateral attenuation by grid and cassette only
+    "NESSUNO (0.0 mm) - Cross-Table Lateral": 0.0,
+    "PIOMBO (0.3 mm) - Cross-Table Lateral": 0.3,
+    "CEMENTO (30.0 mm) - Cross-Table Lateral": 30.0,
+    "ACCIAIO (2.0 mm) - Cross-Table Lateral": 2.0
+}
+
+# Mapping delle opzioni X_PRE per la logica dinamica
+X_PRE_TABLE_HOLDER_KEYS = [k for k in PRESHIELDING_XPRE_OPTIONS.keys() if "Table/Holder" in k]
+X_PRE_CROSS_TABLE_KEYS = [k for k in PRESHIELDING_XPRE_OPTIONS.keys() if "Cross-Table Lateral" in k]
+
+
+# DLP Fissi di Riferimento per il calcolo K1sec (Tabella 5.2 NCRP 147)
+# DLP [mGy*cm]
+DLP_TC_FIXED_VALUES = {
+    "HEAD": 1200, 
+    "BODY": 550, 
+}
+
+
+# Coefficienti di Kerma per TC (Tabella 5.2, parte inferiore)
+# Coefficiente di Kerma di diffusione per testa (cm^-1)
+K_HEAD_DIFF = 9.0e-5 # 9 x 10^-5 cm^-1
+# Coefficiente di Kerma di diffusione per corpo (cm^-1)
+K_BODY_DIFF = 3.0e-4 # 3 x 10^-4 cm^-1
+
+
+# ====================================================================
+# NUOVE MAPPATURE LOGICHE DEFINITE DALL'UTENTE
+# ====================================================================
+
+# Tutte le chiavi di KERMA_DATA da mostrare nella UI (include TUTTE BARRIERE)
+MODALITA_RADIOGRAFIA_UI_OPTIONS = list(KERMA_DATA.keys()) 
+
+# Chiavi che seguono la logica del RAMO 1 (Diagnostica Standard)
+RAMO_1_MODES = [
+    "STANZA RADIOGRAFICA (CHEST BUCKY)",
+    "STANZA RADIOGRAFICA (PIANO/ALTRE BARRIERE)",
+    "RADIOGRAFIA (TUBO R&F)",
+    "STANZA RADIOGRAFICA TORACE(CHEST ROOM)", 
+]
+
+# Chiavi che seguono la logica del RAMO 2 (Diagnostica Specializzata/Fluoro/Generica)
+RAMO_2_MODES = [
+    k for k in MODALITA_RADIOGRAFIA_UI_OPTIONS if k not in RAMO_1_MODES
+]
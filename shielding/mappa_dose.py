@@ -0,0 +1,116 @@
+"""
+Mappa di dose su planimetria: kerma da più sorgenti attraverso le pareti, valutato a blocchi.
+"""
+
+import numpy as np
+
+from .analitica import calcola_trasmissione_array
+from .coefficienti import COEFF_STORE
+
+
+# Distanza minima sorgente-cella (m): evita la singolarità 1/d^2 nelle celle della sorgente
+DOSE_MAP_D_MIN = 0.3
+
+# Numero di celle elaborate per blocco (memoria limitata indipendentemente dalla griglia)
+DOSE_MAP_CHUNK_CELLS = 262_144
+
+
+def _raggio_attraversa(sx, sy, px, py, segmento):
+    """
+    True dove il raggio dalla sorgente (sx, sy) ai punti (px, py) interseca il segmento (x1, y1, x2, y2):
+    i due estremi di ciascun segmento stanno da parti opposte della retta dell'altro.
+    Sul segmento il test è semiaperto: un raggio che passa per l'estremo comune di due barriere
+    contigue attraversa esattamente una delle due (nessuna fuga dagli angoli).
+    """
+    ax, ay, bx, by = segmento
+    lato_s = (bx - ax) * (sy - ay) - (by - ay) * (sx - ax)
+    lato_p = (bx - ax) * (py - ay) - (by - ay) * (px - ax)
+    lato_a = (px - sx) * (ay - sy) - (py - sy) * (ax - sx)
+    lato_b = (px - sx) * (by - sy) - (py - sy) * (bx - sx)
+    return (lato_s * lato_p < 0) & ((lato_a > 0) != (lato_b > 0))
+
+
+def _coefficienti_sorgenti_barriere(sorgenti, barriere):
+    """
+    Kerma a 1 m (K_val * U * N) di ogni sorgente e parametri (alpha, beta, gamma) di forma
+    (sorgenti, barriere, 3), con i coefficienti Primari/Secondari della modalità della sorgente
+    e il materiale della barriera.
+    """
+    K_1m = np.empty(len(sorgenti))
+    att_sb = np.empty((len(sorgenti), len(barriere), 3))
+    for i, s in enumerate(sorgenti):
+        modalita = s.get('modalita_radiografia')
+        i_mod = COEFF_STORE.modalita_id.get(modalita, -1)
+        if i_mod < 0:
+            raise ValueError(f"Modalità '{modalita}' non riconosciuta per la sorgente {i}.")
+        if s.get('tipo_barriera', "SECONDARIA") == "PRIMARIA":
+            K_val, U, att = COEFF_STORE.Kp1[i_mod], s.get('fattore_uso_U', 0.25), COEFF_STORE.att_primaria
+            if np.isnan(K_val):
+                raise ValueError(f"Dati Kp1 non definiti per la modalità '{modalita}' (sorgente {i}).")
+        else:
+            K_val, U, att = COEFF_STORE.Ksec1_Comb[i_mod], 1.0, COEFF_STORE.att_secondaria
+        K_1m[i] = K_val * U * s.get('pazienti_settimana_N', 100)
+
+        for j, b in enumerate(barriere):
+            i_mat = COEFF_STORE.materiale_id.get(b.get('materiale_schermatura'), -1)
+            if i_mat < 0:
+                raise ValueError(f"Materiale '{b.get('materiale_schermatura')}' non riconosciuto per la barriera {j}.")
+            att_sb[i, j] = att[i_mod, i_mat]
+    return K_1m, att_sb
+
+
+def calcola_mappa_kerma(sorgenti, barriere, x_lim, y_lim, passo_m, occupazione=1.0, chunk_celle=DOSE_MAP_CHUNK_CELLS):
+    """
+    Kerma settimanale schermato su una griglia 2D della planimetria, sommato su tutte le sorgenti.
+    - sorgenti: dizionari con 'x', 'y' [m], 'modalita_radiografia', 'tipo_barriera' (PRIMARIA/SECONDARIA),
+      'pazienti_settimana_N' e 'fattore_uso_U' (solo primaria, U = 1 per la secondaria);
+    - barriere: segmenti con 'x1', 'y1', 'x2', 'y2' [m], 'spessore_mm' e 'materiale_schermatura';
+    - occupazione: T scalare o array (ny, nx) della mappa di occupazione.
+    Un raggio sorgente-cella che attraversa una barriera è attenuato dalla sua B(spessore) (incidenza
+    normale, conservativo). Le celle sono elaborate a blocchi di chunk_celle.
+    Restituisce un dizionario con gli assi 'x', 'y' e le mappe 'kerma' e 'dose' (= kerma * T) in mGy/settimana.
+    """
+    x = np.arange(x_lim[0], x_lim[1] + 0.5 * passo_m, passo_m)
+    y = np.arange(y_lim[0], y_lim[1] + 0.5 * passo_m, passo_m)
+    nx, ny = len(x), len(y)
+    K_1m, att_sb = _coefficienti_sorgenti_barriere(sorgenti, barriere)
+    spessori = np.array([b.get('spessore_mm', 0.0) for b in barriere], dtype=float)
+    B = calcola_trasmissione_array(att_sb[..., 0], att_sb[..., 1], att_sb[..., 2], spessori[None, :])
+
+    pos_s = np.array([(s['x'], s['y']) for s in sorgenti], dtype=float).reshape(-1, 2)
+    seg = np.array([(b['x1'], b['y1'], b['x2'], b['y2']) for b in barriere], dtype=float).reshape(-1, 4)
+
+    kerma = np.empty(nx * ny)
+    for inizio in range(0, nx * ny, chunk_celle):
+        indici = np.arange(inizio, min(inizio + chunk_celle, nx * ny))
+        px, py = x[indici % nx], y[indici // nx]
+        somma = np.zeros(len(indici))
+
+        for i, (sx, sy) in enumerate(pos_s):
+            d = np.maximum(np.hypot(px - sx, py - sy), DOSE_MAP_D_MIN)
+            contributo = K_1m[i] / d ** 2
+            for j in range(len(seg)):
+                if B[i, j] >= 1.0:
+                    continue
+                contributo = np.where(_raggio_attraversa(sx, sy, px, py, seg[j]), contributo * B[i, j], contributo)
+            somma += contributo
+
+        kerma[indici] = somma
+
+    kerma = kerma.reshape(ny, nx)
+    return {'x': x, 'y': y, 'kerma': kerma, 'dose': kerma * np.asarray(occupazione, dtype=float)}
+
+
+def riduci_mappa_max(mappa, max_lato=500):
+    """
+    Riduce una mappa 2D per la visualizzazione prendendo il massimo di ogni blocco (gli hot spot restano visibili).
+    Restituisce (mappa_ridotta, fattore).
+    """
+    fattore = int(np.ceil(max(mappa.shape) / max_lato)) if max(mappa.shape) > max_lato else 1
+    if fattore == 1:
+        return mappa, 1
+    ny, nx = mappa.shape
+    pad = np.full((-(-ny // fattore) * fattore, -(-nx // fattore) * fattore), -np.inf)
+    pad[:ny, :nx] = mappa
+    ridotta = pad.reshape(pad.shape[0] // fattore, fattore, pad.shape[1] // fattore, fattore).max(axis=(1, 3))
+    return ridotta, fattore
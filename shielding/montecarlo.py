@@ -0,0 +1,184 @@
+"""
+Incertezza (Monte Carlo): propagazione delle distribuzioni degli input sullo spessore, a blocchi.
+"""
+
+import zlib
+
+import numpy as np
+import pandas as pd
+from scipy.special import ndtri
+
+from .batch import BATCH_COLUMN_DEFAULTS
+from .calcolo import run_shielding_calculation_array
+from .coefficienti import COEFF_STORE
+
+
+# Distribuzioni supportate e relativi parametri (campionate per CDF inversa da numeri uniformi)
+MC_DISTRIBUTIONS = {
+    'normale': ('media', 'sd'),
+    'lognormale': ('mediana', 'gsd'),
+    'uniforme': ('min', 'max'),
+    'triangolare': ('min', 'moda', 'max'),
+}
+
+# Limiti fisici dei parametri campionati (i campioni sono troncati a questi intervalli)
+MC_PARAM_LIMITS = {
+    'tasso_occupazione_T': (0.0, 1.0),
+    'fattore_uso_U': (0.0, 1.0),
+    'distanza_d': (0.1, np.inf),
+    'pazienti_settimana_N': (0.0, np.inf),
+    'weekly_n_head': (0.0, np.inf),
+    'weekly_n_body': (0.0, np.inf),
+    'contrast_factor': (1.0, np.inf),
+    'dlp_head_mGy_cm': (0.0, np.inf),
+    'dlp_body_mGy_cm': (0.0, np.inf),
+    'P_mSv_wk': (0.0, np.inf),
+    'X_PRE_mm': (0.0, np.inf),
+    'Wnorm': (0.0, np.inf),
+}
+
+MC_CHUNK_SIZE = 262_144
+MC_PERCENTILES = (50, 95, 99)
+
+
+def campiona_distribuzione(distribuzione, u):
+    """ Trasforma numeri uniformi u in (0, 1) nei campioni della distribuzione (tipo, parametri...). """
+    tipo, *parametri = distribuzione
+    if tipo == 'normale':
+        media, sd = parametri
+        return media + sd * ndtri(u)
+    if tipo == 'lognormale':
+        mediana, gsd = parametri
+        return mediana * gsd ** ndtri(u)
+    if tipo == 'uniforme':
+        a, b = parametri
+        return a + (b - a) * u
+    if tipo == 'triangolare':
+        a, c, b = parametri
+        f = (c - a) / (b - a) if b > a else 0.5
+        return np.where(u < f, a + np.sqrt(u * (b - a) * (c - a)), b - np.sqrt((1 - u) * (b - a) * (b - c)))
+    raise ValueError(f"Distribuzione '{tipo}' non riconosciuta (usare {', '.join(MC_DISTRIBUTIONS)}).")
+
+
+class IstogrammaStreaming:
+    """
+    Istogramma a memoria costante su [0, +inf) con larghezza dei bin adattiva: quando arriva un valore
+    oltre l'intervallo corrente i bin sono accorpati a coppie (intervallo raddoppiato).
+    I percentili sono interpolati nel bin, con errore massimo pari alla larghezza di un bin.
+    """
+
+    def __init__(self, n_bin=16384):
+        self.conteggi = np.zeros(n_bin, dtype=np.int64)
+        self.larghezza = None
+        self.n = 0
+        self.somma = 0.0
+        self.somma_quadrati = 0.0
+        self.minimo = np.inf
+        self.massimo = -np.inf
+
+    def aggiungi(self, valori):
+        valori = np.asarray(valori, dtype=float)
+        if valori.size == 0:
+            return
+        massimo = float(valori.max())
+        if self.larghezza is None:
+            self.larghezza = max(massimo, 1e-6) * 1.5 / len(self.conteggi)
+        while massimo >= self.larghezza * len(self.conteggi):
+            accorpati = self.conteggi.reshape(-1, 2).sum(axis=1)
+            self.conteggi[:] = 0
+            self.conteggi[:len(accorpati)] = accorpati
+            self.larghezza *= 2
+        indici = np.minimum((valori / self.larghezza).astype(np.int64), len(self.conteggi) - 1)
+        self.conteggi += np.bincount(indici, minlength=len(self.conteggi))
+        self.n += valori.size
+        self.somma += float(valori.sum())
+        self.somma_quadrati += float(np.square(valori).sum())
+        self.minimo = min(self.minimo, float(valori.min()))
+        self.massimo = max(self.massimo, massimo)
+
+    def percentile(self, q):
+        if self.n == 0:
+            return np.nan
+        cumulata = np.cumsum(self.conteggi)
+        obiettivo = q / 100 * self.n
+        k = int(np.searchsorted(cumulata, obiettivo))
+        precedenti = cumulata[k - 1] if k > 0 else 0
+        frazione = (obiettivo - precedenti) / self.conteggi[k] if self.conteggi[k] else 0.0
+        return float(np.clip((k + frazione) * self.larghezza, self.minimo, self.massimo))
+
+    def riepilogo(self, percentili=MC_PERCENTILES):
+        media = self.somma / self.n if self.n else np.nan
+        varianza = self.somma_quadrati / self.n - media ** 2 if self.n else np.nan
+        risultato = {f"P{q}": self.percentile(q) for q in percentili}
+        risultato.update({
+            'media': media,
+            'sd': float(np.sqrt(max(varianza, 0.0))),
+            'min': self.minimo,
+            'max': self.massimo,
+            'risoluzione_mm': self.larghezza,
+        })
+        return risultato
+
+
+def _seme_parametro(seme, parametro, blocco, barriera=None):
+    """ Semi indipendenti per parametro e blocco; con barriera=None i numeri sono comuni a tutte le barriere. """
+    chiave = [seme, zlib.crc32(parametro.encode()), blocco]
+    return chiave if barriera is None else chiave + [barriera]
+
+
+def mc_spessore(params, distribuzioni, n_campioni=1_000_000, seme=0, numeri_comuni=True, relativo=False,
+                barriera=0, chunk_size=MC_CHUNK_SIZE, istogramma=None):
+    """
+    Propagazione Monte Carlo dell'incertezza sugli input di una barriera.
+    distribuzioni: {parametro: (tipo, parametri...)} per le chiavi numeriche di params (N, U, T, d, P, ...)
+    e per 'Wnorm' (Ramo 1/2: il kerma è proporzionale al carico di lavoro, applicato come fattore su N).
+    Con relativo=True i campioni sono fattori moltiplicativi del valore nominale di ogni barriera
+    (es. ('normale', 1.0, 0.1) per un CV del 10%). I campioni sono generati e valutati a blocchi di chunk_size (memoria costante); con numeri_comuni=True
+    le stesse sequenze casuali sono riusate per tutte le barriere (Common Random Numbers).
+    Restituisce il riepilogo (P50/P95/P99, media, sd, ...) degli spessori validi, lo spessore nominale
+    e la frazione di campioni validi.
+    """
+    nominale = run_shielding_calculation_array(params)
+    if 'errore' in nominale:
+        raise ValueError(nominale['errore'])
+    if 'Wnorm' in distribuzioni and params.get('tipo_immagine') == "TC":
+        raise ValueError("Il carico di lavoro Wnorm non è definito per la TC (Ramo 3).")
+
+    wnorm_nominale = COEFF_STORE.Wnorm[COEFF_STORE.modalita_id.get(params.get('modalita_radiografia'), -1)]
+    istogramma = istogramma if istogramma is not None else IstogrammaStreaming()
+    n_validi = 0
+
+    for blocco, inizio in enumerate(range(0, n_campioni, chunk_size)):
+        n = min(chunk_size, n_campioni - inizio)
+        p = dict(params)
+        for parametro, distribuzione in distribuzioni.items():
+            rng = np.random.default_rng(_seme_parametro(seme, parametro, blocco, None if numeri_comuni else barriera))
+            campioni = campiona_distribuzione(distribuzione, rng.random(n))
+            if relativo:
+                campioni = campioni * (wnorm_nominale if parametro == 'Wnorm' else params.get(parametro, BATCH_COLUMN_DEFAULTS.get(parametro)))
+            p[parametro] = np.clip(campioni, *MC_PARAM_LIMITS.get(parametro, (-np.inf, np.inf)))
+        if 'Wnorm' in p:
+            # Kerma proporzionale al carico di lavoro: equivale a scalare N di Wnorm / Wnorm nominale
+            p['pazienti_settimana_N'] = p.get('pazienti_settimana_N', 100) * p.pop('Wnorm') / wnorm_nominale
+
+        risultato = run_shielding_calculation_array(p)
+        validi = risultato['spessore_valido']
+        istogramma.aggiungi(risultato['spessore_finale_mm'][validi])
+        n_validi += int(validi.sum())
+
+    riepilogo = istogramma.riepilogo()
+    riepilogo['nominale'] = float(nominale['spessore_finale_mm'])
+    riepilogo['frazione_valida'] = n_validi / n_campioni if n_campioni else np.nan
+    return riepilogo
+
+
+def mc_spessori_barriere(lista_params, distribuzioni, n_campioni=1_000_000, seme=0, numeri_comuni=True, relativo=True):
+    """
+    Esegue mc_spessore per più barriere (stesse distribuzioni, di default relative al valore nominale
+    di ciascuna; semi comuni se numeri_comuni=True) e restituisce un DataFrame con una riga di percentili per barriera.
+    """
+    righe = [
+        mc_spessore(params, distribuzioni, n_campioni, seme, numeri_comuni, relativo, barriera=i)
+        for i, params in enumerate(lista_params)
+    ]
+    return pd.DataFrame(righe)
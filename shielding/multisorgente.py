@@ -0,0 +1,114 @@
+"""
+Barriere multi-sorgente (stanza): una parete condivisa da più sorgenti.
+"""
+
+import numpy as np
+import pandas as pd
+
+from .analitica import (
+    SPESSORE_NON_VALIDO_MM,
+    calcola_kerma_incidente_array,
+    calcola_spessore_x_array,
+    risolvi_spessore_somma_array,
+)
+from .batch import _normalizza_tabella_barriere
+from .calcolo import CALC_ERROR_MESSAGES
+from .coefficienti import COEFF_STORE
+
+
+# Colonna che identifica la barriera (parete) a cui appartiene ogni contributo
+MULTISOURCE_WALL_COLUMN = 'barriera'
+
+
+def calculate_multisource_walls(df):
+    """
+    Calcolo a livello di stanza: ogni riga di df è un contributo (sorgente + componente PRIMARIA/SECONDARIA)
+    con la propria modalità, distanza d, U, N e X_PRE_mm; le righe con lo stesso valore di 'barriera'
+    schermano la stessa parete. P, T e materiale sono della parete (si usa la prima riga del gruppo).
+    Per ogni parete risolve un solo spessore x tale che
+        somma_i Ktu_i * B_i(x + Xpre_i) = P / T
+    in un'unica risoluzione vettoriale su tutte le pareti. Restituisce un DataFrame indicizzato per barriera.
+    """
+    df = _normalizza_tabella_barriere(df).reset_index(drop=True)
+    cod_parete, pareti = pd.factorize(df[MULTISOURCE_WALL_COLUMN])
+    n_pareti = len(pareti)
+    posizione = df.groupby(cod_parete).cumcount().to_numpy()
+    m = int(posizione.max()) + 1 if len(df) else 1
+
+    cod_mod = COEFF_STORE.ids_modalita(df['modalita_radiografia'])
+    cod_mat = COEFF_STORE.ids_materiale(df['materiale_schermatura'])
+    primaria = (df['tipo_barriera'] == "PRIMARIA").to_numpy()
+    secondaria = (df['tipo_barriera'] == "SECONDARIA").to_numpy()
+
+    # Materiale, P e T della parete dalla prima riga di ogni gruppo
+    prima_riga = np.flatnonzero(posizione == 0)[np.argsort(cod_parete[posizione == 0])]
+    mat_parete = cod_mat[prima_riga]
+    P = df['P_mSv_wk'].to_numpy(dtype=float)[prima_riga]
+    T = df['tasso_occupazione_T'].to_numpy(dtype=float)[prima_riga]
+
+    # Kerma non schermato e coefficienti di ogni contributo (U = 1 per la secondaria)
+    K_val = np.where(primaria, COEFF_STORE.Kp1[cod_mod], np.where(secondaria, COEFF_STORE.Ksec1_Comb[cod_mod], np.nan))
+    U = np.where(primaria, df['fattore_uso_U'].to_numpy(dtype=float), 1.0)
+    kerma = calcola_kerma_incidente_array(K_val, U, df['pazienti_settimana_N'].to_numpy(dtype=float), df['distanza_d'].to_numpy(dtype=float))
+    att = np.where(
+        primaria[:, None],
+        COEFF_STORE.att_primaria[cod_mod, mat_parete[cod_parete]],
+        COEFF_STORE.att_secondaria[cod_mod, mat_parete[cod_parete]],
+    )
+
+    # Primaria senza Kp1: errore nel Ramo 1; nel Ramo 2 il contributo è omesso (kerma nullo), come nel batch
+    ramo = COEFF_STORE.ramo[cod_mod]
+    senza_kp1 = primaria & np.isnan(K_val)
+    errore = np.zeros(n_pareti, dtype=np.int8)
+    np.maximum.at(errore, cod_parete, np.where(ramo == 0, 1, 0).astype(np.int8))
+    np.maximum.at(errore, cod_parete, np.where(~primaria & ~secondaria, ramo + 1, 0).astype(np.int8))
+    np.maximum.at(errore, cod_parete, np.where(senza_kp1 & (ramo == 1), 5, 0).astype(np.int8))
+    np.maximum.at(errore, cod_parete, np.where(np.isnan(att).any(axis=1) & ~senza_kp1, 6, 0).astype(np.int8))
+
+    # Matrici (pareti x contributi) con termini nulli per le posizioni vuote
+    K_mat = np.zeros((n_pareti, m))
+    att_mat = np.ones((n_pareti, m, 3))
+    Xpre_mat = np.zeros((n_pareti, m))
+    ok_riga = ~np.isnan(kerma) & ~np.isnan(att).any(axis=1)
+    K_mat[cod_parete[ok_riga], posizione[ok_riga]] = kerma[ok_riga]
+    att_mat[cod_parete[ok_riga], posizione[ok_riga]] = att[ok_riga]
+    Xpre_mat[cod_parete, posizione] = df['X_PRE_mm'].to_numpy(dtype=float)
+
+    kerma_totale = K_mat.sum(axis=1)
+    nullo = (kerma_totale * T == 0) | (P == 0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        obiettivo = P / T
+        spessore, valido = risolvi_spessore_somma_array(
+            K_mat, att_mat[..., 0], att_mat[..., 1], att_mat[..., 2], Xpre_mat, obiettivo,
+        )
+
+        # Confronto: massimo degli spessori delle singole sorgenti calcolate separatamente
+        x_singole, ok_singole = calcola_spessore_x_array(att_mat[..., 0], att_mat[..., 1], att_mat[..., 2], obiettivo[:, None] / K_mat)
+    x_singole = np.where(K_mat > 0, np.maximum(0.0, x_singole - Xpre_mat), 0.0)
+
+    spessore = np.where(valido, spessore, SPESSORE_NON_VALIDO_MM)
+    spessore = np.where(nullo | (errore > 0), 0.0, spessore)
+    valido = (valido | nullo) & (errore == 0)
+
+    return pd.DataFrame({
+        'n_sorgenti': np.bincount(cod_parete, minlength=n_pareti),
+        'materiale_schermatura': np.asarray(COEFF_STORE.materiali + ('',), dtype=object)[mat_parete],
+        'kerma_non_schermato': np.where(errore > 0, 0.0, kerma_totale),
+        'spessore_finale_mm': spessore,
+        'spessore_max_singola_sorgente_mm': np.where(nullo | (errore > 0), 0.0, x_singole.max(axis=1)),
+        'spessore_valido': valido,
+        'errore': pd.Categorical.from_codes(errore - 1, categories=CALC_ERROR_MESSAGES[1:]),
+    }, index=pd.Index(pareti, name=MULTISOURCE_WALL_COLUMN))
+
+
+def run_multisource_calculation(barriera, sorgenti):
+    """
+    Versione per una sola parete: barriera è un dizionario con P_mSv_wk, tasso_occupazione_T e
+    materiale_schermatura, sorgenti una lista di dizionari params (modalita_radiografia, tipo_barriera,
+    distanza_d, fattore_uso_U, pazienti_settimana_N, X_PRE_mm). Restituisce il dizionario dei risultati.
+    """
+    righe = [{**sorgente, **barriera, MULTISOURCE_WALL_COLUMN: 0} for sorgente in sorgenti]
+    risultato = calculate_multisource_walls(pd.DataFrame(righe)).iloc[0].to_dict()
+    if pd.isna(risultato['errore']):
+        del risultato['errore']
+    return risultato
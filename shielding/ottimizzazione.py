@@ -0,0 +1,121 @@
+"""
+Ottimizzazione degli spessori (costo / peso) con vincoli di dose nei punti di interesse.
+"""
+
+import numpy as np
+from scipy.optimize import minimize
+
+from .analitica import _log_trasmissione_e_derivata
+from .mappa_dose import DOSE_MAP_D_MIN, _coefficienti_sorgenti_barriere, _raggio_attraversa
+
+
+# Massa superficiale per mm di spessore [kg / (m^2 * mm)] (densità: piombo 11.35, calcestruzzo 2.35 g/cm^3)
+MATERIAL_MASS_KG_M2_MM = {"PIOMBO": 11.35, "CEMENTO": 2.35}
+
+# Altezza di default delle pareti [m] per il calcolo dell'area delle barriere
+WALL_HEIGHT_DEFAULT_M = 2.1
+
+# Spessore massimo di default per materiale [mm] (limite superiore dell'ottimizzazione)
+OPTIMIZER_X_MAX_MM = {"PIOMBO": 10.0, "CEMENTO": 600.0}
+
+OPTIMIZER_OBJECTIVES = ("massa", "costo")
+
+
+def _pesi_obiettivo(barriere, obiettivo):
+    """
+    Peso lineare di ogni barriera per mm di spessore: massa [kg/mm] (area * massa superficiale)
+    oppure costo (area * 'costo_m2_mm', da indicare per ogni barriera).
+    """
+    pesi = np.empty(len(barriere))
+    for j, b in enumerate(barriere):
+        area = np.hypot(b['x2'] - b['x1'], b['y2'] - b['y1']) * b.get('altezza_m', WALL_HEIGHT_DEFAULT_M)
+        if obiettivo == "massa":
+            pesi[j] = area * MATERIAL_MASS_KG_M2_MM[b['materiale_schermatura']]
+        elif obiettivo == "costo":
+            if 'costo_m2_mm' not in b:
+                raise ValueError(f"Costo 'costo_m2_mm' non indicato per la barriera {j}.")
+            pesi[j] = area * b['costo_m2_mm']
+        else:
+            raise ValueError(f"Obiettivo '{obiettivo}' non riconosciuto (usare {', '.join(OPTIMIZER_OBJECTIVES)}).")
+    return pesi
+
+
+def ottimizza_spessori(sorgenti, barriere, punti, obiettivo="massa", tol=1e-9):
+    """
+    Sceglie gli spessori di tutte le barriere della stanza/reparto minimizzando massa o costo complessivi,
+    con il vincolo che in ogni punto occupato la dose settimanale rispetti P:
+        somma_i K_1m_i / d_ik^2 * prod_j B_ij(x_j)  <=  P_k / T_k     (j = barriere attraversate dal raggio i->k)
+    sorgenti e barriere come in calcola_mappa_kerma (le barriere possono indicare 'spessore_min_mm',
+    'spessore_max_mm', 'altezza_m' e 'costo_m2_mm'); punti: dizionari con 'x', 'y', 'P_mSv_wk' e
+    'tasso_occupazione_T'. I vincoli sono espressi in forma logaritmica con jacobiano analitico (SLSQP).
+    Restituisce un dizionario con 'spessori_mm', 'obiettivo', 'dose_punti' (kerma * T), 'successo' e 'messaggio'.
+    """
+    if not barriere:
+        raise ValueError("Nessuna barriera da ottimizzare.")
+    pesi = _pesi_obiettivo(barriere, obiettivo)
+    K_1m, att = _coefficienti_sorgenti_barriere(sorgenti, barriere)
+    alpha, beta, gamma = att[..., 0], att[..., 1], att[..., 2]
+
+    seg = np.array([(b['x1'], b['y1'], b['x2'], b['y2']) for b in barriere], dtype=float)
+    px = np.array([p['x'] for p in punti], dtype=float)
+    py = np.array([p['y'] for p in punti], dtype=float)
+    T = np.array([p.get('tasso_occupazione_T', 1.0) for p in punti], dtype=float)
+    limite = np.array([p['P_mSv_wk'] for p in punti], dtype=float) / T
+
+    # Geometria: log(K_1m / d^2) per (sorgente, punto) e matrice di attraversamento A (sorgente, punto, barriera)
+    log_K = np.empty((len(sorgenti), len(punti)))
+    A = np.zeros((len(sorgenti), len(punti), len(barriere)))
+    for i, s in enumerate(sorgenti):
+        d = np.maximum(np.hypot(px - s['x'], py - s['y']), DOSE_MAP_D_MIN)
+        log_K[i] = np.log(K_1m[i]) - 2 * np.log(d)
+        for j in range(len(barriere)):
+            A[i, :, j] = _raggio_attraversa(s['x'], s['y'], px, py, seg[j])
+    log_limite = np.log(limite)
+
+    def _termini(x):
+        log_B, d_log_B = _log_trasmissione_e_derivata(alpha, beta, gamma, x[None, :])
+        log_t = log_K + np.einsum('ikj,ij->ik', A, log_B)
+        massimo = log_t.max(axis=0)
+        pesi_t = np.exp(log_t - massimo)
+        somma = pesi_t.sum(axis=0)
+        return massimo + np.log(somma), pesi_t / somma, d_log_B
+
+    def vincoli(x):
+        log_dose, _, _ = _termini(x)
+        return log_limite - log_dose
+
+    def jac_vincoli(x):
+        _, w, d_log_B = _termini(x)
+        return -np.einsum('ik,ikj,ij->kj', w, A, d_log_B)
+
+    x_min = np.array([b.get('spessore_min_mm', 0.0) for b in barriere], dtype=float)
+    x_max = np.array([b.get('spessore_max_mm', OPTIMIZER_X_MAX_MM[b['materiale_schermatura']]) for b in barriere], dtype=float)
+
+    # Punto di partenza ammissibile (tutte le barriere al massimo) se il problema lo consente
+    if np.any(vincoli(x_max) < 0):
+        return {
+            'spessori_mm': x_max,
+            'obiettivo': float(pesi @ x_max),
+            'dose_punti': np.exp(_termini(x_max)[0]) * T,
+            'successo': False,
+            'messaggio': "Vincoli non soddisfacibili neanche con gli spessori massimi (punti non schermati o P troppo basso).",
+        }
+
+    scala = pesi.max()
+    soluzione = minimize(
+        lambda x: pesi @ x / scala,
+        x_max,
+        jac=lambda x: pesi / scala,
+        method='SLSQP',
+        bounds=list(zip(x_min, x_max)),
+        constraints=[{'type': 'ineq', 'fun': vincoli, 'jac': jac_vincoli}],
+        options={'ftol': tol, 'maxiter': 500},
+    )
+    x = np.clip(soluzione.x, x_min, x_max)
+    return {
+        'spessori_mm': x,
+        'obiettivo': float(pesi @ x),
+        'dose_punti': np.exp(_termini(x)[0]) * T,
+        'successo': bool(soluzione.success and np.all(vincoli(x) >= -1e-6)),
+        'messaggio': soluzione.message,
+    }
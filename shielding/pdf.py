@@ -0,0 +1,95 @@
+"""
+Scrittura PDF minimale in streaming (solo libreria standard): pagine di testo e linee con i font standard
+Helvetica (codifica WinAnsi), scritte sul file una pagina alla volta.
+"""
+
+import zlib
+
+
+# Formato pagina in punti tipografici (1/72 di pollice)
+PDF_A4_ORIZZONTALE = (842.0, 595.0)
+
+# Larghezza media di un carattere Helvetica in frazioni della dimensione del font (troncamento dei testi)
+PDF_LARGHEZZA_CARATTERE = 0.52
+
+
+def _stringa_pdf(testo):
+    """ Stringa letterale PDF: barra rovescia e parentesi protette. """
+    return "(" + str(testo).replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)") + ")"
+
+
+def tronca(testo, larghezza, dimensione):
+    """ Tronca il testo (con '…') alla larghezza stimata in punti per la dimensione del font. """
+    testo = str(testo)
+    n_max = max(1, int(larghezza / (PDF_LARGHEZZA_CARATTERE * dimensione)))
+    return testo if len(testo) <= n_max else testo[:n_max - 1] + "…"
+
+
+class FlussoPagina:
+    """ Contenuto di una pagina (operatori PDF) costruito per chiamate successive e compresso con zlib. """
+
+    def __init__(self):
+        self._parti = []
+
+    def testo(self, x, y, testo, dimensione=8, grassetto=False):
+        self._parti.append(f"BT /{'F2' if grassetto else 'F1'} {dimensione:g} Tf {x:.1f} {y:.1f} Td {_stringa_pdf(testo)} Tj ET\n")
+
+    def linea(self, x0, y0, x1, y1, spessore=0.5):
+        self._parti.append(f"{spessore:g} w {x0:.1f} {y0:.1f} m {x1:.1f} {y1:.1f} l S\n")
+
+    def compresso(self):
+        """ Flusso compresso (FlateDecode); i caratteri fuori da WinAnsi diventano '?'. """
+        return zlib.compress("".join(self._parti).encode("cp1252", errors="replace"))
+
+
+class ScrittorePdf:
+    """
+    Documento PDF 1.4 scritto in streaming su un file binario: ogni pagina (flusso compresso di
+    FlussoPagina) è scritta subito; in memoria restano solo le posizioni degli oggetti per la tabella xref.
+    """
+
+    def __init__(self, file, formato=PDF_A4_ORIZZONTALE):
+        self._file = file
+        self._formato = formato
+        self._offset = 0
+        self._posizioni = {}
+        self._pagine = []
+        # Oggetti fissi: 1 catalogo, 2 albero delle pagine (scritto alla chiusura), 3-4 font
+        self._prossimo = 5
+        self._scrivi(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+        self._oggetto(1, b"<< /Type /Catalog /Pages 2 0 R >>")
+        for numero, font in ((3, b"Helvetica"), (4, b"Helvetica-Bold")):
+            self._oggetto(numero, b"<< /Type /Font /Subtype /Type1 /BaseFont /%s /Encoding /WinAnsiEncoding >>" % font)
+
+    @property
+    def n_pagine(self):
+        return len(self._pagine)
+
+    def _scrivi(self, dati):
+        self._file.write(dati)
+        self._offset += len(dati)
+
+    def _oggetto(self, numero, corpo):
+        self._posizioni[numero] = self._offset
+        self._scrivi(b"%d 0 obj\n%s\nendobj\n" % (numero, corpo))
+
+    def aggiungi_pagina(self, flusso):
+        """ Aggiunge una pagina dal flusso compresso (FlussoPagina.compresso()). """
+        contenuto, pagina = self._prossimo, self._prossimo + 1
+        self._prossimo += 2
+        self._oggetto(contenuto, b"<< /Length %d /Filter /FlateDecode >>\nstream\n%s\nendstream" % (len(flusso), flusso))
+        self._oggetto(pagina, (
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %g %g] "
+            b"/Resources << /Font << /F1 3 0 R /F2 4 0 R >> >> /Contents %d 0 R >>"
+        ) % (*self._formato, contenuto))
+        self._pagine.append(pagina)
+
+    def chiudi(self):
+        """ Scrive l'albero delle pagine, la tabella xref e il trailer (il file non viene chiuso). """
+        figli = b" ".join(b"%d 0 R" % p for p in self._pagine)
+        self._oggetto(2, b"<< /Type /Pages /Kids [%s] /Count %d >>" % (figli, len(self._pagine)))
+        inizio_xref = self._offset
+        n = self._prossimo
+        self._scrivi(b"xref\n0 %d\n0000000000 65535 f \n" % n)
+        self._scrivi(b"".join(b"%010d 00000 n \n" % self._posizioni[i] for i in range(1, n)))
+        self._scrivi(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (n, inizio_xref))
@@ -0,0 +1,58 @@
+"""
+Contatori di tempo per ramo di calcolo, disattivati di default (per profilazione).
+"""
+
+import threading
+from contextlib import contextmanager
+
+
+class ContatoriTempo:
+    """
+    Numero di chiamate, righe e tempo cumulato per chiave (es. ramo logico e tipo di barriera).
+    Da disattivati il costo per chiamata è la sola lettura di 'attivi'.
+    """
+
+    def __init__(self):
+        self.attivi = False
+        self._lock = threading.Lock()
+        self._contatori = {}
+
+    def registra(self, chiave, durata_s, righe=1):
+        with self._lock:
+            contatore = self._contatori.setdefault(chiave, [0, 0, 0.0])
+            contatore[0] += 1
+            contatore[1] += righe
+            contatore[2] += durata_s
+
+    def azzera(self):
+        with self._lock:
+            self._contatori.clear()
+
+    def riepilogo(self):
+        """ {chiave: {'chiamate', 'righe', 'totale_ms', 'medio_us_per_riga'}} ordinato per tempo totale. """
+        with self._lock:
+            voci = sorted(self._contatori.items(), key=lambda voce: -voce[1][2])
+        return {
+            chiave: {
+                'chiamate': chiamate,
+                'righe': righe,
+                'totale_ms': totale * 1e3,
+                'medio_us_per_riga': totale * 1e6 / righe if righe else 0.0,
+            }
+            for chiave, (chiamate, righe, totale) in voci
+        }
+
+    @contextmanager
+    def profila(self, azzera=True):
+        """ Attiva i contatori per la durata del blocco: with CONTATORI_RAMI.profila(): ... """
+        if azzera:
+            self.azzera()
+        precedente, self.attivi = self.attivi, True
+        try:
+            yield self
+        finally:
+            self.attivi = precedente
+
+
+# Contatori per ramo dei calcoli scalari (run_shielding_calculation) e batch (calculate_batch_chunk)
+CONTATORI_RAMI = ContatoriTempo()
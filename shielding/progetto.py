@@ -0,0 +1,310 @@
+"""
+Progetto con ricalcolo incrementale: ogni risultato registra l'impronta (hash) degli ingressi della barriera e
+delle righe di coefficienti NCRP 147 usate, così una modifica ricalcola soltanto le barriere interessate.
+"""
+
+import copy
+import hashlib
+
+import numpy as np
+import pandas as pd
+
+from . import dati
+from .batch import (
+    BATCH_BARRIER_COLUMN,
+    BATCH_COLUMN_ALIASES,
+    BATCH_COLUMN_DEFAULTS,
+    _normalizza_tabella_barriere,
+    calculate_batch_chunk,
+)
+from .coefficienti import CoefficientStore
+
+
+# Colonne delle impronte aggiunte ai risultati
+PROGETTO_HASH_INGRESSI = 'hash_ingressi'
+PROGETTO_HASH_COEFFICIENTI = 'hash_coefficienti'
+
+# Campi di KERMA_DATA usati dal calcolo (Wnorm non interviene: modificarlo non ricalcola nulla)
+PROGETTO_CAMPI_KERMA = ('Kp1', 'Ksec1_LeakSide', 'Ksec1_ForBack', 'Ksec1_Comb')
+
+# Cause di ricalcolo nel rapporto delle variazioni
+PROGETTO_CAUSE = ('nuova', 'ingressi', 'coefficienti')
+
+_COLONNE_CALCOLO = list(BATCH_COLUMN_DEFAULTS)
+
+# Moltiplicatore FNV-1a a 64 bit per combinare le impronte delle righe di coefficienti
+_FNV_PRIMO = np.uint64(0x100000001B3)
+
+
+def _hash_righe(valori):
+    """ Impronta a 64 bit di ogni riga dell'array (ultima dimensione) dei coefficienti. """
+    righe = np.ascontiguousarray(valori, dtype=float)
+    piatte = righe.reshape(-1, righe.shape[-1])
+    impronte = [int.from_bytes(hashlib.blake2b(r.tobytes(), digest_size=8).digest(), "little") for r in piatte]
+    return np.array(impronte, dtype=np.uint64).reshape(righe.shape[:-1])
+
+
+def _combina(*impronte):
+    """ Combina impronte uint64 (array broadcastabili) in stile FNV: l'ordine degli argomenti conta. """
+    risultato = np.zeros(np.broadcast_shapes(*(np.shape(h) for h in impronte)), dtype=np.uint64)
+    for h in impronte:
+        risultato ^= h
+        risultato *= _FNV_PRIMO
+    return risultato
+
+
+def _impronte(risultati, colonna, indice):
+    """ Impronte uint64 della colonna dei risultati per le barriere dell'indice (0 per quelle assenti). """
+    return risultati[colonna].astype(np.uint64).reindex(indice, fill_value=0).to_numpy()
+
+
+def _unisci(base, modifiche):
+    """ Aggiornamento ricorsivo di dizionari annidati (le chiavi assenti in modifiche restano invariate). """
+    for chiave, valore in modifiche.items():
+        if isinstance(valore, dict) and isinstance(base.get(chiave), dict):
+            _unisci(base[chiave], valore)
+        else:
+            base[chiave] = valore
+
+
+class ProgettoIncrementale:
+    """
+    Tabella di barriere con risultati e impronte per riga, indicizzata da 'barriera' (numero di riga da 1 se
+    la colonna manca). Le impronte sono due per barriera:
+      - hash_ingressi: colonne di calcolo della riga (BATCH_COLUMN_DEFAULTS), con pd.util.hash_pandas_object;
+      - hash_coefficienti: righe dei coefficienti usate dal ramo della barriera (campi di kerma e ramo della
+        modalità, fit Primario/Secondario per modalità e materiale, fit TC per materiale e kVp).
+    aggiorna_tabella(), modifica_barriere() e modifica_coefficienti() ricalcolano con calculate_batch_chunk
+    soltanto le barriere con impronte cambiate e restituiscono il rapporto delle variazioni di spessore.
+    I coefficienti sono una copia dei dati NCRP 147 (dati.py), modificabile senza toccare COEFF_STORE.
+    Con risultati (DataFrame salvato di un progetto precedente, con le colonne delle impronte) le barriere
+    con impronte invariate non sono ricalcolate.
+    """
+
+    def __init__(self, barriere, risultati=None):
+        self._dati = {
+            'kerma': copy.deepcopy(dati.KERMA_DATA),
+            'primaria': copy.deepcopy(dati.ATTENUATION_DATA_PRIMARY),
+            'secondaria': copy.deepcopy(dati.ATTENUATION_DATA_SECONDARY),
+            'tc': copy.deepcopy(dati.ATTENUATION_DATA_TC),
+        }
+        self._imposta_coefficienti(self._crea_coefficienti(self._dati))
+
+        self.barriere = self._prepara(barriere)
+        hash_ingressi = self._hash_ingressi(self.barriere)
+        self._codici = self._codifica(self.barriere)
+        hash_coefficienti = self._hash_coefficienti(self.barriere, self._codici)
+
+        if risultati is not None:
+            da_ricalcolare = (
+                ~self.barriere.index.isin(risultati.index)
+                | (_impronte(risultati, PROGETTO_HASH_INGRESSI, self.barriere.index) != hash_ingressi)
+                | (_impronte(risultati, PROGETTO_HASH_COEFFICIENTI, self.barriere.index) != hash_coefficienti)
+            )
+        if risultati is None or da_ricalcolare.all():
+            self.risultati = self._calcola(self.barriere)
+        else:
+            self.risultati = risultati.reindex(self.barriere.index)
+            self._ricalcola(
+                self.barriere.index[da_ricalcolare], 'ingressi',
+                hash_ingressi=hash_ingressi[da_ricalcolare], hash_coefficienti=hash_coefficienti[da_ricalcolare],
+            )
+        self.risultati[PROGETTO_HASH_INGRESSI] = hash_ingressi
+        self.risultati[PROGETTO_HASH_COEFFICIENTI] = hash_coefficienti
+
+    # --- Coefficienti ---
+
+    @staticmethod
+    def _crea_coefficienti(dati_progetto):
+        return CoefficientStore(
+            dati_progetto['kerma'], dati_progetto['primaria'], dati_progetto['secondaria'], dati_progetto['tc'],
+            dati.RAMO_1_MODES,
+        )
+
+    def _imposta_coefficienti(self, coefficienti):
+        """ Coefficienti del progetto e impronte delle loro righe (stessi indici di CoefficientStore). """
+        self.coefficienti = coefficienti
+        kerma = np.column_stack([getattr(coefficienti, campo) for campo in PROGETTO_CAMPI_KERMA] + [coefficienti.ramo])
+        self._hash_kerma = _hash_righe(kerma)
+        self._hash_primaria = _hash_righe(coefficienti.att_primaria)
+        self._hash_secondaria = _hash_righe(coefficienti.att_secondaria)
+        self._hash_tc = _hash_righe(coefficienti.att_tc)
+
+    def modifica_coefficienti(self, kerma=None, primaria=None, secondaria=None, tc=None):
+        """
+        Modifica i coefficienti del progetto con dizionari annidati parziali, nella forma di dati.py:
+        kerma {modalità: {campo: valore}}, primaria/secondaria {modalità: {materiale: {'alpha': ...}}},
+        tc {materiale: {kVp: {...}}}. Solleva ValueError (dati incompleti) senza modificare il progetto.
+        Ricalcola le barriere che usano le righe modificate; restituisce il rapporto delle variazioni.
+        """
+        nuovi = copy.deepcopy(self._dati)
+        for nome, modifiche in (('kerma', kerma), ('primaria', primaria), ('secondaria', secondaria), ('tc', tc)):
+            if modifiche:
+                _unisci(nuovi[nome], modifiche)
+        coefficienti = self._crea_coefficienti(nuovi)
+        self._dati = nuovi
+        self._imposta_coefficienti(coefficienti)
+        self._codici = self._codifica(self.barriere)
+
+        hash_coefficienti = self._hash_coefficienti(self.barriere, self._codici)
+        cambiate = hash_coefficienti != self.risultati[PROGETTO_HASH_COEFFICIENTI].to_numpy()
+        righe = self.barriere.index[cambiate]
+        return self._ricalcola(righe, 'coefficienti', hash_coefficienti=hash_coefficienti[cambiate])
+
+    # --- Barriere ---
+
+    @staticmethod
+    def _prepara(barriere):
+        """ Tabella normalizzata con tipi stabili per le impronte, indicizzata da 'barriera'. """
+        df = _normalizza_tabella_barriere(pd.DataFrame(barriere))
+        if BATCH_BARRIER_COLUMN in df.columns:
+            df = df.set_index(BATCH_BARRIER_COLUMN)
+        else:
+            df.index = pd.RangeIndex(1, len(df) + 1, name=BATCH_BARRIER_COLUMN)
+        if df.index.has_duplicates:
+            duplicati = df.index[df.index.duplicated()].unique()
+            raise ValueError("Identificativi di barriera duplicati: " + ", ".join(map(str, duplicati[:10])))
+        for col, default in BATCH_COLUMN_DEFAULTS.items():
+            df[col] = df[col].astype(object if isinstance(default, str) else float)
+        return df
+
+    @staticmethod
+    def _hash_ingressi(df):
+        return pd.util.hash_pandas_object(df[_COLONNE_CALCOLO], index=False).to_numpy()
+
+    def _codifica(self, df):
+        """ ID di modalità, materiale e kVp delle barriere nei coefficienti del progetto. """
+        return (
+            self.coefficienti.ids_modalita(df['modalita_radiografia']),
+            self.coefficienti.ids_materiale(df['materiale_schermatura']),
+            self.coefficienti.ids_kvp(df['kvp_tc']),
+        )
+
+    def _hash_coefficienti(self, df, codici):
+        """
+        Impronta delle righe di coefficienti usate dal ramo di ogni barriera: diagnostica (kerma e ramo della
+        modalità, fit Primario e, per le non Primarie, Secondario), TC (fit TC), altrimenti nessuna (0).
+        """
+        cod_mod, cod_mat, cod_kvp = codici
+        tipo_immagine = df['tipo_immagine'].to_numpy()
+        primaria = df['tipo_barriera'].to_numpy() == "PRIMARIA"
+        diagnostica = _combina(
+            self._hash_kerma[cod_mod],
+            self._hash_primaria[cod_mod, cod_mat],
+            np.where(primaria, np.uint64(0), self._hash_secondaria[cod_mod, cod_mat]),
+        )
+        return np.where(
+            tipo_immagine == "RADIOLOGIA DIAGNOSTICA", diagnostica,
+            np.where(tipo_immagine == "TC", self._hash_tc[cod_mat, cod_kvp], np.uint64(0)),
+        )
+
+    def _calcola(self, df):
+        return calculate_batch_chunk(df, coefficienti=self.coefficienti)
+
+    def aggiorna_tabella(self, barriere):
+        """
+        Sostituisce la tabella delle barriere: ricalcola le barriere nuove o con ingressi cambiati (impronte
+        confrontate per 'barriera') ed elimina quelle assenti. Restituisce il rapporto delle variazioni.
+        """
+        nuova = self._prepara(barriere)
+        hash_ingressi = self._hash_ingressi(nuova)
+        nuove = ~nuova.index.isin(self.barriere.index)
+        cambiate = ~nuove & (_impronte(self.risultati, PROGETTO_HASH_INGRESSI, nuova.index) != hash_ingressi)
+
+        rimosse = self.barriere.index.difference(nuova.index)
+        self.barriere = nuova
+        self._codici = self._codifica(nuova)
+        impronte = {col: _impronte(self.risultati, col, nuova.index) for col in (PROGETTO_HASH_INGRESSI, PROGETTO_HASH_COEFFICIENTI)}
+        self.risultati = self.risultati.reindex(nuova.index)
+        for col, valori in impronte.items():
+            self.risultati[col] = valori
+
+        report = [
+            self._ricalcola(nuova.index[nuove], 'nuova', hash_ingressi=hash_ingressi[nuove]),
+            self._ricalcola(nuova.index[cambiate], 'ingressi', hash_ingressi=hash_ingressi[cambiate]),
+        ]
+        if len(rimosse):
+            report.append(pd.DataFrame({'causa': 'rimossa'}, index=rimosse))
+        return pd.concat([r for r in report if len(r)] or report[:1])
+
+    def modifica_barriere(self, modifiche):
+        """
+        Modifica puntuale di barriere esistenti: modifiche è {barriera: {colonna: valore}} (oppure un
+        DataFrame indicizzato per barriera, con NaN per i valori invariati); colonne con i nomi della tabella
+        o gli alias di BATCH_COLUMN_ALIASES. Ricalcola solo le barriere con ingressi effettivamente cambiati;
+        restituisce il rapporto delle variazioni.
+        """
+        if isinstance(modifiche, pd.DataFrame):
+            modifiche = {
+                barriera: {col: v for col, v in riga.items() if not pd.isna(v)}
+                for barriera, riga in modifiche.to_dict('index').items()
+            }
+        mancanti = [b for b in modifiche if b not in self.barriere.index]
+        if mancanti:
+            raise KeyError(f"Barriere non presenti nel progetto: {', '.join(map(str, mancanti[:10]))}")
+        modifiche = {
+            barriera: {BATCH_COLUMN_ALIASES.get(col, col): valore for col, valore in valori.items()}
+            for barriera, valori in modifiche.items()
+        }
+        sconosciute = sorted({
+            col for valori in modifiche.values() for col in valori
+            if col not in BATCH_COLUMN_DEFAULTS and col not in self.barriere.columns
+        })
+        if sconosciute:
+            raise KeyError(f"Colonne non presenti nel progetto: {', '.join(sconosciute[:10])}")
+
+        # Conversione di tutti i valori prima di assegnarli: un valore non valido non lascia modifiche parziali
+        numeriche = {col for col, default in BATCH_COLUMN_DEFAULTS.items() if not isinstance(default, str)}
+        for barriera, valori in modifiche.items():
+            for col in valori.keys() & numeriche:
+                try:
+                    valori[col] = float(valori[col])
+                except (TypeError, ValueError):
+                    raise ValueError(
+                        f"Valore non numerico per '{col}' della barriera {barriera}: {valori[col]!r}"
+                    ) from None
+
+        for barriera, valori in modifiche.items():
+            for col, valore in valori.items():
+                self.barriere.at[barriera, col] = valore
+
+        righe = pd.Index(list(modifiche), name=self.barriere.index.name)
+        hash_ingressi = self._hash_ingressi(self.barriere.loc[righe])
+        cambiate = hash_ingressi != self.risultati.loc[righe, PROGETTO_HASH_INGRESSI].to_numpy()
+        return self._ricalcola(righe[cambiate], 'ingressi', hash_ingressi=hash_ingressi[cambiate])
+
+    def _ricalcola(self, righe, causa, hash_ingressi=None, hash_coefficienti=None):
+        """ Ricalcola le righe indicate, aggiorna risultati e impronte e restituisce il rapporto. """
+        precedenti = self.risultati.loc[righe, ['spessore_finale_mm', 'spessore_valido']]
+        if not len(righe):
+            return self._rapporto(righe, causa, precedenti, self.risultati.loc[righe])
+
+        df = self.barriere.loc[righe]
+        nuovi = self._calcola(df)
+        if hash_ingressi is None:
+            hash_ingressi = self.risultati.loc[righe, PROGETTO_HASH_INGRESSI].to_numpy()
+        if hash_coefficienti is None:
+            posizioni = self.barriere.index.get_indexer(righe)
+            hash_coefficienti = self._hash_coefficienti(df, tuple(c[posizioni] for c in self._codici))
+        nuovi[PROGETTO_HASH_INGRESSI] = hash_ingressi
+        nuovi[PROGETTO_HASH_COEFFICIENTI] = hash_coefficienti
+        self.risultati.loc[righe, nuovi.columns] = nuovi
+        # Righe nuove aggiunte con reindex: colonne tornate object (booleani) riportate al tipo dei risultati
+        for col, tipo in nuovi.dtypes.items():
+            if self.risultati[col].dtype != tipo:
+                self.risultati[col] = self.risultati[col].astype(tipo)
+        return self._rapporto(righe, causa, precedenti, nuovi)
+
+    @staticmethod
+    def _rapporto(righe, causa, precedenti, nuovi):
+        """ Rapporto delle variazioni: spessore precedente e nuovo, differenza, validità ed errore. """
+        spessore = nuovi['spessore_finale_mm'].to_numpy(dtype=float)
+        spessore_prec = precedenti['spessore_finale_mm'].to_numpy(dtype=float)
+        return pd.DataFrame({
+            'causa': causa,
+            'spessore_precedente_mm': spessore_prec,
+            'spessore_finale_mm': spessore,
+            'variazione_mm': spessore - spessore_prec,
+            'spessore_valido': nuovi['spessore_valido'].to_numpy(dtype=bool),
+            'errore': nuovi['errore'].to_numpy(dtype=object),
+        }, index=righe)
@@ -0,0 +1,373 @@
+"""
+Carico di lavoro TC (Ramo 3) da registri dosi: esportazioni RIS o DICOM dose report, in streaming.
+
+Il registro (CSV o Parquet, una riga per esame o per serie) è letto a blocchi. Ogni blocco è classificato
+Testa/Corpo e ridotto a somme per apparecchiatura, kVp TC e settimana: la memoria dipende dal numero di
+apparecchiature e di settimane, non dalla dimensione del file.
+Il riepilogo dà per apparecchiatura e kVp i campi TC di params (weekly_n_head/body, dlp_head/body_mGy_cm,
+contrast_factor, kvp_tc). N * DLP medio riproduce il DLP settimanale registrato, quindi K1sec e K_tu
+usano il carico reale al posto dei DLP fissi NCRP 147.
+"""
+
+import argparse
+import json
+import re
+import sys
+
+import numpy as np
+import pandas as pd
+
+from .coefficienti import COEFF_STORE
+from .dati import DLP_TC_FIXED_VALUES, K_BODY_DIFF, K_HEAD_DIFF
+
+
+REGISTRO_CHUNK_SIZE = 500_000
+
+# Colonne del registro: nome interno -> intestazioni accettate (confrontate senza maiuscole, spazi e segni)
+REGISTRO_COLONNE = {
+    'scanner': ('scanner', 'apparecchiatura', 'tomografo', 'stationname', 'station', 'devicename', 'sala'),
+    'data': ('data', 'dataesame', 'studydate', 'date', 'studydatetime', 'acquisitiondatetime'),
+    'dlp': ('dlp', 'dlpmgycm', 'dlptotale', 'totaldlp', 'dlptotal'),
+    'kvp': ('kvp', 'kv'),
+    'fantoccio': ('fantoccio', 'phantom', 'phantomtype', 'ctdiphantom', 'ctdiphantomtype'),
+    'regione': ('regione', 'distretto', 'bodypartexamined', 'bodypart'),
+    'protocollo': ('protocollo', 'protocolname', 'studydescription', 'descrizione', 'procedura'),
+    'contrasto': ('contrasto', 'mezzocontrasto', 'mdc', 'contrastbolusagent', 'contrast'),
+    'id_esame': ('idesame', 'accessionnumber', 'accession', 'studyinstanceuid', 'studyid'),
+}
+REGISTRO_COLONNE_OBBLIGATORIE = ('data', 'dlp')
+
+# Classificazione Testa/Corpo: fantoccio dosimetrico del CTDIvol (16 cm Testa, 32 cm Corpo), poi regione
+# anatomica, poi protocollo. Gli esami non classificabili sono Corpo (K1sec per DLP più alto, conservativo).
+REGISTRO_FANTOCCIO_TESTA = r"HEAD|TESTA|16"
+REGISTRO_FANTOCCIO_CORPO = r"BODY|CORPO|32"
+REGISTRO_PAROLE_TESTA = (
+    r"HEAD|BRAIN|SKULL|CRANI|ENCEFAL|TESTA|CAPO|CERVELLO|ORBIT|SINUS|SENI PARANASALI|ROCCHE|PETROUS|MASSICCIO"
+)
+
+# Valori della colonna del mezzo di contrasto che indicano un esame senza contrasto
+REGISTRO_CONTRASTO_ASSENTE = ('', 'NO', 'N', '0', 'FALSE', 'NONE', 'NESSUNO', 'NAN')
+
+# kVp assunto per le righe senza kVp
+REGISTRO_KVP_DEFAULT = 120
+
+REGISTRO_STATISTICHE = ('media', 'picco')
+
+# Somme accumulate per apparecchiatura, kVp e settimana
+_SOMME = ('esami_head', 'esami_body', 'dlp_head', 'dlp_body', 'dlp_contrasto', 'righe')
+
+
+def _normalizza_nome(nome):
+    return re.sub(r"[^a-z0-9]", "", str(nome).lower())
+
+
+def mappa_colonne_registro(colonne):
+    """ {intestazione del file: nome interno} per le colonne riconosciute (la prima per ogni nome interno). """
+    alias = {a: interno for interno, nomi in REGISTRO_COLONNE.items() for a in nomi}
+    mappa = {}
+    for colonna in colonne:
+        interno = alias.get(_normalizza_nome(colonna))
+        if interno is not None and interno not in mappa.values():
+            mappa[colonna] = interno
+    mancanti = [c for c in REGISTRO_COLONNE_OBBLIGATORIE if c not in mappa.values()]
+    if mancanti:
+        raise ValueError(
+            f"Colonne obbligatorie assenti nel registro dosi: {', '.join(mancanti)} "
+            f"(intestazioni accettate: {'; '.join(', '.join(REGISTRO_COLONNE[c]) for c in mancanti)})."
+        )
+    return mappa
+
+
+def iter_registro_dlp(source, chunk_size=REGISTRO_CHUNK_SIZE):
+    """
+    Legge il registro dosi a blocchi con le sole colonne riconosciute, rinominate con i nomi interni.
+    source può essere un DataFrame, un percorso/file CSV o un file Parquet (richiede pyarrow).
+    """
+    if isinstance(source, pd.DataFrame):
+        mappa = mappa_colonne_registro(source.columns)
+        for start in range(0, len(source), chunk_size):
+            yield source.iloc[start:start + chunk_size][list(mappa)].rename(columns=mappa)
+        return
+
+    nome = str(getattr(source, 'name', source))
+    if nome.lower().endswith(('.parquet', '.pq')):
+        try:
+            import pyarrow.parquet as pq
+        except ImportError as exc:
+            raise ImportError("La lettura di file Parquet richiede il pacchetto 'pyarrow'.") from exc
+        file_parquet = pq.ParquetFile(source)
+        mappa = mappa_colonne_registro(file_parquet.schema_arrow.names)
+        for batch in file_parquet.iter_batches(batch_size=chunk_size, columns=list(mappa)):
+            yield batch.to_pandas().rename(columns=mappa)
+        return
+
+    intestazioni = pd.read_csv(source, nrows=0).columns
+    if hasattr(source, 'seek'):
+        source.seek(0)
+    mappa = mappa_colonne_registro(intestazioni)
+    # Testi con tipi stabili tra blocchi; categorie per quelli con pochi valori distinti (classificati una volta)
+    tipi = {
+        c: str if interno in ('id_esame', 'data') else 'category'
+        for c, interno in mappa.items() if interno not in ('dlp', 'kvp')
+    }
+    for blocco in pd.read_csv(source, usecols=list(mappa), dtype=tipi, chunksize=chunk_size):
+        yield blocco.rename(columns=mappa)
+
+
+def _contiene(serie, motivo):
+    """ Righe il cui testo contiene il motivo (regex, senza maiuscole); valutato sui soli valori distinti. """
+    codici, valori = pd.factorize(serie)
+    esito = pd.Index(valori).astype(str).str.contains(motivo, case=False, regex=True)
+    return np.append(np.asarray(esito, dtype=bool), False)[codici]
+
+
+def classifica_testa(blocco):
+    """ Array booleano degli esami di Testa (fantoccio, poi regione, poi protocollo; altrimenti Corpo). """
+    n = len(blocco)
+    testa = np.zeros(n, dtype=bool)
+    deciso = np.zeros(n, dtype=bool)
+    if 'fantoccio' in blocco:
+        fantoccio_testa = _contiene(blocco['fantoccio'], REGISTRO_FANTOCCIO_TESTA)
+        testa |= fantoccio_testa
+        deciso |= fantoccio_testa | _contiene(blocco['fantoccio'], REGISTRO_FANTOCCIO_CORPO)
+    for colonna in ('regione', 'protocollo'):
+        if colonna in blocco:
+            testa |= _contiene(blocco[colonna], REGISTRO_PAROLE_TESTA) & ~deciso
+            deciso |= blocco[colonna].notna().to_numpy()
+    return testa
+
+
+def _con_contrasto(serie):
+    """ Righe con mezzo di contrasto (colonna booleana/numerica o nome dell'agente). """
+    if pd.api.types.is_bool_dtype(serie) or pd.api.types.is_numeric_dtype(serie):
+        return serie.fillna(0).to_numpy(dtype=float) != 0
+    codici, valori = pd.factorize(serie)
+    assente = pd.Index(valori).astype(str).str.strip().str.upper().isin(REGISTRO_CONTRASTO_ASSENTE)
+    return np.append(~np.asarray(assente, dtype=bool), False)[codici]
+
+
+def _settimane(serie):
+    """
+    Indice della settimana (da lunedì, dal 1970) per riga; -1 per date non leggibili.
+    Formati: ISO 8601, DICOM (AAAAMMGG, anche con l'ora) e GG/MM/AAAA.
+    """
+    codici, valori = pd.factorize(serie)
+    testo = pd.Index(valori).astype(str)
+    date = pd.to_datetime(testo, format='ISO8601', errors='coerce', utc=True)
+    for formato in ('%Y%m%d', '%d/%m/%Y'):
+        mancanti = date.isna()
+        if not mancanti.any():
+            break
+        date = date.where(~mancanti, pd.to_datetime(testo, format=formato, exact=False, errors='coerce', utc=True))
+    date = date.tz_convert(None)
+    giorni = date.to_numpy(dtype='datetime64[D]').astype(np.int64)
+    # 1970-01-01 è un giovedì: +3 giorni allinea le settimane al lunedì
+    settimane = np.where(date.isna(), -1, (giorni + 3) // 7)
+    return np.append(settimane, -1)[codici]
+
+
+def _kvp_tabulati():
+    """ (kVp numerici crescenti, etichette kvp_tc corrispondenti) delle tabelle di attenuazione TC. """
+    coppie = sorted((float(re.match(r"\s*([\d.]+)", k).group(1)), k) for k in COEFF_STORE.kvp)
+    return np.array([v for v, _ in coppie]), [k for _, k in coppie]
+
+
+def _codici_kvp(serie, valori_tabulati):
+    """
+    Indice (in valori_tabulati) del kVp tabulato più basso non inferiore a quello registrato: il fit a kVp
+    più alto è più penetrante, quindi conservativo. Oltre il massimo tabulato è usato il massimo.
+    """
+    if serie is None:
+        kvp = np.full(1, float(REGISTRO_KVP_DEFAULT))
+    elif pd.api.types.is_numeric_dtype(serie):
+        kvp = serie.to_numpy(dtype=float)
+    else:
+        kvp = pd.to_numeric(serie.astype(str).str.extract(r"([\d.]+)", expand=False), errors='coerce').to_numpy()
+    kvp = np.where(np.isnan(kvp), REGISTRO_KVP_DEFAULT, kvp)
+    return np.minimum(np.searchsorted(valori_tabulati, kvp, side='left'), len(valori_tabulati) - 1)
+
+
+class AggregatoreRegistroDLP:
+    """
+    Somme in streaming del registro dosi per (apparecchiatura, kVp TC, settimana): numero di esami e DLP
+    di Testa e Corpo, DLP con mezzo di contrasto, righe. Con la colonna id_esame (registro per serie) le
+    righe consecutive dello stesso esame e della stessa classe contano come un solo esame; il DLP è sommato
+    su tutte le righe, quindi il DLP settimanale è esatto anche se il registro non è ordinato per esame.
+    """
+
+    def __init__(self):
+        self.kvp_valori, self.kvp_etichette = _kvp_tabulati()
+        self._parziali = []
+        self._ultimo_esame = None
+        self.righe_lette = 0
+        self.righe_scartate = 0
+
+    def aggiungi(self, blocco):
+        """ Aggiunge un blocco del registro (colonne con i nomi interni, vedi iter_registro_dlp). """
+        n = len(blocco)
+        if n == 0:
+            return
+        self.righe_lette += n
+        dlp = pd.to_numeric(blocco['dlp'], errors='coerce').to_numpy(dtype=float)
+        settimana = _settimane(blocco['data'])
+        testa = classifica_testa(blocco)
+        contrasto = _con_contrasto(blocco['contrasto']) if 'contrasto' in blocco else np.zeros(n, dtype=bool)
+        kvp = np.broadcast_to(_codici_kvp(blocco.get('kvp'), self.kvp_valori), n)
+        if 'scanner' in blocco:
+            scanner, nomi_scanner = pd.factorize(blocco['scanner'], use_na_sentinel=False)
+            nomi_scanner = pd.Index(nomi_scanner, dtype=object).fillna("N/D").astype(str)
+        else:
+            scanner, nomi_scanner = np.zeros(n, dtype=np.int64), pd.Index(["TC"])
+
+        # Nuovo esame: ogni riga, o (con id_esame) cambio di identificativo o di classe Testa/Corpo
+        nuovo = np.ones(n, dtype=bool)
+        if 'id_esame' in blocco:
+            ident, valori = pd.factorize(blocco['id_esame'])
+            mancante = ident < 0
+            nuovo[1:] = (ident[1:] != ident[:-1]) | (testa[1:] != testa[:-1]) | mancante[1:]
+            # Identificativi vuoti (anche un blocco senza alcun id): ogni riga è un esame
+            nuovo[0] = mancante[0] or self._ultimo_esame != (valori[ident[0]], testa[0])
+            self._ultimo_esame = None if mancante[-1] else (valori[ident[-1]], testa[-1])
+
+        valide = (settimana >= 0) & np.isfinite(dlp) & (dlp >= 0)
+        self.righe_scartate += int(n - valide.sum())
+        dlp = np.where(valide, dlp, 0.0)
+        parziale = pd.DataFrame({
+            'scanner': scanner, 'kvp': kvp, 'settimana': settimana,
+            'esami_head': nuovo & testa, 'esami_body': nuovo & ~testa,
+            'dlp_head': dlp * testa, 'dlp_body': dlp * ~testa, 'dlp_contrasto': dlp * contrasto,
+            'righe': np.ones(n, dtype=np.int64),
+        })[valide]
+        somme = parziale.groupby(['scanner', 'kvp', 'settimana'], sort=False).sum()
+        somme.index = somme.index.set_levels(nomi_scanner[somme.index.levels[0]], level='scanner')
+        self._parziali.append(somme)
+        if len(self._parziali) >= 32:
+            self._parziali = [self.somme_settimanali()]
+
+    def somme_settimanali(self):
+        """ DataFrame delle somme indicizzato per (scanner, kvp, settimana). """
+        if not self._parziali:
+            indice = pd.MultiIndex.from_arrays([[], [], []], names=['scanner', 'kvp', 'settimana'])
+            return pd.DataFrame({c: [] for c in _SOMME}, index=indice)
+        return pd.concat(self._parziali).groupby(level=['scanner', 'kvp', 'settimana']).sum()
+
+    def riepilogo(self, settimane=None, statistica='media'):
+        """
+        Carico settimanale per apparecchiatura e kVp TC (una riga ciascuno) con i campi TC di params.
+        settimane: durata del periodo registrato; di default, dalla prima all'ultima settimana con esami
+        dell'apparecchiatura. statistica 'media' (somme / settimane) o 'picco' (settimana con il kerma a 1 m
+        più alto dell'apparecchiatura). contrast_factor è 1.0: il DLP registrato include già le fasi con
+        contrasto, la cui quota è riportata in frazione_dlp_contrasto.
+        """
+        if statistica not in REGISTRO_STATISTICHE:
+            raise ValueError(f"Statistica '{statistica}' non riconosciuta (usare {', '.join(REGISTRO_STATISTICHE)}).")
+        somme = self.somme_settimanali()
+        if somme.empty:
+            raise ValueError("Il registro dosi non contiene esami con data e DLP validi.")
+        kerma_1m = K_HEAD_DIFF * somme['dlp_head'] + 1.2 * K_BODY_DIFF * somme['dlp_body']
+
+        per_scanner = somme.index.to_frame(index=False).groupby('scanner')['settimana']
+        if settimane is None:
+            durata = per_scanner.max() - per_scanner.min() + 1
+        else:
+            durata = pd.Series(float(settimane), index=per_scanner.max().index)
+
+        if statistica == 'media':
+            totali = somme.groupby(level=['scanner', 'kvp']).sum()
+            divisore = durata.reindex(totali.index.get_level_values('scanner')).to_numpy(dtype=float)
+        else:
+            settimanale = kerma_1m.groupby(level=['scanner', 'settimana']).sum()
+            picco = settimanale.groupby(level='scanner').idxmax().str[1]
+            indice = somme.index
+            nel_picco = indice.get_level_values('settimana') == picco.reindex(indice.get_level_values('scanner')).to_numpy()
+            totali = somme[nel_picco].droplevel('settimana')
+            divisore = np.ones(len(totali))
+
+        scanner = totali.index.get_level_values('scanner')
+        kvp = totali.index.get_level_values('kvp').to_numpy()
+        esami_head = totali['esami_head'].to_numpy(dtype=float)
+        esami_body = totali['esami_body'].to_numpy(dtype=float)
+        dlp_head = totali['dlp_head'].to_numpy(dtype=float)
+        dlp_body = totali['dlp_body'].to_numpy(dtype=float)
+        dlp_totale = dlp_head + dlp_body
+        with np.errstate(divide='ignore', invalid='ignore'):
+            riepilogo = pd.DataFrame({
+                'scanner': scanner,
+                'kvp_tc': [self.kvp_etichette[k] for k in kvp],
+                'settimane': durata.reindex(scanner).to_numpy(dtype=float),
+                'esami_head': esami_head,
+                'esami_body': esami_body,
+                'weekly_n_head': esami_head / divisore,
+                'weekly_n_body': esami_body / divisore,
+                'dlp_head_mGy_cm': np.where(esami_head > 0, dlp_head / esami_head, DLP_TC_FIXED_VALUES["HEAD"]),
+                'dlp_body_mGy_cm': np.where(esami_body > 0, dlp_body / esami_body, DLP_TC_FIXED_VALUES["BODY"]),
+                'contrast_factor': 1.0,
+                'frazione_dlp_contrasto': np.where(dlp_totale > 0, totali['dlp_contrasto'].to_numpy() / dlp_totale, 0.0),
+                'kerma_1m_mGy_wk': (K_HEAD_DIFF * dlp_head + 1.2 * K_BODY_DIFF * dlp_body) / divisore,
+                'righe': totali['righe'].to_numpy(dtype=np.int64),
+            })
+        return riepilogo.sort_values(['scanner', 'kvp_tc'], ignore_index=True)
+
+
+def carico_tc_da_registro(source, chunk_size=REGISTRO_CHUNK_SIZE, settimane=None, statistica='media'):
+    """
+    Legge il registro dosi (DataFrame, CSV o Parquet) a blocchi e restituisce il riepilogo del carico TC
+    per apparecchiatura e kVp (vedi AggregatoreRegistroDLP.riepilogo).
+    """
+    aggregatore = AggregatoreRegistroDLP()
+    for blocco in iter_registro_dlp(source, chunk_size):
+        aggregatore.aggiungi(blocco)
+    return aggregatore.riepilogo(settimane, statistica)
+
+
+def params_carico_tc(carico, scanner, kvp_tc=None):
+    """
+    Campi TC di params (weekly_n_head/body, dlp_head/body_mGy_cm, contrast_factor, kvp_tc) per
+    un'apparecchiatura del riepilogo. Senza kvp_tc il carico di tutti i kVp è sommato e attribuito al kVp
+    più alto registrato (conservativo); il DLP settimanale totale è conservato.
+    """
+    righe = carico[carico['scanner'] == scanner]
+    if kvp_tc is not None:
+        righe = righe[righe['kvp_tc'] == kvp_tc]
+    if righe.empty:
+        raise ValueError(f"Apparecchiatura '{scanner}' (kVp {kvp_tc or 'tutti'}) assente nel riepilogo del registro dosi.")
+
+    params = {'kvp_tc': righe['kvp_tc'].iloc[-1] if kvp_tc is None else kvp_tc, 'contrast_factor': 1.0}
+    for classe, fisso in (('head', DLP_TC_FIXED_VALUES["HEAD"]), ('body', DLP_TC_FIXED_VALUES["BODY"])):
+        n = righe[f'weekly_n_{classe}']
+        n_totale = float(n.sum())
+        params[f'weekly_n_{classe}'] = n_totale
+        params[f'dlp_{classe}_mGy_cm'] = float((n * righe[f'dlp_{classe}_mGy_cm']).sum() / n_totale) if n_totale > 0 else fisso
+    return params
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m shielding.registro_dlp",
+        description="Carico di lavoro TC settimanale per apparecchiatura e kVp da un registro dosi (RIS/DICOM).",
+    )
+    parser.add_argument("registro", help="file CSV o Parquet del registro dosi (una riga per esame o per serie)")
+    parser.add_argument("--settimane", type=float, help="durata del periodo registrato (default: dalla prima all'ultima settimana)")
+    parser.add_argument("--picco", action="store_true", help="usa la settimana di carico massimo invece della media")
+    parser.add_argument("--chunk-size", type=int, default=REGISTRO_CHUNK_SIZE, help="righe per blocco")
+    parser.add_argument(
+        "--params", metavar="JSON",
+        help="parametri di base (oggetto JSON): scrive una riga JSON Lines di params per apparecchiatura, "
+             "da elaborare con python -m shielding",
+    )
+    args = parser.parse_args(argv)
+
+    carico = carico_tc_da_registro(
+        args.registro, args.chunk_size, args.settimane, 'picco' if args.picco else 'media',
+    )
+    if args.params is None:
+        carico.to_csv(sys.stdout, index=False)
+        return 0
+    base = json.loads(args.params)
+    for scanner in carico['scanner'].unique():
+        sys.stdout.write(json.dumps({**base, 'scanner': scanner, **params_carico_tc(carico, scanner)}, ensure_ascii=False) + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
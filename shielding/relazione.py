@@ -0,0 +1,342 @@
+"""
+Relazioni di schermatura per impianto dai risultati batch: cartella Excel a più fogli e pagine PDF per stanza.
+
+    python -m shielding.relazione barriere.csv --xlsx relazione.xlsx --pdf relazione.pdf
+
+La tabella delle barriere è letta ed elaborata a blocchi (come write_batch_results) e i due file sono
+scritti in streaming: le righe Excel con XlsxWriter in modalità constant_memory (pacchetto opzionale
+'xlsxwriter'), le pagine PDF con shielding.pdf, generate per stanza in un pool di processi.
+"""
+
+import argparse
+import datetime
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from .batch import (
+    BATCH_CHUNK_SIZE,
+    BATCH_FACILITY_COLUMN,
+    BATCH_ROOM_COLUMN,
+    iter_barrier_table,
+    tabella_ingressi_risultati,
+)
+from .cache_persistente import versione_coefficienti
+from .pdf import PDF_A4_ORIZZONTALE, FlussoPagina, ScrittorePdf, tronca
+
+
+# Tabella PDF per stanza: (colonna, intestazione, larghezza in punti); 'esito' è derivata da errore/validità
+REPORT_PDF_COLONNE = (
+    ('barriera', "Barriera", 70),
+    ('tipo_barriera', "Tipo", 52),
+    ('modalita_radiografia', "Modalità", 118),
+    ('materiale_schermatura', "Materiale", 50),
+    ('P_mSv_wk', "P [mSv/wk]", 42),
+    ('tasso_occupazione_T', "T", 28),
+    ('distanza_d', "d [m]", 30),
+    ('fattore_uso_U', "U", 28),
+    ('pazienti_settimana_N', "N [paz/wk]", 44),
+    ('kerma_non_schermato', "K_tu [mGy/wk]", 56),
+    ('trasmittanza_B', "B", 48),
+    ('Xref_mm', "Xref [mm]", 42),
+    ('X_PRE_mm', "Xpre [mm]", 42),
+    ('spessore_finale_mm', "X [mm]", 40),
+    ('esito', "Esito", 80),
+)
+REPORT_RIGHE_PAGINA = 32
+REPORT_MARGINE_PT = 36
+
+# Stanze di un blocco sotto le quali le pagine sono generate nel processo principale (senza pool)
+REPORT_MIN_STANZE_PROCESSI = 64
+
+# Righe di dati per foglio Excel (limite del formato: 1 048 576 righe, intestazione inclusa)
+REPORT_XLSX_MAX_RIGHE = 1_048_575
+
+# Campi passati ai processi per ogni riga della tabella PDF
+_CAMPI_PDF = [col for col, _, _ in REPORT_PDF_COLONNE if col != 'esito'] + [
+    'tipo_immagine', 'kvp_tc', 'weekly_n_head', 'weekly_n_body', 'spessore_valido', 'errore',
+]
+
+
+def _numero(valore, formato):
+    return "-" if valore is None or valore != valore else format(valore, formato)
+
+
+def _celle_riga(r):
+    """ Testi delle celle PDF di una barriera (dizionario dei _CAMPI_PDF). """
+    tc = r['tipo_immagine'] == "TC"
+    if r['errore']:
+        esito = r['errore']
+    elif not r['spessore_valido']:
+        esito = "Non calcolabile"
+    else:
+        esito = "OK"
+    calcolata = not r['errore']
+    return (
+        str(r['barriera']),
+        r['tipo_barriera'],
+        f"TC {r['kvp_tc']}" if tc else r['modalita_radiografia'],
+        r['materiale_schermatura'],
+        _numero(r['P_mSv_wk'], '.3g'),
+        _numero(r['tasso_occupazione_T'], '.3g'),
+        _numero(r['distanza_d'], '.2f'),
+        "-" if tc else _numero(r['fattore_uso_U'], '.3g') if r['tipo_barriera'] == "PRIMARIA" else "1",
+        f"{r['weekly_n_head']:g}+{r['weekly_n_body']:g}" if tc else _numero(r['pazienti_settimana_N'], 'g'),
+        _numero(r['kerma_non_schermato'], '.3e') if calcolata else "-",
+        _numero(r['trasmittanza_B'], '.3e') if calcolata else "-",
+        _numero(r['Xref_mm'], '.2f') if calcolata else "-",
+        _numero(r['X_PRE_mm'], '.2f'),
+        _numero(r['spessore_finale_mm'], '.2f') if calcolata else "-",
+        esito,
+    )
+
+
+def _pagine_stanza(compito):
+    """
+    Pagine PDF (flussi compressi) di una stanza; compito = (impianto, stanza, righe, piè di pagina), con
+    righe tuple dei _CAMPI_PDF. Funzione di modulo: eseguita nei processi del pool.
+    """
+    impianto, stanza, righe, piede = compito
+    celle = [_celle_riga(dict(zip(_CAMPI_PDF, riga))) for riga in righe]
+    larghezza, altezza = PDF_A4_ORIZZONTALE
+    margine = REPORT_MARGINE_PT
+    n_pagine = max(1, -(-len(celle) // REPORT_RIGHE_PAGINA))
+
+    pagine = []
+    for i in range(n_pagine):
+        pagina = FlussoPagina()
+        y = altezza - margine - 14
+        pagina.testo(margine, y, "Relazione di schermatura NCRP 147", 14, grassetto=True)
+        y -= 18
+        pagina.testo(
+            margine, y,
+            f"Impianto: {impianto or '-'}    Stanza: {stanza or '-'}    Barriere: {len(celle)}    Pagina {i + 1}/{n_pagine}", 9,
+        )
+        y -= 24
+        x = margine
+        for _, intestazione, w in REPORT_PDF_COLONNE:
+            pagina.testo(x, y, tronca(intestazione, w - 2, 7), 7, grassetto=True)
+            x += w
+        pagina.linea(margine, y - 4, larghezza - margine, y - 4)
+
+        for riga in celle[i * REPORT_RIGHE_PAGINA:(i + 1) * REPORT_RIGHE_PAGINA]:
+            y -= 13
+            x = margine
+            for testo, (_, _, w) in zip(riga, REPORT_PDF_COLONNE):
+                pagina.testo(x, y, tronca(testo, w - 2, 7), 7)
+                x += w
+        pagina.linea(margine, y - 5, larghezza - margine, y - 5)
+        pagina.testo(margine, margine - 12, piede, 7)
+        pagine.append(pagina.compresso())
+    return pagine
+
+
+def _riepilogo_blocco(blocco):
+    """ Aggregati per stanza di un blocco (sommabili / massimizzabili tra blocchi). """
+    valido = blocco['spessore_valido'].to_numpy()
+    errore = blocco['errore'].notna().to_numpy()
+    parti = pd.DataFrame({
+        BATCH_FACILITY_COLUMN: blocco[BATCH_FACILITY_COLUMN].to_numpy(),
+        BATCH_ROOM_COLUMN: blocco[BATCH_ROOM_COLUMN].to_numpy(),
+        'Barriere': 1,
+        'Errori': errore,
+        'Non calcolabili': ~valido & ~errore,
+        'K_tu max [mGy/wk]': np.where(errore, np.nan, blocco['kerma_non_schermato'].to_numpy()),
+    })
+    chiavi = [BATCH_FACILITY_COLUMN, BATCH_ROOM_COLUMN]
+    riepilogo = parti.groupby(chiavi, sort=False).agg({
+        'Barriere': 'sum', 'Errori': 'sum', 'Non calcolabili': 'sum', 'K_tu max [mGy/wk]': 'max',
+    })
+    spessori = pd.DataFrame({
+        **{col: parti[col] for col in chiavi},
+        'materiale': blocco['materiale_schermatura'].astype(str).to_numpy(),
+        'X': np.where(valido, blocco['spessore_finale_mm'].to_numpy(), np.nan),
+    }).dropna(subset=['X'])
+    per_materiale = spessori.groupby(chiavi + ['materiale'], sort=False)['X'].max().unstack('materiale')
+    return riepilogo.join(per_materiale.rename(columns=lambda m: f"X max {m} [mm]"))
+
+
+def _scrivi_righe(foglio, riga_iniziale, df):
+    """ Scrive le righe di df (celle mancanti vuote) a partire da riga_iniziale. """
+    valori = df.astype(object)
+    valori = valori.where(df.notna(), None)
+    for i, riga in enumerate(valori.itertuples(index=False, name=None), riga_iniziale):
+        foglio.write_row(i, 0, riga)
+
+
+class _CartellaExcel:
+    """ Cartella XlsxWriter constant_memory: fogli 'Riepilogo stanze', 'Barriere' (con continuazioni), 'Parametri'. """
+
+    def __init__(self, dest):
+        try:
+            import xlsxwriter
+        except ImportError as exc:
+            raise ImportError("La scrittura della relazione Excel richiede il pacchetto 'xlsxwriter'.") from exc
+        self.cartella = xlsxwriter.Workbook(dest, {'constant_memory': True, 'nan_inf_to_errors': True})
+        self.grassetto = self.cartella.add_format({'bold': True})
+        self.riepilogo = self.cartella.add_worksheet("Riepilogo stanze")
+        self.colonne = None
+        self.fogli_barriere = 0
+        self.riga = REPORT_XLSX_MAX_RIGHE + 1
+
+    def _nuovo_foglio(self):
+        self.fogli_barriere += 1
+        nome = "Barriere" if self.fogli_barriere == 1 else f"Barriere ({self.fogli_barriere})"
+        self.foglio = self.cartella.add_worksheet(nome)
+        self.foglio.write_row(0, 0, self.colonne, self.grassetto)
+        self.foglio.freeze_panes(1, 3)
+        self.foglio.set_column(0, len(self.colonne) - 1, 14)
+        self.riga = 1
+
+    def aggiungi_barriere(self, blocco):
+        if self.colonne is None:
+            self.colonne = list(blocco.columns)
+        blocco = blocco.reindex(columns=self.colonne)
+        inizio = 0
+        while inizio < len(blocco):
+            if self.riga > REPORT_XLSX_MAX_RIGHE:
+                self._nuovo_foglio()
+            fine = inizio + REPORT_XLSX_MAX_RIGHE + 1 - self.riga
+            parte = blocco.iloc[inizio:fine]
+            _scrivi_righe(self.foglio, self.riga, parte)
+            self.riga += len(parte)
+            inizio = fine
+
+    def chiudi(self, riepilogo, parametri):
+        riepilogo = riepilogo.reset_index()
+        self.riepilogo.write_row(0, 0, ["Impianto", "Stanza"] + list(riepilogo.columns[2:]), self.grassetto)
+        self.riepilogo.freeze_panes(1, 2)
+        self.riepilogo.set_column(0, len(riepilogo.columns) - 1, 16)
+        _scrivi_righe(self.riepilogo, 1, riepilogo)
+
+        foglio = self.cartella.add_worksheet("Parametri")
+        foglio.set_column(0, 1, 32)
+        for i, (voce, valore) in enumerate(parametri.items()):
+            foglio.write_row(i, 0, (voce, valore))
+        self.cartella.close()
+
+
+def write_facility_report(source, xlsx=None, pdf=None, chunk_size=BATCH_CHUNK_SIZE, processi=None):
+    """
+    Relazione di un impianto: calcola la tabella delle barriere (DataFrame/CSV/Parquet) a blocchi e scrive
+    - xlsx (percorso o file binario): fogli 'Riepilogo stanze' (barriere, errori, K_tu e spessore massimo per
+      materiale), 'Barriere' (ingressi e risultati, una riga per barriera) e 'Parametri';
+    - pdf (percorso o file binario): per ogni stanza una o più pagine con ingressi, K_tu, B, Xref, Xpre e
+      spessore finale di ogni barriera.
+    Stanze e impianti dalle colonne 'stanza' e 'impianto' (opzionali). Le pagine di ogni blocco sono generate
+    in un pool di 'processi' processi (default: numero di CPU) mentre il blocco è scritto nel foglio Excel;
+    le righe di una stanza divise tra due blocchi consecutivi restano sulle stesse pagine (le stanze non
+    contigue nella tabella producono pagine separate). Restituisce {'barriere', 'stanze', 'pagine'}.
+    """
+    if xlsx is None and pdf is None:
+        raise ValueError("Indicare almeno un file di destinazione (xlsx o pdf).")
+    n_processi = processi or os.cpu_count() or 1
+    generato = datetime.datetime.now().strftime("%Y-%m-%d %H:%M")
+    versione = versione_coefficienti()[:12]
+    piede = f"Generato il {generato} - Coefficienti NCRP 147 versione {versione}"
+
+    excel = _CartellaExcel(xlsx) if xlsx is not None else None
+    file_pdf = open(pdf, "wb") if isinstance(pdf, (str, os.PathLike)) else pdf
+    scrittore = ScrittorePdf(file_pdf) if pdf is not None else None
+    pool = None
+    n_righe = 0
+    riepiloghi = []
+    resto = None
+    try:
+        blocchi = iter_barrier_table(source, chunk_size)
+        blocco = next(blocchi, None)
+        while blocco is not None:
+            blocco = tabella_ingressi_risultati(blocco, n_righe)
+            n_righe += len(blocco)
+            successivo = next(blocchi, None)
+
+            pagine = ()
+            if scrittore is not None:
+                compiti, resto = _compiti_pdf(blocco, resto, piede, ultimo=successivo is None)
+                if n_processi > 1 and len(compiti) >= REPORT_MIN_STANZE_PROCESSI:
+                    if pool is None:
+                        pool = ProcessPoolExecutor(n_processi)
+                    pagine = pool.map(_pagine_stanza, compiti, chunksize=max(1, len(compiti) // (4 * n_processi)))
+                else:
+                    pagine = map(_pagine_stanza, compiti)
+
+            # Il foglio Excel e il riepilogo sono scritti mentre il pool genera le pagine del blocco
+            if excel is not None:
+                excel.aggiungi_barriere(blocco)
+            riepiloghi.append(_riepilogo_blocco(blocco))
+            for flussi in pagine:
+                for flusso in flussi:
+                    scrittore.aggiungi_pagina(flusso)
+            blocco = successivo
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    if riepiloghi:
+        riepilogo = pd.concat(riepiloghi)
+        aggregazioni = {col: 'sum' if col in ('Barriere', 'Errori', 'Non calcolabili') else 'max' for col in riepilogo.columns}
+        riepilogo = riepilogo.groupby(level=[0, 1], sort=False).agg(aggregazioni)
+    else:
+        riepilogo = pd.DataFrame(index=pd.MultiIndex.from_arrays([[], []], names=[BATCH_FACILITY_COLUMN, BATCH_ROOM_COLUMN]))
+
+    statistiche = {'barriere': n_righe, 'stanze': len(riepilogo), 'pagine': scrittore.n_pagine if scrittore else 0}
+    if scrittore is not None:
+        scrittore.chiudi()
+        if file_pdf is not pdf:
+            file_pdf.close()
+    if excel is not None:
+        excel.chiudi(riepilogo, {
+            "Generato il": generato,
+            "Versione coefficienti NCRP 147": versione,
+            "Barriere": n_righe,
+            "Stanze": len(riepilogo),
+        })
+    return statistiche
+
+
+def _compiti_pdf(blocco, resto, piede, ultimo):
+    """
+    Compiti del pool (uno per stanza, in ordine di apparizione) e righe trattenute per il blocco successivo:
+    resto è (chiave, righe) della stanza dell'ultima riga del blocco precedente, riportata in testa.
+    Con ultimo=True nessuna stanza viene trattenuta.
+    """
+    colonne = [blocco[col].tolist() for col in _CAMPI_PDF]
+    i_errore = _CAMPI_PDF.index('errore')
+    colonne[i_errore] = [e if isinstance(e, str) else None for e in colonne[i_errore]]
+    chiavi = list(zip(blocco[BATCH_FACILITY_COLUMN].tolist(), blocco[BATCH_ROOM_COLUMN].tolist()))
+
+    stanze = dict([resto]) if resto is not None else {}
+    for chiave, riga in zip(chiavi, zip(*colonne)):
+        stanze.setdefault(chiave, []).append(riga)
+    resto = None
+    if not ultimo and chiavi:
+        resto = (chiavi[-1], stanze.pop(chiavi[-1]))
+    return [(impianto, stanza, righe, piede) for (impianto, stanza), righe in stanze.items()], resto
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m shielding.relazione",
+        description="Relazione di schermatura di un impianto (Excel e PDF per stanza) da una tabella di barriere.",
+    )
+    parser.add_argument("barriere", help="file CSV o Parquet delle barriere (colonne opzionali 'impianto', 'stanza', 'barriera')")
+    parser.add_argument("--xlsx", help="cartella Excel di destinazione (richiede xlsxwriter)")
+    parser.add_argument("--pdf", help="file PDF di destinazione (pagine per stanza)")
+    parser.add_argument("--processi", type=int, help="processi per la generazione delle pagine (default: numero di CPU)")
+    parser.add_argument("--chunk-size", type=int, default=BATCH_CHUNK_SIZE, help="righe per blocco")
+    args = parser.parse_args(argv)
+    if args.xlsx is None and args.pdf is None:
+        parser.error("indicare almeno una destinazione (--xlsx e/o --pdf).")
+
+    statistiche = write_facility_report(args.barriere, args.xlsx, args.pdf, args.chunk_size, args.processi)
+    json.dump(statistiche, sys.stdout)
+    sys.stdout.write("\n")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
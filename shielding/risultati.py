@@ -0,0 +1,193 @@
+"""
+Record compatti dei risultati scalari: campi numerici e codici (ramo, barriera, errore, esito).
+I testi 'dettaglio' ed 'errore' sono generati solo su richiesta, a partire dai campi e dai params del calcolo.
+"""
+
+from .dati import DLP_TC_FIXED_VALUES
+from .spettro import descrivi_spettro_carico
+
+
+# Etichette ramo_logico (indice = codice ramo usato dai calcoli vettoriali)
+RAMO_LOGICO_LABELS = [
+    'Non Eseguito',
+    "RAMO 1: DIAGNOSTICA STANDARD",
+    "RAMO 2: DIAGNOSTICA SPECIALIZZATA/GENERICA",
+    'RAMO 3: TC (Calcolo Spessore)',
+]
+
+# Messaggi di errore dei calcoli vettoriali (indice = codice errore, 0 = nessun errore)
+CALC_ERROR_MESSAGES = [
+    None,
+    "Combinazione Tipo Immagine/Modalità non riconosciuta.",
+    "Tipo di barriera non specificato per il Ramo 1.",
+    "Tipo di barriera non specificato nel Ramo 2.",
+    "Tipo di barriera non specificato nel Ramo 3 (TC).",
+    "Dati Kp1 non definiti o non è prevista una barriera Primaria NCRP 147.",
+    "Dati di attenuazione mancanti per la combinazione Modalità/Materiale/kVp.",
+    "Modello secondario non riconosciuto.",
+    "Barriera composta: indicare uno e un solo strato incognito (spessore vuoto).",
+    "Barriera composta: gli spessori degli strati noti devono essere finiti e non negativi.",
+]
+
+# Tipo di barriera (indice = codice barriera)
+BARRIERA_LABELS = ['', "PRIMARIA", "SECONDARIA"]
+BARRIERA_NESSUNA, BARRIERA_PRIMARIA, BARRIERA_SECONDARIA = range(3)
+
+# Esito del calcolo di spessore (determina il testo del dettaglio)
+ESITO_CALCOLATO = 0             # spessore calcolato con la formula inversa
+ESITO_NULLO = 1                 # kerma*T o P nulli: spessore e kerma 0.0
+ESITO_KP1_ASSENTE = 2           # Kp1 non definito per la modalità (Primaria)
+ESITO_KSEC1_ASSENTE = 3         # modalità sconosciuta (Secondaria)
+ESITO_ATTENUAZIONE_MANCANTE = 4 # materiale (o kVp TC) sconosciuto
+ESITO_MODELLO_SCONOSCIUTO = 5   # modello_secondario non in SECONDARY_MODELS
+ESITO_NON_RICHIESTO = 6         # Primaria TC: calcolo non richiesto
+
+MESSAGGIO_NULLO = "Kerma o Tasso di Occupazione (T) o Dose Limite (P) nullo/i."
+
+
+class RisultatoCalcolo:
+    """
+    Risultato scalare di una barriera (run_shielding_calculation / calculate_*_thickness) senza testo.
+    I campi numerici sono valorizzati durante il calcolo; dettaglio, messaggio_errore e log_calcolo()
+    formattano il testo solo quando vengono letti. params è il dizionario del calcolo (non copiato).
+    """
+
+    __slots__ = (
+        'params', 'ramo', 'barriera', 'errore', 'esito',
+        'spessore_finale_mm', 'kerma_non_schermato', 'trasmittanza_B', 'Xref_mm',
+        'X_fuga_mm', 'X_diffusione_mm', 'K1sec_head_mGy_paz', 'K1sec_body_mGy_paz',
+        'K1', 'K1_diffusione', 'fuga_diffusione',
+    )
+
+    def __init__(self, params, ramo=0, barriera=BARRIERA_NESSUNA, errore=0, esito=ESITO_CALCOLATO):
+        self.params = params
+        self.ramo = ramo
+        self.barriera = barriera
+        self.errore = errore
+        self.esito = esito
+        self.spessore_finale_mm = 0.0
+        self.kerma_non_schermato = 0.0
+        self.trasmittanza_B = float('nan')
+        self.Xref_mm = 0.0
+        self.X_fuga_mm = 0.0
+        self.X_diffusione_mm = 0.0
+        self.K1sec_head_mGy_paz = 0.0
+        self.K1sec_body_mGy_paz = 0.0
+        # Kerma per unità di carico (Kp1, Ksec1 o Ksec1 di Fuga) e Ksec1 di Diffusione, per il dettaglio
+        self.K1 = float('nan')
+        self.K1_diffusione = float('nan')
+        self.fuga_diffusione = False
+
+    def __repr__(self):
+        return (
+            f"RisultatoCalcolo(ramo={self.ramo}, barriera={BARRIERA_LABELS[self.barriera]!r}, errore={self.errore}, "
+            f"esito={self.esito}, spessore_finale_mm={self.spessore_finale_mm!r}, kerma_non_schermato={self.kerma_non_schermato!r})"
+        )
+
+    @property
+    def ramo_logico(self):
+        return RAMO_LOGICO_LABELS[self.ramo]
+
+    @property
+    def messaggio_errore(self):
+        """ Testo dell'errore (None se il calcolo è riuscito). """
+        if self.errore == 5 and self.esito == ESITO_KP1_ASSENTE:
+            return self.log_calcolo()
+        return CALC_ERROR_MESSAGES[self.errore]
+
+    def log_calcolo(self):
+        """ Messaggio di log della funzione calculate_*_thickness che ha prodotto il risultato. """
+        p = self.params
+        modalita = p.get('modalita_radiografia')
+        Xpre = p.get('X_PRE_mm', 0.0)
+
+        if self.ramo == 3:
+            kvp, materiale = p.get('kvp_tc'), p.get('materiale_schermatura')
+            if self.esito == ESITO_ATTENUAZIONE_MANCANTE:
+                return f"Dati di attenuazione TC (Materiale/kVp) mancanti per {materiale} a {kvp}."
+            return (
+                f"K1sec(Head) = {self.K1sec_head_mGy_paz:.2e} mGy/paz (DLP={p.get('dlp_head_mGy_cm', DLP_TC_FIXED_VALUES['HEAD']):g}). "
+                f"K1sec(Body) = {self.K1sec_body_mGy_paz:.2e} mGy/paz (DLP={p.get('dlp_body_mGy_cm', DLP_TC_FIXED_VALUES['BODY']):g}). "
+                f"$K_{{tu}}$ (a d={p.get('distanza_d', 2.0)}m) = {self.kerma_non_schermato:.2e} mGy/wk. "
+                f"B = {self.trasmittanza_B:.4e}. Xref={self.Xref_mm:.2f}mm. Xpre={Xpre:.2f}mm. "
+                f"(kVp: {kvp}, $K_c$: {p.get('contrast_factor', 1.0)})"
+            )
+
+        if self.esito == ESITO_NULLO:
+            return MESSAGGIO_NULLO
+        if self.esito == ESITO_KP1_ASSENTE:
+            return f"Dati Kp1 non definiti per la modalità '{modalita}' o non è prevista una barriera Primaria NCRP 147."
+        if self.esito == ESITO_KSEC1_ASSENTE:
+            return f"Dati Ksec1_Comb non definiti per la modalità '{modalita}'."
+        if self.esito == ESITO_ATTENUAZIONE_MANCANTE:
+            tabella = "Primaria" if self.barriera == BARRIERA_PRIMARIA else "Secondaria"
+            return f"Dati di attenuazione {tabella} mancanti per '{modalita}'."
+        if self.esito == ESITO_MODELLO_SCONOSCIUTO:
+            return f"Modello secondario '{p.get('modello_secondario')}' non riconosciuto."
+
+        if self.fuga_diffusione:
+            return (
+                f"Ksec1(Fuga)={self.K1:.4e}. Ksec1(Diffusione)={self.K1_diffusione:.4e}. B={self.trasmittanza_B:.4e}. "
+                f"X_L={self.X_fuga_mm:.2f}mm. X_S={self.X_diffusione_mm:.2f}mm. X(L+S)={self.spessore_finale_mm:.2f}mm. "
+                f"Xpre={Xpre:.2f}mm. (Modello Fuga+Diffusione, Modalità NCRP: {modalita})"
+            )
+        if self.barriera == BARRIERA_PRIMARIA:
+            log_msg = (
+                f"Kp1={self.K1:.2f}. B={self.trasmittanza_B:.4e}. Xref={self.Xref_mm:.2f}mm. Xpre={Xpre:.2f}mm. "
+                f"Modalità NCRP: {modalita}"
+            )
+        else:
+            log_msg = (
+                f"Ksec1={self.K1:.4e}. B={self.trasmittanza_B:.4e}. Xref={self.Xref_mm:.2f}mm. Xpre={Xpre:.2f}mm. "
+                f"(Modello combinato Ksec1, Modalità NCRP: {modalita})"
+            )
+        spettro = p.get('spettro_carico')
+        if spettro and self.barriera == BARRIERA_PRIMARIA:
+            log_msg += f" (Trasmissione integrata sullo spettro di carico: {descrivi_spettro_carico(spettro)})"
+        return log_msg
+
+    @property
+    def dettaglio(self):
+        """ Testo 'dettaglio' di run_shielding_calculation (None per i risultati con errore). """
+        if self.errore:
+            return None
+        if self.ramo == 3:
+            if self.esito == ESITO_NON_RICHIESTO:
+                return "TC - Calcolo Primario non richiesto."
+            return f"Spessore TC calcolato. {self.log_calcolo()}"
+        if self.barriera == BARRIERA_PRIMARIA:
+            if self.ramo == 2 and self.esito == ESITO_KP1_ASSENTE:
+                return (
+                    "Calcolo Primario omesso per modalità specializzata/generica (Kp1 non definito). "
+                    f"Dettaglio: {self.log_calcolo()}"
+                )
+            prefisso = "Eseguito calcolo Primario." if self.ramo == 1 else "Eseguito calcolo Primario Ramo 2."
+        else:
+            prefisso = "Eseguito calcolo Secondario." if self.ramo == 1 else "Eseguito calcolo Secondario Specializzato/Generico."
+        return f"{prefisso} {self.log_calcolo()}"
+
+    def come_dizionario(self, dettaglio=True):
+        """
+        Dizionario dei risultati con le stesse chiavi di run_shielding_calculation.
+        Con dettaglio=False il testo descrittivo è omesso (gli errori restano riportati).
+        """
+        risultati = {'ramo_logico': RAMO_LOGICO_LABELS[self.ramo], 'spessore_finale_mm': self.spessore_finale_mm}
+        if self.errore:
+            risultati['errore'] = self.messaggio_errore
+            # Modello secondario non riconosciuto: kerma del fascio combinato, come nel batch
+            if self.errore == 7:
+                risultati['kerma_non_schermato'] = self.kerma_non_schermato
+            return risultati
+
+        if self.barriera == BARRIERA_SECONDARIA and self.ramo in (1, 2):
+            risultati['X_fuga_mm'] = self.X_fuga_mm
+            risultati['X_diffusione_mm'] = self.X_diffusione_mm
+        # Primaria Ramo 2 omessa (Kp1 non definito): nessun kerma
+        if not (self.ramo == 2 and self.esito == ESITO_KP1_ASSENTE):
+            risultati['kerma_non_schermato'] = self.kerma_non_schermato
+        if dettaglio:
+            risultati['dettaglio'] = self.dettaglio
+        if self.ramo == 3 and self.barriera == BARRIERA_SECONDARIA:
+            risultati['K1sec_head_mGy_paz'] = self.K1sec_head_mGy_paz
+            risultati['K1sec_body_mGy_paz'] = self.K1sec_body_mGy_paz
+        return risultati
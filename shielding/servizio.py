@@ -0,0 +1,416 @@
+"""
+Servizio HTTP locale (ASGI) per il calcolo delle schermature, senza dipendenze oltre NumPy/pandas.
+
+    python -m shielding.servizio [--host 127.0.0.1] [--port 8000] [--worker 4] [--cache [percorso]]
+
+oppure, con un server ASGI già installato: uvicorn shielding.servizio:app
+
+Endpoint:
+- POST /calcolo  params JSON -> risultati di run_shielding_calculation (JSON); con ?dettaglio=0 senza testo descrittivo
+- POST /batch    lista JSON di params (o JSON Lines) -> risultati di calculate_batch_chunk in JSON Lines,
+                 calcolati a blocchi nel pool di worker e trasmessi in streaming nell'ordine di ingresso.
+                 Per batch molto grandi preferire JSON Lines (Content-Type: application/x-ndjson): la
+                 decodifica riga per riga non blocca a lungo il GIL e le richieste concorrenti.
+- GET  /metriche latenze per endpoint (numero, errori, media, P50/P95/P99, massimo, in ms)
+- GET  /salute   {"stato": "ok"}
+"""
+
+import argparse
+import asyncio
+import json
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from .batch import calculate_batch_chunk
+from .cache_persistente import attiva_cache_persistente
+from .calcolo import run_shielding_calculation
+
+
+# Righe per blocco del batch (unità di calcolo vettoriale e di streaming)
+SERVICE_BATCH_CHUNK = 8192
+
+# Dimensione massima del corpo delle richieste (byte)
+SERVICE_MAX_BODY = 64 * 1024 * 1024
+
+# Latenze conservate per endpoint per il calcolo dei percentili
+SERVICE_METRICS_WINDOW = 10_000
+
+
+class MetricheLatenza:
+    """ Latenze delle richieste per endpoint, su una finestra mobile delle ultime SERVICE_METRICS_WINDOW. """
+
+    def __init__(self, finestra=SERVICE_METRICS_WINDOW):
+        self.finestra = finestra
+        self._durate = {}
+        self._conteggi = {}
+
+    def registra(self, endpoint, durata_s, errore=False):
+        if endpoint not in self._durate:
+            self._durate[endpoint] = deque(maxlen=self.finestra)
+            self._conteggi[endpoint] = [0, 0]
+        self._durate[endpoint].append(durata_s * 1000.0)
+        self._conteggi[endpoint][0] += 1
+        self._conteggi[endpoint][1] += bool(errore)
+
+    def riepilogo(self):
+        riepilogo = {}
+        for endpoint, durate in self._durate.items():
+            ms = np.fromiter(durate, dtype=float, count=len(durate))
+            p50, p95, p99 = np.percentile(ms, (50, 95, 99))
+            riepilogo[endpoint] = {
+                'richieste': self._conteggi[endpoint][0],
+                'errori': self._conteggi[endpoint][1],
+                'media_ms': float(ms.mean()),
+                'p50_ms': float(p50),
+                'p95_ms': float(p95),
+                'p99_ms': float(p99),
+                'max_ms': float(ms.max()),
+            }
+        return riepilogo
+
+
+def calcola_blocco_jsonl(righe):
+    """
+    Calcolo vettoriale di un blocco di params (lista di dizionari) eseguito nel pool di worker.
+    Restituisce i risultati in JSON Lines (bytes); il campo 'id' dei params, se presente, è riportato.
+    """
+    df = pd.DataFrame.from_records(righe)
+    risultati = calculate_batch_chunk(df)
+    if 'id' in df.columns:
+        risultati.insert(0, 'id', df['id'])
+    testo = risultati.to_json(orient='records', lines=True, force_ascii=True)
+    return (testo if testo.endswith("\n") else testo + "\n").encode()
+
+
+def _leggi_params(corpo, content_type):
+    """ Corpo di /batch -> lista di dizionari (array JSON o JSON Lines). Solleva ValueError. """
+    testo = corpo.decode('utf-8')
+    if 'ndjson' in content_type or 'jsonl' in content_type:
+        righe = [json.loads(riga) for riga in testo.splitlines() if riga.strip()]
+    else:
+        righe = json.loads(testo)
+    if not isinstance(righe, list) or not all(isinstance(r, dict) for r in righe):
+        raise ValueError("Il corpo deve essere una lista di oggetti params.")
+    return righe
+
+
+class ServizioSchermature:
+    """
+    Applicazione ASGI (HTTP e lifespan) senza framework. Le richieste batch sono suddivise in blocchi di
+    SERVICE_BATCH_CHUNK righe, calcolati fuori dall'event loop in un pool di thread (le operazioni NumPy
+    rilasciano il GIL) con al più 2 blocchi per worker in corso, e trasmessi appena pronti. Anche i calcoli
+    scalari usano il pool, perché la cache persistente può leggere e scrivere su disco.
+    """
+
+    def __init__(self, worker=4, blocco=SERVICE_BATCH_CHUNK):
+        self.worker = worker
+        self.blocco = blocco
+        self.metriche = MetricheLatenza()
+        self._pool = None
+
+    @property
+    def pool(self):
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(max_workers=self.worker, thread_name_prefix="schermature")
+        return self._pool
+
+    def chiudi(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+            return
+        if scope['type'] != 'http':
+            return
+
+        inizio = time.perf_counter()
+        metodo, percorso = scope['method'], scope['path']
+        rotte = {
+            ('POST', '/calcolo'): self._calcolo,
+            ('POST', '/batch'): self._batch,
+            ('GET', '/metriche'): self._metriche,
+            ('GET', '/salute'): self._salute,
+        }
+        gestore = rotte.get((metodo, percorso))
+        if gestore is None:
+            stato = 405 if percorso in {p for _, p in rotte} else 404
+            await _rispondi_json(send, stato, {'errore': f"{metodo} {percorso} non disponibile."})
+            return
+
+        errore = True
+        try:
+            errore = await gestore(scope, receive, send)
+        finally:
+            if percorso != '/metriche':
+                self.metriche.registra(percorso, time.perf_counter() - inizio, errore)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            messaggio = await receive()
+            if messaggio['type'] == 'lifespan.startup':
+                self.pool  # avvia il pool di worker
+                await send({'type': 'lifespan.startup.complete'})
+            elif messaggio['type'] == 'lifespan.shutdown':
+                self.chiudi()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def _calcolo(self, scope, receive, send):
+        inizio = time.perf_counter()
+        try:
+            params = json.loads(await _leggi_corpo(receive))
+            if not isinstance(params, dict):
+                raise ValueError("Il corpo deve essere un oggetto params.")
+            dettaglio = b'dettaglio=0' not in scope.get('query_string', b'').split(b'&')
+            # Nel pool come i blocchi batch: con la cache persistente il calcolo legge e scrive su SQLite
+            risultati = await asyncio.get_running_loop().run_in_executor(
+                self.pool, run_shielding_calculation, params, dettaglio,
+            )
+        except _CorpoTroppoGrande:
+            await _rispondi_json(send, 413, {'errore': "Corpo della richiesta troppo grande."})
+            return True
+        except (ValueError, TypeError) as exc:
+            await _rispondi_json(send, 400, {'errore': str(exc)})
+            return True
+        durata_ms = (time.perf_counter() - inizio) * 1000.0
+        await _rispondi_json(send, 200, risultati, [(b'server-timing', f"calcolo;dur={durata_ms:.3f}".encode())])
+        return 'errore' in risultati
+
+    async def _batch(self, scope, receive, send):
+        loop = asyncio.get_running_loop()
+        try:
+            corpo = await _leggi_corpo(receive)
+            # Anche la decodifica JSON (centinaia di ms per 1e5 righe) avviene fuori dall'event loop
+            righe = await loop.run_in_executor(self.pool, _leggi_params, corpo, _intestazione(scope, b'content-type'))
+        except _CorpoTroppoGrande:
+            await _rispondi_json(send, 413, {'errore': "Corpo della richiesta troppo grande."})
+            return True
+        except (ValueError, UnicodeDecodeError) as exc:
+            await _rispondi_json(send, 400, {'errore': str(exc)})
+            return True
+
+        await send({
+            'type': 'http.response.start',
+            'status': 200,
+            'headers': [(b'content-type', b'application/x-ndjson'), (b'x-righe', str(len(righe)).encode())],
+        })
+        errore = False
+        in_corso = deque()
+        for i in range(0, len(righe), self.blocco):
+            blocco = righe[i:i + self.blocco]
+            in_corso.append((i, len(blocco), loop.run_in_executor(self.pool, calcola_blocco_jsonl, blocco)))
+            # Trasmette i blocchi nell'ordine di ingresso mantenendo il pool occupato
+            if len(in_corso) >= 2 * self.worker:
+                errore |= await self._invia_blocco(send, *in_corso.popleft())
+        while in_corso:
+            errore |= await self._invia_blocco(send, *in_corso.popleft())
+        await send({'type': 'http.response.body', 'body': b'', 'more_body': False})
+        return errore
+
+    async def _invia_blocco(self, send, inizio, n_righe, futuro):
+        """
+        Invia il blocco calcolato; un blocco non elaborabile (qualsiasi eccezione del worker) diventa una riga
+        {'errore': ...}: la risposta è già iniziata e il chiamante chiude comunque il corpo.
+        """
+        try:
+            corpo = await futuro
+        except Exception as exc:
+            corpo = (json.dumps({'errore': f"Righe {inizio}-{inizio + n_righe - 1}: {exc}"}) + "\n").encode()
+            await send({'type': 'http.response.body', 'body': corpo, 'more_body': True})
+            return True
+        await send({'type': 'http.response.body', 'body': corpo, 'more_body': True})
+        return False
+
+    async def _metriche(self, scope, receive, send):
+        await _rispondi_json(send, 200, self.metriche.riepilogo())
+        return False
+
+    async def _salute(self, scope, receive, send):
+        await _rispondi_json(send, 200, {'stato': 'ok'})
+        return False
+
+
+class _CorpoTroppoGrande(Exception):
+    pass
+
+
+async def _leggi_corpo(receive):
+    parti, dimensione = [], 0
+    while True:
+        messaggio = await receive()
+        parte = messaggio.get('body', b'')
+        dimensione += len(parte)
+        if dimensione > SERVICE_MAX_BODY:
+            raise _CorpoTroppoGrande()
+        parti.append(parte)
+        if not messaggio.get('more_body', False):
+            return b''.join(parti)
+
+
+def _intestazione(scope, nome):
+    for chiave, valore in scope['headers']:
+        if chiave.lower() == nome:
+            return valore.decode('latin-1').lower()
+    return ''
+
+
+async def _rispondi_json(send, stato, dati, intestazioni=()):
+    corpo = json.dumps(dati).encode()
+    await send({
+        'type': 'http.response.start',
+        'status': stato,
+        'headers': [(b'content-type', b'application/json'), (b'content-length', str(len(corpo)).encode()), *intestazioni],
+    })
+    await send({'type': 'http.response.body', 'body': corpo})
+
+
+app = ServizioSchermature()
+
+
+# ====================================================================
+# SERVER HTTP/1.1 MINIMO (asyncio) PER ESEGUIRE L'APPLICAZIONE ASGI
+# ====================================================================
+
+
+_MOTIVI = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 411: "Length Required",
+           413: "Payload Too Large", 500: "Internal Server Error"}
+
+
+async def _rifiuta_richiesta(writer, stato, messaggio):
+    """ Risposta di errore a una richiesta non interpretabile, con chiusura della connessione. """
+    corpo = json.dumps({'errore': messaggio}).encode()
+    writer.write(
+        f"HTTP/1.1 {stato} {_MOTIVI[stato]}\r\ncontent-type: application/json\r\n"
+        f"content-length: {len(corpo)}\r\nconnection: close\r\n\r\n".encode() + corpo
+    )
+    try:
+        await writer.drain()
+    except ConnectionError:
+        pass  # client già disconnesso
+
+
+async def _gestisci_connessione(applicazione, reader, writer):
+    """
+    Richieste HTTP/1.1 in sequenza sulla connessione (keep-alive); risposte senza lunghezza in chunked.
+    Riga di richiesta o Content-Length non validi, corpo troncato: 400; corpo della richiesta in chunked: 411.
+    """
+    try:
+        while True:
+            try:
+                testata = await reader.readuntil(b'\r\n\r\n')
+            except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+                return
+            righe = testata.decode('latin-1').split('\r\n')
+            parti = righe[0].split(' ', 2)
+            if len(parti) != 3:
+                await _rifiuta_richiesta(writer, 400, "Riga di richiesta non valida.")
+                return
+            metodo, destinazione, versione = parti
+            intestazioni = []
+            for riga in righe[1:]:
+                if riga:
+                    nome, _, valore = riga.partition(':')
+                    intestazioni.append((nome.strip().lower().encode('latin-1'), valore.strip().encode('latin-1')))
+            valori = dict(intestazioni)
+            percorso, _, query = destinazione.partition('?')
+            if valori.get(b'transfer-encoding', b'identity').lower() != b'identity':
+                await _rifiuta_richiesta(writer, 411, "Indicare la lunghezza del corpo (Content-Length).")
+                return
+            try:
+                lunghezza = int(valori.get(b'content-length', b'0'))
+            except ValueError:
+                lunghezza = -1
+            if lunghezza < 0:
+                await _rifiuta_richiesta(writer, 400, "Content-Length non valido.")
+                return
+            mantieni = versione == 'HTTP/1.1' and valori.get(b'connection', b'').lower() != b'close'
+
+            stato_risposta = {'chunked': False}
+            troppo_grande = lunghezza > SERVICE_MAX_BODY
+            try:
+                corpo_richiesta = b'' if troppo_grande else await reader.readexactly(lunghezza)
+            except (asyncio.IncompleteReadError, ConnectionError):
+                await _rifiuta_richiesta(writer, 400, "Corpo della richiesta più corto di Content-Length.")
+                return
+
+            async def receive():
+                return {'type': 'http.request', 'body': corpo_richiesta, 'more_body': False}
+
+            async def send(messaggio):
+                if messaggio['type'] == 'http.response.start':
+                    headers = list(messaggio.get('headers', []))
+                    if not any(k.lower() == b'content-length' for k, _ in headers):
+                        headers.append((b'transfer-encoding', b'chunked'))
+                        stato_risposta['chunked'] = True
+                    if not mantieni:
+                        headers.append((b'connection', b'close'))
+                    stato = messaggio['status']
+                    testo = f"HTTP/1.1 {stato} {_MOTIVI.get(stato, '')}\r\n".encode()
+                    testo += b''.join(k + b': ' + v + b'\r\n' for k, v in headers) + b'\r\n'
+                    writer.write(testo)
+                elif messaggio['type'] == 'http.response.body':
+                    corpo = messaggio.get('body', b'')
+                    if stato_risposta['chunked']:
+                        if corpo:
+                            writer.write(f"{len(corpo):x}\r\n".encode() + corpo + b'\r\n')
+                        if not messaggio.get('more_body', False):
+                            writer.write(b'0\r\n\r\n')
+                    else:
+                        writer.write(corpo)
+                    await writer.drain()
+
+            scope = {
+                'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': versione.split('/')[-1],
+                'method': metodo.upper(), 'path': percorso, 'raw_path': percorso.encode(), 'query_string': query.encode(),
+                'headers': intestazioni, 'scheme': 'http', 'server': writer.get_extra_info('sockname'),
+                'client': writer.get_extra_info('peername'),
+            }
+            if troppo_grande:
+                await _rispondi_json(send, 413, {'errore': "Corpo della richiesta troppo grande."})
+                return
+            await applicazione(scope, receive, send)
+            if not mantieni:
+                return
+    finally:
+        writer.close()
+
+
+async def servi(applicazione=app, host="127.0.0.1", port=8000):
+    """ Esegue l'applicazione ASGI sul server HTTP minimo fino all'interruzione (il pool si avvia alla prima richiesta batch). """
+    server = await asyncio.start_server(lambda r, w: _gestisci_connessione(applicazione, r, w), host, port)
+    async with server:
+        await server.serve_forever()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m shielding.servizio", description="Servizio HTTP locale per il calcolo delle schermature.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--worker", type=int, default=4, help="thread del pool di calcolo batch")
+    parser.add_argument(
+        "--cache", nargs="?", const="", default=None, metavar="PERCORSO",
+        help="attiva la cache persistente dei risultati (default: $SHIELDING_CACHE o ~/.cache/shielding-app)",
+    )
+    args = parser.parse_args(argv)
+    if args.cache is not None:
+        attiva_cache_persistente(args.cache or None)
+
+    app.worker = args.worker
+    try:
+        asyncio.run(servi(app, args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        app.chiudi()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,389 @@
+"""
+Calcoli specifici per barriera: Primaria e Secondaria (Ramo 1/2) e TC (Ramo 3), scalari e vettoriali.
+"""
+
+import numpy as np
+
+from .analitica import (
+    SPESSORE_NON_VALIDO_MM,
+    calcola_kerma_incidente,
+    calcola_spessore_x,
+    calcola_spessore_x_array,
+    risolvi_spessore_somma_array,
+)
+from .coefficienti import COEFF_STORE
+from .dati import DLP_TC_FIXED_VALUES, K_BODY_DIFF, K_HEAD_DIFF
+from .risultati import (
+    BARRIERA_PRIMARIA,
+    BARRIERA_SECONDARIA,
+    ESITO_ATTENUAZIONE_MANCANTE,
+    ESITO_KP1_ASSENTE,
+    ESITO_KSEC1_ASSENTE,
+    ESITO_MODELLO_SCONOSCIUTO,
+    ESITO_NULLO,
+    RisultatoCalcolo,
+)
+from .spettro import calcola_spessore_x_spettro
+
+
+# Modelli per la barriera Secondaria: Ksec1 combinato (NCRP 147 Tab. 4.7) o somma Fuga + Diffusione
+SECONDARY_MODELS = ("COMBINATO", "FUGA+DIFFUSIONE")
+
+
+def calcola_primaria(params):
+    """
+    Calcolo Primario (Ramo 1/2) senza testo: restituisce un RisultatoCalcolo con i campi numerici
+    (ramo da assegnare) e l'esito. Vedi calculate_primary_thickness.
+    """
+    P = params.get('P_mSv_wk', 0.0) 
+    T = params.get('tasso_occupazione_T', 1.0)
+    d = params.get('distanza_d', 2.0)
+    U = params.get('fattore_uso_U', 0.25)
+    N = params.get('pazienti_settimana_N', 100)
+    modalita = params.get('modalita_radiografia')
+    materiale = params.get('materiale_schermatura')
+    Xpre = params.get('X_PRE_mm', 0.0) 
+    spettro = params.get('spettro_carico')
+    risultato = RisultatoCalcolo(params, barriera=BARRIERA_PRIMARIA)
+
+    # Usa la chiave selezionata dall'utente direttamente.
+    i_mod = COEFF_STORE.modalita_id.get(modalita, -1)
+    i_mat = COEFF_STORE.materiale_id.get(materiale, -1)
+    
+    # Kp1 è in mGy*m^2 / mAs (NaN nell'archivio se non definito)
+    Kp1_data = float(COEFF_STORE.Kp1[i_mod])
+    
+    # Se Kp1 non è definito, gestisce l'errore.
+    if Kp1_data != Kp1_data:
+        risultato.esito = ESITO_KP1_ASSENTE
+        return risultato
+
+    # La completezza delle tabelle è verificata all'import: qui manca solo un materiale sconosciuto
+    if i_mat < 0:
+        risultato.esito = ESITO_ATTENUAZIONE_MANCANTE
+        return risultato
+        
+    alpha, beta, gamma = COEFF_STORE.att_primaria[i_mod, i_mat].tolist()
+    
+    # 1. Kerma non schermato (incidente)
+    kerma_non_schermato_mGy_wk = calcola_kerma_incidente(Kp1_data, U, N, d)
+    
+    if kerma_non_schermato_mGy_wk * T == 0 or P == 0:
+        risultato.esito = ESITO_NULLO
+        return risultato
+        
+    # 2. Fattore di Trasmittanza B
+    B_P = P / (kerma_non_schermato_mGy_wk * T)
+    
+    # 3. Spessore di Riferimento Xref (fit della modalità o curva integrata sullo spettro di carico)
+    if spettro:
+        Xref_mm = calcola_spessore_x_spettro(materiale, spettro, B_P)
+    else:
+        Xref_mm = calcola_spessore_x(alpha, beta, gamma, B_P)
+    
+    # 4. Spessore Finale (Xref - Xpre)
+    risultato.spessore_finale_mm = max(0.0, Xref_mm - Xpre)
+    risultato.kerma_non_schermato = kerma_non_schermato_mGy_wk
+    risultato.trasmittanza_B = B_P
+    risultato.Xref_mm = Xref_mm
+    risultato.K1 = Kp1_data
+    return risultato
+
+
+def calculate_primary_thickness(params):
+    """ 
+    Implementa il calcolo Primario (Ramo 1). 
+    Usa la chiave esatta selezionata dalla UI.
+    Con 'spettro_carico' ({kVp: mA·min}) la trasmissione è integrata sullo spettro invece del fit della modalità.
+    """
+    risultato = calcola_primaria(params)
+    return risultato.spessore_finale_mm, risultato.kerma_non_schermato, risultato.log_calcolo()
+
+
+def _spessore_componente(kerma, P, T, Xpre, alpha, beta, gamma):
+    """ Spessore finale scalare di una componente secondaria (0.0 se kerma*T o P nulli). """
+    if kerma * T == 0 or P == 0:
+        return 0.0
+    return max(0.0, calcola_spessore_x(alpha, beta, gamma, P / (kerma * T)) - Xpre)
+
+
+def calcola_secondaria(params):
+    """
+    Calcolo Secondario (Ramo 1/2) senza testo: restituisce un RisultatoCalcolo con i campi numerici
+    (ramo da assegnare) e l'esito. Vedi calculate_secondary_thickness.
+    """
+    P = params.get('P_mSv_wk', 0.0) 
+    T = params.get('tasso_occupazione_T', 1.0)
+    d = params.get('distanza_d', 2.0)
+    U = 1.0 # U è tipicamente 1.0 per la secondaria (NCRP 147 Eq. 4.4)
+    N = params.get('pazienti_settimana_N', 100)
+    modalita = params.get('modalita_radiografia')
+    materiale = params.get('materiale_schermatura')
+    Xpre = params.get('X_PRE_mm', 0.0) 
+    modello = params.get('modello_secondario', SECONDARY_MODELS[0])
+    risultato = RisultatoCalcolo(params, barriera=BARRIERA_SECONDARIA)
+
+    # Usa la chiave selezionata dall'utente direttamente.
+    i_mod = COEFF_STORE.modalita_id.get(modalita, -1)
+    i_mat = COEFF_STORE.materiale_id.get(materiale, -1)
+    
+    # Ksec1 è in mGy*m^2 / mAs o mGy*m^2 / min
+    if i_mod < 0:
+        risultato.esito = ESITO_KSEC1_ASSENTE
+        return risultato
+    Ksec1_data = float(COEFF_STORE.Ksec1_Comb[i_mod])
+    Ksec1_L = float(COEFF_STORE.Ksec1_LeakSide[i_mod])
+    Ksec1_S = float(COEFF_STORE.Ksec1_ForBack[i_mod])
+
+    if i_mat < 0:
+        risultato.esito = ESITO_ATTENUAZIONE_MANCANTE
+        return risultato
+    if modello not in SECONDARY_MODELS:
+        # Errore 7 come nel batch: spessore non calcolato, kerma del fascio combinato riportato
+        risultato.errore = 7
+        risultato.esito = ESITO_MODELLO_SCONOSCIUTO
+        risultato.kerma_non_schermato = calcola_kerma_incidente(Ksec1_data, U, N, d)
+        return risultato
+        
+    alpha, beta, gamma = COEFF_STORE.att_secondaria[i_mod, i_mat].tolist()
+    
+    # 1. Kerma non schermato (incidente), totale e per componente
+    # $K_{tu} = (K_{s1} \cdot U \cdot N) / d^2$. Utilizziamo U=1 per la secondaria come da NCRP 147 Eq. 4.4
+    kerma_L = calcola_kerma_incidente(Ksec1_L, U, N, d)
+    kerma_S = calcola_kerma_incidente(Ksec1_S, U, N, d)
+    if modello == "FUGA+DIFFUSIONE":
+        kerma_non_schermato_mGy_wk = kerma_L + kerma_S
+    else:
+        kerma_non_schermato_mGy_wk = calcola_kerma_incidente(Ksec1_data, U, N, d)
+    
+    if kerma_non_schermato_mGy_wk * T == 0 or P == 0:
+        risultato.esito = ESITO_NULLO
+        return risultato
+        
+    # 2. Fattore di Trasmittanza B
+    B_S = P / (kerma_non_schermato_mGy_wk * T)
+    risultato.kerma_non_schermato = kerma_non_schermato_mGy_wk
+    risultato.trasmittanza_B = B_S
+
+    # Componenti Fuga (X_L, fit Secondario) e Diffusione (X_S, fit Primario)
+    risultato.X_fuga_mm = _spessore_componente(kerma_L, P, T, Xpre, alpha, beta, gamma)
+    risultato.X_diffusione_mm = _spessore_componente(kerma_S, P, T, Xpre, *COEFF_STORE.att_primaria[i_mod, i_mat].tolist())
+
+    if modello == "FUGA+DIFFUSIONE":
+        # Soluzione a due componenti (risolutore vettoriale su una sola riga)
+        X_LS = float(calcola_componenti_secondaria_array(
+            kerma_L, kerma_S, P, T, Xpre, COEFF_STORE.att_secondaria[i_mod, i_mat], COEFF_STORE.att_primaria[i_mod, i_mat],
+        )[2])
+        risultato.spessore_finale_mm = X_LS
+        risultato.Xref_mm = X_LS + Xpre
+        risultato.K1, risultato.K1_diffusione = Ksec1_L, Ksec1_S
+        risultato.fuga_diffusione = True
+        return risultato
+    
+    # 3. Spessore di Riferimento Xref (fit Secondario della modalità)
+    Xref_mm = calcola_spessore_x(alpha, beta, gamma, B_S)
+    
+    # 4. Spessore Finale (Xref - Xpre)
+    risultato.spessore_finale_mm = max(0.0, Xref_mm - Xpre)
+    risultato.Xref_mm = Xref_mm
+    risultato.K1 = Ksec1_data
+    return risultato
+
+
+def calculate_secondary_thickness(params):
+    """ 
+    Implementa il calcolo Secondario (Ramo 1/2). 
+    Usa la chiave esatta selezionata dalla UI.
+    Con 'modello_secondario' = "COMBINATO" (default) lo spessore finale usa Ksec1_Comb; con "FUGA+DIFFUSIONE"
+    risolve la somma delle trasmissioni di Fuga e Diffusione. X_L e X_S sono sempre le singole componenti.
+    'spettro_carico' è ignorato: i fit per kVp (NCRP 147 Tab. A.1) sono del fascio primario, non della radiazione
+    secondaria.
+    """
+    r = calcola_secondaria(params)
+    return r.spessore_finale_mm, r.X_fuga_mm, r.X_diffusione_mm, r.kerma_non_schermato, r.log_calcolo()
+
+
+def calculate_special_secondary_thickness(params):
+    """ Implementa il calcolo Secondario (Ramo 2). Stesso flusso logico di Ramo 1. """
+    return calculate_secondary_thickness(params)
+
+
+def calcola_tc(params):
+    """
+    Calcolo Secondario TC (Ramo 3) senza testo: restituisce un RisultatoCalcolo con i campi numerici
+    e l'esito. Vedi calculate_tc_thickness.
+    """
+    P = params.get('P_mSv_wk', 0.0) 
+    T = params.get('tasso_occupazione_T', 1.0)
+    d = params.get('distanza_d', 2.0) # $d$ in metri
+    materiale = params.get('materiale_schermatura')
+    Xpre = params.get('X_PRE_mm', 0.0)
+    
+    # Parametri specifici TC (Recuperati da params)
+    N_head = params.get('weekly_n_head', 0) 
+    N_body = params.get('weekly_n_body', 0)
+    Kc = params.get('contrast_factor', 1.0) # Fattore di Contrasto
+    kvp = params.get('kvp_tc')
+    # DLP medi per esame [mGy*cm]: da registro dosi (vedi registro_dlp) o i valori fissi NCRP 147
+    DLP_head = params.get('dlp_head_mGy_cm', DLP_TC_FIXED_VALUES["HEAD"])
+    DLP_body = params.get('dlp_body_mGy_cm', DLP_TC_FIXED_VALUES["BODY"])
+    risultato = RisultatoCalcolo(params, ramo=3, barriera=BARRIERA_SECONDARIA)
+
+    i_mat = COEFF_STORE.materiale_id.get(materiale, -1)
+    i_kvp = COEFF_STORE.kvp_id.get(kvp, -1)
+    if i_mat < 0 or i_kvp < 0:
+        risultato.esito = ESITO_ATTENUAZIONE_MANCANTE
+        return risultato
+    
+    # --- 1. Calcolo del Kerma non schermato a 1m per paziente (K1sec) ---
+    # K1sec(head) = khead * DLP_head * Kc (Eq. 5.1 NCRP 147)
+    K1sec_head_mGy_paz = K_HEAD_DIFF * DLP_head * Kc # [cm^-1] * [mGy*cm] * [] = [mGy]
+    
+    # K1sec(body) = 1.2 * kbody * DLP_body * Kc (Eq. 5.2 NCRP 147)
+    K1sec_body_mGy_paz = 1.2 * K_BODY_DIFF * DLP_body * Kc 
+    
+    # --- 2. Calcolo del Kerma non schermato totale settimanale alla distanza d ($K_{tu}$) ---
+    # $K_{tu}$ (a 1m) = (K1sec(head) * N_head) + (K1sec(body) * N_body) (Eq. 5.3 NCRP 147)
+    total_kerma_at_1m_mGy_wk = (K1sec_head_mGy_paz * N_head) + (K1sec_body_mGy_paz * N_body)
+    
+    if d <= 0:
+        kerma_tc_non_schermato_mGy_wk = 0.0
+    else:
+        # $K_{tu}$ (Kerma Settimanale alla distanza d)
+        # $K_{tu}(d) = K_{tu}(1m) / d^2$ (d in metri, Kerma in mGy/wk)
+        kerma_tc_non_schermato_mGy_wk = (1 / (d ** 2)) * total_kerma_at_1m_mGy_wk
+    
+    # --- 3. Calcolo del Fattore di Trasmittanza B ($B_{T}$) ---
+    if kerma_tc_non_schermato_mGy_wk * T <= 0 or P == 0:
+        B_T = 1.0 
+    else:
+        # $B = P / (K_{tu} \cdot T)$ (Eq. 5.4 NCRP 147)
+        B_T = P / (T * kerma_tc_non_schermato_mGy_wk)
+        
+    # --- 4. Calcolo dello Spessore X richiesto (Usa i nuovi dati ATTENUATION_DATA_TC) ---
+    alpha, beta, gamma = COEFF_STORE.att_tc[i_mat, i_kvp].tolist()
+    
+    Xref_mm = calcola_spessore_x(alpha, beta, gamma, B_T)
+    risultato.spessore_finale_mm = max(0.0, Xref_mm - Xpre)
+    risultato.kerma_non_schermato = kerma_tc_non_schermato_mGy_wk
+    risultato.trasmittanza_B = B_T
+    risultato.Xref_mm = Xref_mm
+    risultato.K1sec_head_mGy_paz = K1sec_head_mGy_paz
+    risultato.K1sec_body_mGy_paz = K1sec_body_mGy_paz
+    return risultato
+
+
+def calculate_tc_thickness(params):
+    """ 
+    Implementa il calcolo Secondario (Ramo 3 - TC).
+    Utilizza i DLP fissi (1200 mGy*cm per Head, 550 mGy*cm per Body) per calcolare il Kerma K1sec,
+    o i DLP medi 'dlp_head_mGy_cm' / 'dlp_body_mGy_cm' se presenti in params (es. da registro_dlp).
+    """
+    r = calcola_tc(params)
+    return r.spessore_finale_mm, r.kerma_non_schermato, r.log_calcolo(), r.K1sec_head_mGy_paz, r.K1sec_body_mGy_paz
+
+
+def calcola_spessore_barriera_array(kerma, P, T, Xpre, alpha, beta, gamma, tabella=None):
+    """
+    Passi 2-4 vettoriali comuni a Primaria e Secondaria (Ramo 1/2), a partire dal kerma non schermato.
+    Restituisce (X_finale_mm, kerma, B, Xref_mm, valido) con la stessa semantica delle funzioni scalari:
+    kerma*T nullo o P nullo -> spessore e kerma 0.0; B non calcolabile -> Xref = 999.0 e valido False.
+    Con tabella (TabellaTrasmissioneSpettro) l'inversione usa la curva integrata sullo spettro di carico,
+    con TabellaSpessoreInverso la tabella precalcolata del fit.
+    """
+    kerma = np.asarray(kerma, dtype=float)
+    P = np.asarray(P, dtype=float)
+    T = np.asarray(T, dtype=float)
+
+    nullo = (kerma * T == 0) | (P == 0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        B = P / (kerma * T)
+
+    if tabella is None:
+        Xref_mm, valido = calcola_spessore_x_array(alpha, beta, gamma, B)
+    else:
+        Xref_mm, valido = tabella.spessore_array(B)
+    Xref_mm = np.where(valido, Xref_mm, SPESSORE_NON_VALIDO_MM)
+    X_finale_mm = np.maximum(0.0, Xref_mm - Xpre)
+
+    X_finale_mm = np.where(nullo, 0.0, X_finale_mm)
+    kerma = np.where(nullo, 0.0, kerma)
+    B = np.where(nullo, np.nan, B)
+    Xref_mm = np.where(nullo, 0.0, Xref_mm)
+    valido = valido | nullo
+    return X_finale_mm, kerma, B, Xref_mm, valido
+
+
+def calcola_componenti_secondaria_array(kerma_L, kerma_S, P, T, Xpre, att_L, att_S):
+    """
+    Barriera Secondaria a due componenti (vettoriale): Fuga (Ksec1_LeakSide, fit Secondario Tab. C.1)
+    e Diffusione (Ksec1_ForBack, fit Primario Tab. B.1: la radiazione diffusa è assunta penetrante
+    quanto il fascio primario). att_L e att_S hanno forma (..., 3).
+    Restituisce (X_L, X_S, X_LS, valido_LS): spessori delle singole componenti e spessore X_LS tale che
+        kerma_L * B_L(X_LS + Xpre) + kerma_S * B_S(X_LS + Xpre) = P / T
+    risolto con risolvi_spessore_somma_array. Kerma*T o P nulli -> 0.0.
+    """
+    att_L = np.asarray(att_L, dtype=float)
+    att_S = np.asarray(att_S, dtype=float)
+    X_L = calcola_spessore_barriera_array(kerma_L, P, T, Xpre, att_L[..., 0], att_L[..., 1], att_L[..., 2])[0]
+    X_S = calcola_spessore_barriera_array(kerma_S, P, T, Xpre, att_S[..., 0], att_S[..., 1], att_S[..., 2])[0]
+
+    forma = np.broadcast_shapes(
+        np.shape(kerma_L), np.shape(kerma_S), np.shape(P), np.shape(T), np.shape(Xpre), att_L.shape[:-1], att_S.shape[:-1],
+    )
+    kerma = np.stack([np.broadcast_to(kerma_L, forma), np.broadcast_to(kerma_S, forma)], axis=-1).reshape(-1, 2)
+    att = np.stack([np.broadcast_to(att_L, forma + (3,)), np.broadcast_to(att_S, forma + (3,))], axis=-2).reshape(-1, 2, 3)
+    P = np.broadcast_to(np.asarray(P, dtype=float), forma).reshape(-1)
+    T = np.broadcast_to(np.asarray(T, dtype=float), forma).reshape(-1)
+    Xpre = np.broadcast_to(np.asarray(Xpre, dtype=float), forma).reshape(-1)
+
+    nullo = (kerma.sum(axis=1) * T == 0) | (P == 0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        X_LS, valido = risolvi_spessore_somma_array(kerma, att[..., 0], att[..., 1], att[..., 2], Xpre[:, None], P / T)
+    X_LS = np.where(valido, X_LS, SPESSORE_NON_VALIDO_MM)
+    X_LS = np.where(nullo, 0.0, X_LS)
+    valido = valido | nullo
+    return X_L, X_S, X_LS.reshape(forma), valido.reshape(forma)
+
+
+def calcola_kerma_tc_array(
+    d, N_head, N_body, Kc, DLP_head=DLP_TC_FIXED_VALUES["HEAD"], DLP_body=DLP_TC_FIXED_VALUES["BODY"],
+):
+    """
+    Kerma TC non schermato settimanale alla distanza d (Eq. 5.1-5.3 NCRP 147), vettoriale.
+    Restituisce (K_tu, K1sec_head, K1sec_body); d <= 0 -> K_tu = 0.0.
+    """
+    Kc = np.asarray(Kc, dtype=float)
+    K1sec_head_mGy_paz = K_HEAD_DIFF * np.asarray(DLP_head, dtype=float) * Kc
+    K1sec_body_mGy_paz = 1.2 * K_BODY_DIFF * np.asarray(DLP_body, dtype=float) * Kc
+
+    total_kerma_at_1m_mGy_wk = (K1sec_head_mGy_paz * N_head) + (K1sec_body_mGy_paz * N_body)
+    d = np.asarray(d, dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        K_tu = np.where(d > 0, (1 / (d ** 2)) * total_kerma_at_1m_mGy_wk, 0.0)
+    return K_tu, K1sec_head_mGy_paz, K1sec_body_mGy_paz
+
+
+def calcola_spessore_tc_array(
+    P, T, d, Xpre, N_head, N_body, Kc, alpha, beta, gamma,
+    DLP_head=DLP_TC_FIXED_VALUES["HEAD"], DLP_body=DLP_TC_FIXED_VALUES["BODY"], tabella=None,
+):
+    """
+    Versione vettoriale di calculate_tc_thickness (Ramo 3) sui coefficienti già risolti.
+    Restituisce (X_finale_mm, K_tu, B, Xref_mm, valido, K1sec_head, K1sec_body).
+    Con tabella (es. TabellaSpessoreInverso) l'inversione usa tabella.spessore_array.
+    """
+    K_tu, K1sec_head_mGy_paz, K1sec_body_mGy_paz = calcola_kerma_tc_array(d, N_head, N_body, Kc, DLP_head, DLP_body)
+
+    P = np.asarray(P, dtype=float)
+    T = np.asarray(T, dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        B = np.where((K_tu * T <= 0) | (P == 0), 1.0, P / (T * K_tu))
+
+    if tabella is None:
+        Xref_mm, valido = calcola_spessore_x_array(alpha, beta, gamma, B)
+    else:
+        Xref_mm, valido = tabella.spessore_array(B)
+    Xref_mm = np.where(valido, Xref_mm, SPESSORE_NON_VALIDO_MM)
+    X_finale_mm = np.maximum(0.0, Xref_mm - Xpre)
+    return X_finale_mm, K_tu, B, Xref_mm, valido, K1sec_head_mGy_paz, K1sec_body_mGy_paz
@@ -0,0 +1,156 @@
+"""
+Trasmissione integrata sullo spettro di carico (mA·min per kVp), con tabelle precalcolate in cache.
+"""
+
+from collections import OrderedDict
+
+import numpy as np
+
+from .analitica import SPESSORE_NON_VALIDO_MM, _log_trasmissione_e_derivata, risolvi_spessore_somma_array
+from .dati import ATTENUATION_DATA_KVP
+
+
+# Rendimento del tubo per mA·min assunto proporzionale a kVp^n (peso di ciascun bin dello spettro)
+WORKLOAD_OUTPUT_KVP_EXPONENT = 2.0
+
+# Griglia degli spessori delle tabelle integrate: spessore massimo (mm) per materiale e numero di punti
+WORKLOAD_X_MAX_MM = {"PIOMBO": 10.0, "CEMENTO": 600.0}
+WORKLOAD_GRID_POINTS = 4096
+
+
+def normalizza_spettro_carico(spettro):
+    """
+    Converte uno spettro di carico {kVp: mA·min} (o coppie (kVp, mA·min); kVp come 100, "100" o "100 kVp")
+    nella forma canonica ((kVp, frazione), ...) ordinata per kVp, con frazioni a somma 1 e bin nulli omessi.
+    È la chiave della cache delle tabelle. Solleva ValueError per kVp non tabulati o carichi non validi.
+    """
+    kvp_tabulati = ATTENUATION_DATA_KVP["PIOMBO"]
+    carico = {}
+    for kvp, mA_min in dict(spettro).items():
+        try:
+            kvp = int(float(str(kvp).lower().replace("kvp", "").strip()))
+        except ValueError:
+            raise ValueError(f"kVp '{kvp}' non valido nello spettro di carico.") from None
+        if kvp not in kvp_tabulati:
+            raise ValueError(f"kVp {kvp} non tabulato (disponibili: {', '.join(map(str, kvp_tabulati))}).")
+        mA_min = float(mA_min)
+        if not mA_min >= 0:
+            raise ValueError(f"Carico non valido per {kvp} kVp: {mA_min} mA·min.")
+        carico[kvp] = carico.get(kvp, 0.0) + mA_min
+
+    totale = sum(carico[k] for k in sorted(carico))
+    if not 0 < totale < float('inf'):
+        raise ValueError("Lo spettro di carico deve avere carico totale positivo.")
+    return tuple((k, carico[k] / totale) for k in sorted(carico) if carico[k] > 0)
+
+
+class TabellaTrasmissioneSpettro:
+    """
+    Curva di trasmissione integrata su uno spettro di carico, precalcolata su una griglia di spessori:
+        B_W(x) = somma_i w_i * R_i * B_i(x) / somma_i w_i * R_i
+    con w_i frazione di carico del bin i, R_i ∝ kVp_i^n rendimento e B_i fit di Archer a singolo kVp.
+    log B_W (monotona decrescente) è tabulato: trasmissione e spessore inverso si ottengono per
+    interpolazione lineare in log B. Oltre lo spessore massimo della griglia si usa il calcolo esatto
+    (somma dei bin e risolvi_spessore_somma_array); per x < 0 (B > 1) l'estrapolazione lineare.
+    """
+
+    def __init__(self, materiale, spettro, n_punti=WORKLOAD_GRID_POINTS):
+        if materiale not in ATTENUATION_DATA_KVP:
+            raise ValueError(f"Materiale '{materiale}' non disponibile per lo spettro di carico.")
+        self.materiale = materiale
+        self.spettro = normalizza_spettro_carico(spettro)
+
+        kvp = np.array([k for k, _ in self.spettro], dtype=float)
+        pesi = np.array([w for _, w in self.spettro]) * kvp ** WORKLOAD_OUTPUT_KVP_EXPONENT
+        att = np.array([[ATTENUATION_DATA_KVP[materiale][k][c] for c in ('alpha', 'beta', 'gamma')] for k, _ in self.spettro])
+
+        self._pesi = pesi / pesi.sum()
+        self._att = att
+        self.x = np.linspace(0.0, WORKLOAD_X_MAX_MM[materiale], n_punti)
+        self.log_B = self._log_trasmissione_esatta(self.x)
+        self.log_B[0] = 0.0
+        self._pendenza_testa = (self.log_B[1] - self.log_B[0]) / (self.x[1] - self.x[0])
+
+    def _log_trasmissione_esatta(self, x):
+        log_B_bin, _ = _log_trasmissione_e_derivata(self._att[:, 0, None], self._att[:, 1, None], self._att[:, 2, None], x)
+        # log(somma_i w_i * B_i) in forma stabile (log-sum-exp pesato)
+        massimo = log_B_bin.max(axis=0)
+        return massimo + np.log(self._pesi @ np.exp(log_B_bin - massimo))
+
+    def trasmissione_array(self, x):
+        """ B_W(x) vettoriale (x in mm). """
+        x = np.asarray(x, dtype=float)
+        log_B = np.interp(x, self.x, self.log_B)
+        log_B = np.where(x < 0, x * self._pendenza_testa, log_B)
+        oltre = x > self.x[-1]
+        if oltre.any():
+            log_B[oltre] = self._log_trasmissione_esatta(x[oltre])
+        return np.exp(log_B)
+
+    def spessore_array(self, B):
+        """
+        Spessore inverso vettoriale, stessa semantica di calcola_spessore_x_array: restituisce (x, valido),
+        x = 0.0 dove B non è positivo e finito; per B >= 1 (nessuna schermatura necessaria) x = 0.0.
+        """
+        B = np.asarray(B, dtype=float)
+        valido = (B > 0) & np.isfinite(B)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            log_B = np.log(np.where(valido, B, 1.0))
+        # np.interp satura a x = 0.0 per log_B > 0 (B > 1)
+        x = np.interp(-log_B, -self.log_B, self.x)
+        oltre = log_B < self.log_B[-1]
+        if oltre.any():
+            x[oltre] = risolvi_spessore_somma_array(
+                np.broadcast_to(self._pesi, (int(oltre.sum()), len(self._pesi))),
+                self._att[:, 0], self._att[:, 1], self._att[:, 2], 0.0, B[oltre],
+            )[0]
+        return np.where(valido, np.maximum(x, 0.0), 0.0), valido
+
+
+class CacheTabelleSpettro:
+    """
+    Cache LRU delle TabellaTrasmissioneSpettro, indicizzata da (materiale, spettro normalizzato):
+    calcoli ripetuti con la stessa distribuzione di carico riusano la tabella senza reintegrare.
+    """
+
+    def __init__(self, max_tabelle=64):
+        self.max_tabelle = max_tabelle
+        self._tabelle = OrderedDict()
+        self.hit = 0
+        self.miss = 0
+
+    def tabella(self, materiale, spettro):
+        chiave = (materiale, normalizza_spettro_carico(spettro))
+        tabella = self._tabelle.get(chiave)
+        if tabella is not None:
+            self.hit += 1
+            self._tabelle.move_to_end(chiave)
+            return tabella
+
+        self.miss += 1
+        tabella = TabellaTrasmissioneSpettro(materiale, chiave[1])
+        self._tabelle[chiave] = tabella
+        while len(self._tabelle) > self.max_tabelle:
+            self._tabelle.popitem(last=False)
+        return tabella
+
+
+SPECTRUM_TABLE_CACHE = CacheTabelleSpettro()
+
+
+def tabella_spettro(materiale, spettro):
+    """ Tabella integrata per (materiale, spettro di carico), dalla cache condivisa. """
+    return SPECTRUM_TABLE_CACHE.tabella(materiale, spettro)
+
+
+def descrivi_spettro_carico(spettro):
+    """ Descrizione breve dello spettro normalizzato, es. '70 kVp 25%, 100 kVp 75%'. """
+    return ", ".join(f"{kvp} kVp {frazione:.0%}" for kvp, frazione in normalizza_spettro_carico(spettro))
+
+
+def calcola_spessore_x_spettro(materiale, spettro, B):
+    """ Versione scalare di TabellaTrasmissioneSpettro.spessore_array (999.0 se non calcolabile). """
+    if B is None:
+        return SPESSORE_NON_VALIDO_MM
+    x, valido = tabella_spettro(materiale, spettro).spessore_array(B)
+    return float(x) if valido else SPESSORE_NON_VALIDO_MM
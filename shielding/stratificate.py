@@ -0,0 +1,126 @@
+"""
+Barriere composte (stratificate): una parete formata da più strati di materiali diversi.
+"""
+
+import numpy as np
+import pandas as pd
+
+from .analitica import SPESSORE_NON_VALIDO_MM, _log_trasmissione_e_derivata, risolvi_spessore_somma_array
+from .batch import BATCH_COLUMN_DEFAULTS, _normalizza_tabella_barriere, _rami_componenti
+from .calcolo import CALC_ERROR_MESSAGES, RAMO_LOGICO_LABELS
+from .coefficienti import COEFF_STORE
+
+
+# Colonna che identifica la barriera (parete) a cui appartiene ogni strato
+COMPOSITE_WALL_COLUMN = 'barriera'
+
+# Spessore dello strato [mm]: vuoto (NaN) per lo strato incognito da dimensionare
+COMPOSITE_LAYER_COLUMN = 'spessore_strato_mm'
+
+
+def calculate_composite_walls(df):
+    """
+    Calcolo di barriere composte: ogni riga di df è uno strato (materiale_schermatura, spessore_strato_mm) e
+    le righe con lo stesso valore di 'barriera' formano la stessa parete. I parametri della barriera (tipo
+    immagine, modalità, tipo di barriera, d, U, N, P, T, X_PRE_mm, modello secondario, campi TC) sono quelli
+    della prima riga del gruppo; ogni parete deve avere uno e un solo strato incognito (spessore vuoto).
+    La trasmissione della parete è il prodotto delle trasmissioni di Archer dei singoli strati, ciascuno con
+    i fit del proprio materiale (nessun indurimento del fascio tra uno strato e il successivo); gli spessori
+    degli strati noti devono essere finiti e non negativi. Per ogni componente c (fascio combinato, oppure
+    Fuga e Diffusione) con kerma K_c e trasmissione degli strati noti T_c si risolve lo spessore x dello
+    strato incognito k tale che
+        somma_c K_c * T_c * B_c,k(x + Xpre) = P / T
+    in un'unica risoluzione vettoriale su tutte le pareti (Xpre è equivalente nel materiale dello strato
+    incognito). Con un solo strato il risultato coincide con run_shielding_calculation; lo spettro di carico
+    non è supportato. Restituisce un DataFrame indicizzato per barriera.
+    """
+    df = _normalizza_tabella_barriere(df).reset_index(drop=True)
+    if COMPOSITE_LAYER_COLUMN in df.columns:
+        spessore_strato = df[COMPOSITE_LAYER_COLUMN].to_numpy(dtype=float)
+    else:
+        spessore_strato = np.full(len(df), np.nan)
+
+    cod_parete, pareti = pd.factorize(df[COMPOSITE_WALL_COLUMN])
+    n_pareti = len(pareti)
+    posizione = df.groupby(cod_parete).cumcount().to_numpy()
+    prima_riga = np.flatnonzero(posizione == 0)[np.argsort(cod_parete[posizione == 0])]
+    parete = df.iloc[prima_riga]
+
+    # --- Ramo logico, errori, kerma per componente (prima riga) e coefficienti di ogni strato ---
+    w = cod_parete
+    ramo, errore, kerma, att, componenti = _rami_componenti(
+        parete,
+        COEFF_STORE.ids_modalita(parete['modalita_radiografia']),
+        COEFF_STORE.ids_materiale(df['materiale_schermatura']),
+        COEFF_STORE.ids_kvp(parete['kvp_tc']),
+        strato_barriera=w,
+    )
+    P = parete['P_mSv_wk'].to_numpy(dtype=float)
+    T = parete['tasso_occupazione_T'].to_numpy(dtype=float)
+    Xpre = parete['X_PRE_mm'].to_numpy(dtype=float)
+    tc = ramo == 3
+
+    # Uno e un solo strato incognito; strati noti con spessore finito e non negativo
+    incognito = np.isnan(spessore_strato)
+    non_validi = ~incognito & ~(np.isfinite(spessore_strato) & (spessore_strato >= 0))
+    errore[(errore == 0) & (np.bincount(w, weights=incognito, minlength=n_pareti) != 1)] = 8
+    errore[(errore == 0) & (np.bincount(w, weights=non_validi, minlength=n_pareti) > 0)] = 9
+    componenti &= (errore == 0)[:, None]
+    calcolata = componenti[:, 0]
+
+    # Trasmissione degli strati noti: somma dei log B per parete e componente
+    noti = ~incognito
+    x_noti = np.where(noti, spessore_strato, 0.0)
+    log_B = _log_trasmissione_e_derivata(att[..., 0], att[..., 1], att[..., 2], x_noti[:, None])[0]
+    log_B = np.where(noti[:, None] & componenti[w], log_B, 0.0)
+    log_T_noti = np.stack([np.bincount(w, weights=log_B[:, c], minlength=n_pareti) for c in range(2)], axis=1)
+
+    riga_incognita = np.zeros(n_pareti, dtype=np.intp)
+    riga_incognita[w[incognito]] = np.flatnonzero(incognito)
+    att_k = att[riga_incognita]
+    K_eff = np.where(componenti, kerma * np.exp(log_T_noti), 0.0)
+
+    kerma_totale = np.where(calcolata, kerma.sum(axis=1), 0.0)
+    nullo = (kerma_totale * T == 0) | (P == 0)
+    # Come nel calcolo a singolo strato: TC con B = 1, diagnostica con kerma 0.0
+    tc_nullo = tc & (kerma_totale * T <= 0) & (P != 0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        obiettivo = P / T
+        spessore, valido = risolvi_spessore_somma_array(
+            K_eff, att_k[..., 0], att_k[..., 1], att_k[..., 2], Xpre[:, None], obiettivo,
+        )
+        B = np.where(nullo, np.where(tc_nullo, 1.0, np.nan), obiettivo / kerma_totale)
+        trasmissione_noti = np.where(nullo, np.nan, K_eff.sum(axis=1) / kerma_totale)
+
+    zero = nullo | ~calcolata
+    spessore = np.where(valido, spessore, SPESSORE_NON_VALIDO_MM)
+    spessore = np.where(zero, 0.0, spessore)
+    valido = (valido | zero) & (errore == 0)
+    kerma_totale = np.where(nullo & ~tc, 0.0, kerma_totale)
+
+    return pd.DataFrame({
+        'ramo_logico': pd.Categorical.from_codes(ramo, categories=RAMO_LOGICO_LABELS),
+        'n_strati': np.bincount(w, minlength=n_pareti),
+        'materiale_strato_incognito': df['materiale_schermatura'].to_numpy(dtype=object)[riga_incognita],
+        'spessore_strati_noti_mm': np.bincount(w, weights=x_noti, minlength=n_pareti),
+        'kerma_non_schermato': kerma_totale,
+        'trasmittanza_B': B,
+        'trasmissione_strati_noti': trasmissione_noti,
+        'spessore_finale_mm': spessore,
+        'spessore_valido': valido,
+        'errore': pd.Categorical.from_codes(errore - 1, categories=CALC_ERROR_MESSAGES[1:]),
+    }, index=pd.Index(pareti, name=COMPOSITE_WALL_COLUMN))
+
+
+def run_composite_calculation(params, strati):
+    """
+    Versione per una sola barriera: params come per run_shielding_calculation (materiale escluso), strati
+    una lista di dizionari {'materiale_schermatura', 'spessore_strato_mm'} con spessore None per lo strato
+    incognito. Restituisce il dizionario dei risultati.
+    """
+    barriera = {k: v for k, v in params.items() if k in BATCH_COLUMN_DEFAULTS and k != 'materiale_schermatura'}
+    righe = [{**barriera, **strato, COMPOSITE_WALL_COLUMN: 0} for strato in strati]
+    risultato = calculate_composite_walls(pd.DataFrame(righe)).iloc[0].to_dict()
+    if pd.isna(risultato['errore']):
+        del risultato['errore']
+    return risultato
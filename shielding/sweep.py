@@ -0,0 +1,110 @@
+"""
+Analisi parametrica (sweep) su griglie di due parametri, con cache a livello di riga/colonna.
+"""
+
+from collections import OrderedDict
+
+import numpy as np
+
+from .calcolo import run_shielding_calculation_array
+
+
+# Parametri numerici variabili nello sweep: (etichetta, limiti del cursore, intervallo di default)
+SWEEP_AXES = {
+    'distanza_d': ("Distanza dalla Sorgente (d) [metri]", (0.1, 50.0), (0.5, 10.0)),
+    'pazienti_settimana_N': ("Pazienti/Settimana (N)", (1.0, 2000.0), (10.0, 500.0)),
+    'tasso_occupazione_T': ("Tasso Occupazione (T)", (0.0, 1.0), (0.025, 1.0)),
+    'fattore_uso_U': ("Fattore di Uso (U)", (0.0, 1.0), (0.05, 1.0)),
+    'P_mSv_wk': ("Dose Limite (P) [mSv/settimana]", (0.0, 1.0), (0.002, 0.1)),
+    'weekly_n_head': ("WEEKLY N HEAD PROCED", (0.0, 1000.0), (0.0, 200.0)),
+    'weekly_n_body': ("WEEKLY N BODY PROCED", (0.0, 1000.0), (0.0, 300.0)),
+}
+
+# Grandezze memorizzate per ogni punto della griglia
+SWEEP_FIELDS = ('spessore_finale_mm', 'kerma_non_schermato', 'trasmittanza_B', 'Xref_mm')
+
+
+def calcola_sweep(params, asse_x, valori_x, asse_y, valori_y, tabelle=None):
+    """
+    Valuta l'intera griglia cartesiana (asse_y x asse_x) in un'unica operazione vettoriale.
+    Gli altri parametri restano quelli di params. Restituisce il dizionario di
+    run_shielding_calculation_array con array di forma (len(valori_y), len(valori_x)).
+    tabelle (TabelleSpessoreInverso) sostituisce la formula inversa esatta con le tabelle precalcolate.
+    """
+    p = dict(params)
+    p[asse_x] = np.asarray(valori_x, dtype=float)[None, :]
+    p[asse_y] = np.asarray(valori_y, dtype=float)[:, None]
+    return run_shielding_calculation_array(p, tabelle=tabelle)
+
+
+class SweepCache:
+    """
+    Cache LRU dello sweep a livello di riga/colonna della griglia.
+    Ogni colonna è indicizzata da (parametri fissi, valori dell'altro asse, valore x), e ogni riga
+    analogamente: raffinando un solo asse si ricalcolano soltanto le linee nuove. Con tabelle
+    (TabelleSpessoreInverso) tutte le linee della cache sono calcolate con le tabelle precalcolate.
+    """
+
+    def __init__(self, max_linee=20_000, tabelle=None):
+        self.max_linee = max_linee
+        self.tabelle = tabelle
+        self._linee = OrderedDict()
+
+    @staticmethod
+    def _chiave_base(params, asse_x, asse_y):
+        return tuple(sorted((k, v) for k, v in params.items() if k not in (asse_x, asse_y)))
+
+    def _leggi(self, chiave):
+        linea = self._linee.get(chiave)
+        if linea is not None:
+            self._linee.move_to_end(chiave)
+        return linea
+
+    def _scrivi(self, chiave, linea):
+        self._linee[chiave] = linea
+        self._linee.move_to_end(chiave)
+        while len(self._linee) > self.max_linee:
+            self._linee.popitem(last=False)
+
+    def griglia(self, params, asse_x, valori_x, asse_y, valori_y):
+        """
+        Come calcola_sweep, ma riusa le righe/colonne già calcolate.
+        Restituisce un dizionario {campo: array (ny, nx)} per SWEEP_FIELDS, oppure {'errore': ...}.
+        """
+        valori_x = np.asarray(valori_x, dtype=float)
+        valori_y = np.asarray(valori_y, dtype=float)
+        base = self._chiave_base(params, asse_x, asse_y)
+        chiave_col = (base, asse_y, valori_y.tobytes(), asse_x)
+        chiave_riga = (base, asse_x, valori_x.tobytes(), asse_y)
+
+        colonne = [self._leggi((chiave_col, x)) for x in valori_x.tolist()]
+        righe = [self._leggi((chiave_riga, y)) for y in valori_y.tolist()]
+        mancanti_col = [i for i, c in enumerate(colonne) if c is None]
+        mancanti_riga = [i for i, r in enumerate(righe) if r is None]
+
+        if len(mancanti_riga) * len(valori_x) < len(mancanti_col) * len(valori_y):
+            # Completa per righe
+            if mancanti_riga:
+                nuovo = calcola_sweep(params, asse_x, valori_x, asse_y, valori_y[mancanti_riga], self.tabelle)
+                if 'errore' in nuovo:
+                    return {'errore': nuovo['errore']}
+                for k, i in enumerate(mancanti_riga):
+                    righe[i] = np.stack([nuovo[f][k] for f in SWEEP_FIELDS])
+            griglia = np.stack(righe, axis=1)
+        else:
+            # Completa per colonne
+            if mancanti_col:
+                nuovo = calcola_sweep(params, asse_x, valori_x[mancanti_col], asse_y, valori_y, self.tabelle)
+                if 'errore' in nuovo:
+                    return {'errore': nuovo['errore']}
+                for k, i in enumerate(mancanti_col):
+                    colonne[i] = np.stack([nuovo[f][:, k] for f in SWEEP_FIELDS])
+            griglia = np.stack(colonne, axis=2)
+
+        # Memorizza la griglia in entrambi gli orientamenti per i raffinamenti successivi
+        for i, x in enumerate(valori_x.tolist()):
+            self._scrivi((chiave_col, x), griglia[:, :, i])
+        for i, y in enumerate(valori_y.tolist()):
+            self._scrivi((chiave_riga, y), griglia[:, i, :])
+
+        return {campo: griglia[k] for k, campo in enumerate(SWEEP_FIELDS)}
@@ -0,0 +1,204 @@
+"""
+Tabelle precalcolate dello spessore inverso x(-log B) per ogni fit di attenuazione (float32, mappabili
+in memoria da file), per ricerche rapide nelle analisi interattive (sweep).
+"""
+
+import math
+import os
+
+import numpy as np
+
+from .analitica import calcola_spessore_x, calcola_spessore_x_array
+from .coefficienti import COEFF_STORE
+
+
+# Errore massimo garantito dell'interpolazione (mm) e intervallo tabulato di -log B (B >= e^-40 ≈ 4e-18)
+INVERSE_TABLE_MAX_ERROR_MM = 1e-3
+INVERSE_TABLE_U_MAX = 40.0
+
+# Variabile d'ambiente con la cartella dei file .npy (tabelle mappate in memoria)
+INVERSE_TABLE_PATH_ENV = "SHIELDING_TABELLE_INVERSE"
+
+# Errore di arrotondamento float32 relativo a max x: nodi memorizzati (2^-24) e differenza tra nodi (2^-24)
+_ARROTONDAMENTO_FLOAT32 = 2 * 2.0 ** -24
+
+
+def _spessore_esatto(att, u):
+    """
+    Formula inversa di Archer in funzione di u = -log B (float64, forma stabile per u grandi):
+        x = [ gamma*u + log(1 + c*e^(-gamma*u)) - log(1 + c) ] / (alpha*gamma),  c = beta/alpha
+    att ha forma (n, 3), u (m,): restituisce (n, m).
+    """
+    alpha, beta, gamma = (att[:, k, None] for k in range(3))
+    c = beta / alpha
+    return (gamma * u + np.log1p(c * np.exp(-gamma * u)) - np.log1p(c)) / (alpha * gamma)
+
+
+def _curvatura_massima(att):
+    """
+    Massimo di |d²x/du²| per u >= 0: con s = e^(gamma*u), x'' = (gamma/alpha) * c*s / (s + c)²,
+    il cui massimo su s >= 1 è 1/4 (in s = c) per c >= 1, altrimenti |c| / (1 + c)² (in s = 1).
+    """
+    alpha, beta, gamma = att.T
+    c = beta / alpha
+    return np.abs(gamma / alpha) * np.where(c >= 1, 0.25, np.abs(c) / (1 + c) ** 2)
+
+
+class TabellaSpessoreInverso:
+    """
+    Tabella di un solo fit, con l'interfaccia di TabellaTrasmissioneSpettro usata da
+    calcola_spessore_barriera_array (parametro tabella).
+    """
+
+    def __init__(self, tabelle, fit):
+        self._tabelle = tabelle
+        self.fit = fit
+        self.errore_max_mm = float(tabelle.errore_max_mm[fit]) if fit >= 0 else 0.0
+
+    def spessore_array(self, B):
+        return self._tabelle.spessore_array(self.fit, B)
+
+    def spessore(self, B):
+        """ Versione scalare (solo math), con la semantica di calcola_spessore_x: 999.0 se non calcolabile. """
+        return self._tabelle.spessore(self.fit, B)
+
+
+class TabelleSpessoreInverso:
+    """
+    Spessore x in funzione di u = -log B per tutti i fit distinti di ATTENUATION_DATA_PRIMARY/SECONDARY/TC,
+    su una griglia uniforme comune u_k = k * passo in [0, INVERSE_TABLE_U_MAX], memorizzato in un array
+    float32 (n_fit, n_punti). La ricerca è un'interpolazione lineare (monotona come x(u)) con indice
+    diretto, senza pow né log per riga oltre a log B. Il passo è scelto dalla curvatura massima dei fit:
+        errore <= passo² / 8 * max|x''| + 2 * 2^-24 * max x  <=  errore_max_mm
+    (errore_max_mm per fit nell'omonimo attributo). Fuori dall'intervallo (B > 1, B < e^-U_MAX, valori non
+    finiti) e per fit sconosciuti (-1) si usa la formula esatta calcola_spessore_x_array.
+
+    fit_primaria[mod, mat], fit_secondaria[mod, mat] e fit_tc[mat, kvp] sono gli indici dei fit con gli
+    stessi ID di COEFF_STORE (-1 per la posizione finale delle chiavi sconosciute). Con percorso (cartella)
+    la tabella è letta da un file .npy mappato in memoria, creato alla prima esecuzione; il nome del file
+    dipende dalla versione dei coefficienti e dall'errore massimo.
+    """
+
+    def __init__(self, errore_max_mm=INVERSE_TABLE_MAX_ERROR_MM, percorso=None):
+        famiglie = (COEFF_STORE.att_primaria, COEFF_STORE.att_secondaria, COEFF_STORE.att_tc)
+        tutti = np.concatenate([att.reshape(-1, 3) for att in famiglie])
+        definiti = ~np.isnan(tutti).any(axis=1) & (tutti[:, 0] != 0) & (tutti[:, 2] != 0) & (tutti[:, 1] / tutti[:, 0] > -1)
+        self.att, inverso = np.unique(tutti[definiti], axis=0, return_inverse=True)
+        indici = np.full(len(tutti), -1, dtype=np.intp)
+        indici[definiti] = inverso.ravel()
+        inizio = 0
+        for nome, att in zip(('fit_primaria', 'fit_secondaria', 'fit_tc'), famiglie):
+            n = att.shape[0] * att.shape[1]
+            setattr(self, nome, indici[inizio:inizio + n].reshape(att.shape[:2]))
+            inizio += n
+
+        # Passo comune: la quota di errore non assorbita dall'arrotondamento float32 va all'interpolazione
+        x_max = _spessore_esatto(self.att, np.array([INVERSE_TABLE_U_MAX]))[:, 0]
+        curvatura = _curvatura_massima(self.att)
+        margine = errore_max_mm - _ARROTONDAMENTO_FLOAT32 * x_max
+        if (margine <= 0).any():
+            raise ValueError(f"Errore massimo {errore_max_mm} mm non ottenibile con tabelle float32.")
+        passo_max = np.sqrt(8 * margine / np.maximum(curvatura, np.finfo(float).tiny))
+        self.n_punti = int(np.ceil(INVERSE_TABLE_U_MAX / min(passo_max.min(), INVERSE_TABLE_U_MAX))) + 1
+        self.passo = INVERSE_TABLE_U_MAX / (self.n_punti - 1)
+        self.errore_max_mm = self.passo ** 2 / 8 * curvatura + _ARROTONDAMENTO_FLOAT32 * x_max
+
+        if percorso is None:
+            self.valori = self._calcola_valori()
+        else:
+            self.valori = self._valori_da_file(percorso, errore_max_mm)
+        self._piatti = self.valori.reshape(-1)
+        self._righe = [memoryview(riga) for riga in np.ascontiguousarray(self.valori)]
+
+    def _calcola_valori(self):
+        u = np.arange(self.n_punti) * self.passo
+        return _spessore_esatto(self.att, u).astype(np.float32)
+
+    def _valori_da_file(self, percorso, errore_max_mm):
+        """ Tabella mappata in memoria dal file .npy della cartella (creato in modo atomico se assente). """
+        from .cache_persistente import versione_coefficienti
+
+        os.makedirs(percorso, exist_ok=True)
+        nome = os.path.join(percorso, f"spessore_inverso-{versione_coefficienti()[:16]}-{errore_max_mm:g}mm.npy")
+        forma = (len(self.att), self.n_punti)
+        if os.path.exists(nome):
+            valori = np.load(nome, mmap_mode='r')
+            if valori.shape == forma and valori.dtype == np.float32:
+                return valori
+        temporaneo = f"{nome}.{os.getpid()}.tmp"
+        with open(temporaneo, "wb") as f:
+            np.save(f, self._calcola_valori())
+        os.replace(temporaneo, nome)
+        return np.load(nome, mmap_mode='r')
+
+    def tabella(self, fit):
+        """ TabellaSpessoreInverso del fit (indice di fit_primaria/fit_secondaria/fit_tc). """
+        return TabellaSpessoreInverso(self, int(fit))
+
+    def spessore(self, fit, B):
+        """
+        Spessore inverso scalare per un fit e una trasmittanza B: interpolazione in Python puro (un solo
+        math.log), senza passare da array NumPy. Come calcola_spessore_x restituisce 999.0 se non calcolabile.
+        """
+        try:
+            posizione = -math.log(B) / self.passo
+        except (TypeError, ValueError):
+            posizione = -1.0
+        if fit < 0 or not 0 <= posizione <= self.n_punti - 1:
+            return calcola_spessore_x(*(self.att[fit] if fit >= 0 else (np.nan,) * 3), B)
+        indice = min(int(posizione), self.n_punti - 2)
+        x0, x1 = self._righe[fit][indice:indice + 2]
+        return x0 + (posizione - indice) * (x1 - x0)
+
+    def spessore_array(self, fit, B):
+        """
+        Spessore inverso vettoriale per indici di fit e trasmittanze B broadcastabili, con la semantica di
+        calcola_spessore_x_array: restituisce (x, valido), x = 0.0 dove non calcolabile.
+        """
+        fit, B = np.broadcast_arrays(np.asarray(fit, dtype=np.intp), np.asarray(B, dtype=float))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            posizione = np.log(B)
+        posizione *= -1.0 / self.passo
+        in_tabella = (posizione >= 0) & (posizione <= self.n_punti - 1)
+        if fit.ndim and fit.strides == (0,) * fit.ndim:
+            fit = fit.reshape(-1)[0] if fit.size else fit
+        if np.ndim(fit) or fit < 0:
+            in_tabella &= fit >= 0
+        esterni = ~in_tabella
+        fuori = esterni.any()
+        if fuori:
+            np.copyto(posizione, 0.0, where=esterni)
+
+        # Interpolazione lineare tra i nodi k e k+1 (vista spostata di un elemento), calcolata sul posto
+        indice = posizione.astype(np.intp)
+        np.minimum(indice, self.n_punti - 2, out=indice)
+        posizione -= indice
+        if np.ndim(fit) or fit > 0:
+            indice += np.maximum(fit, 0) * self.n_punti
+        x0 = self._piatti.take(indice)
+        differenza = self._piatti[1:].take(indice)
+        differenza -= x0
+        x = posizione
+        x *= differenza
+        x += x0
+        valido = in_tabella
+
+        if fuori:
+            fit = np.broadcast_to(fit, B.shape)[esterni]
+            att = np.vstack([self.att, np.full(3, np.nan)])[fit]
+            x[esterni], valido[esterni] = calcola_spessore_x_array(att[:, 0], att[:, 1], att[:, 2], B[esterni])
+        return x, valido
+
+
+_tabelle = None
+
+
+def tabelle_spessore_inverso():
+    """
+    TabelleSpessoreInverso condivise dal processo, create alla prima chiamata (in memoria, oppure mappate
+    dalla cartella indicata dalla variabile d'ambiente SHIELDING_TABELLE_INVERSE).
+    """
+    global _tabelle
+    if _tabelle is None:
+        _tabelle = TabelleSpessoreInverso(percorso=os.environ.get(INVERSE_TABLE_PATH_ENV))
+    return _tabelle
@@ -0,0 +1,228 @@
+"""
+Tasso di dose nel tempo da un programma di esami: il programma (un esame per riga, con stanza e orario di
+inizio) è letto a blocchi e ridotto per stanza, così la memoria dipende dal numero di stanze e non dalla
+lunghezza del programma. Per ogni barriera: TADR (media su 40 ore settimanali), picco orario e profilo
+della settimana tipo del tasso di kerma trasmesso.
+"""
+
+import numpy as np
+import pandas as pd
+
+from .batch import BATCH_CHUNK_SIZE, BATCH_FACILITY_COLUMN, BATCH_ROOM_COLUMN, _normalizza_tabella_barriere, iter_barrier_table
+from .coefficienti import COEFF_STORE
+from .verifica import COMPLIANCE_RELATIVE_TOLERANCE, calculate_compliance_chunk
+
+
+# Colonne del programma: orario di inizio dell'esame e numero di esami della riga (default 1)
+DOSE_RATE_TIME_COLUMN = 'inizio'
+DOSE_RATE_COUNT_COLUMN = 'n_esami'
+
+# Ore lavorative settimanali per il TADR (NCRP 147/151: R_W = dose settimanale / 40 h)
+DOSE_RATE_WORK_HOURS = 40.0
+
+# Ore della settimana tipo (lunedì 00:00 = 0); il 1970-01-01 (ora 0 di datetime64) era un giovedì
+DOSE_RATE_WEEK_HOURS = 168
+_SCOSTAMENTO_LUNEDI_H = 72
+
+
+def _chiavi_stanza(df, colonne):
+    """ Chiave di stanza (impianto e stanza uniti) come Series di stringhe; celle vuote -> "". """
+    chiave = None
+    for col in colonne:
+        valori = df[col].fillna("").astype(str) if col in df.columns else pd.Series("", index=df.index)
+        chiave = valori if chiave is None else chiave + "\x1f" + valori
+    return chiave
+
+
+class TassoDoseProgrammato:
+    """
+    Accumulatore del programma di esami per le stanze di una tabella di barriere (colonne come
+    calculate_compliance_chunk, con spessore_installato_mm; 'impianto' e 'stanza' associano le barriere
+    agli esami). Il kerma trasmesso per esame di ogni barriera è il kerma trasmesso settimanale della
+    verifica di conformità diviso per il carico settimanale (N, oppure N_head + N_body per la TC): il
+    programma ne ridistribuisce nel tempo il numero di esami. Ogni esame è attribuito all'ora del suo inizio.
+
+    aggiungi() riceve blocchi del programma ordinati per orario (colonne 'inizio', 'stanza', eventualmente
+    'impianto' e 'n_esami'); per stanza restano in memoria solo il profilo della settimana tipo (168 ore),
+    il totale degli esami e il picco orario, più le ore aperte a cavallo dei blocchi. Se la tabella delle
+    barriere ha 'impianto' e il programma no, gli esami sono associati per sola 'stanza' (ValueError se lo
+    stesso nome di stanza compare in più impianti).
+    """
+
+    def __init__(self, barriere, coefficienti=COEFF_STORE):
+        df = _normalizza_tabella_barriere(pd.DataFrame(barriere))
+        self.indice = df.index
+        verifica = calculate_compliance_chunk(df, coefficienti)
+
+        tc = (verifica['ramo_logico'].cat.codes == 3).to_numpy()
+        carico = np.where(
+            tc,
+            df['weekly_n_head'].to_numpy(dtype=float) + df['weekly_n_body'].to_numpy(dtype=float),
+            df['pazienti_settimana_N'].to_numpy(dtype=float),
+        )
+        kerma_trasmesso = verifica['kerma_trasmesso'].to_numpy(dtype=float)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            self.kerma_esame = np.where(carico > 0, kerma_trasmesso / carico, np.where(np.isnan(kerma_trasmesso), np.nan, 0.0))
+        self.T = df['tasso_occupazione_T'].to_numpy(dtype=float)
+        self.P = df['P_mSv_wk'].to_numpy(dtype=float)
+        self.errore = verifica['errore']
+
+        self._colonne_stanza = [col for col in (BATCH_FACILITY_COLUMN, BATCH_ROOM_COLUMN) if col in df.columns]
+        if not self._colonne_stanza:
+            raise ValueError(f"La tabella delle barriere deve contenere la colonna '{BATCH_ROOM_COLUMN}'.")
+        self.codici_stanza, self.stanze = pd.factorize(_chiavi_stanza(df, self._colonne_stanza))
+        n_stanze = len(self.stanze)
+        # Nome della sola stanza per ogni chiave (programmi senza la colonna 'impianto')
+        prima_barriera = np.unique(self.codici_stanza, return_index=True)[1]
+        self._solo_stanza = pd.Index(_chiavi_stanza(df, [BATCH_ROOM_COLUMN]).to_numpy()[prima_barriera])
+
+        self.conteggi_settimana = np.zeros((n_stanze, DOSE_RATE_WEEK_HOURS))
+        self.totale = np.zeros(n_stanze)
+        self.picco = np.zeros(n_stanze)
+        self.ora_picco = np.full(n_stanze, -1, dtype=np.int64)
+        self.esami_ignorati = 0.0
+        self._pendenti = np.zeros(n_stanze)
+        self._ora_corrente = None
+        self._prima_ora = None
+
+    def aggiungi(self, programma):
+        """
+        Aggiunge un blocco del programma (DataFrame). Gli esami di stanze senza barriere sono contati in
+        esami_ignorati. Solleva ValueError se gli orari non sono validi o non sono in ordine crescente.
+        """
+        tempi = pd.to_datetime(programma[DOSE_RATE_TIME_COLUMN])
+        if tempi.dt.tz is not None:
+            tempi = tempi.dt.tz_localize(None)
+        if tempi.isna().any():
+            raise ValueError(f"Orari di inizio mancanti o non validi nella colonna '{DOSE_RATE_TIME_COLUMN}'.")
+        ore = tempi.to_numpy().astype('datetime64[h]').astype(np.int64)
+        if DOSE_RATE_COUNT_COLUMN in programma.columns:
+            pesi = programma[DOSE_RATE_COUNT_COLUMN].fillna(1.0).to_numpy(dtype=float)
+        else:
+            pesi = np.ones(len(programma))
+
+        stanze = self._codici_programma(programma)
+        note = stanze >= 0
+        self.esami_ignorati += float(pesi[~note].sum())
+        ore, stanze, pesi = ore[note], stanze[note], pesi[note]
+        if not len(ore):
+            return
+        if (np.diff(ore) < 0).any() or (self._ora_corrente is not None and ore[0] < self._ora_corrente):
+            raise ValueError("Il programma degli esami deve essere ordinato per orario di inizio.")
+
+        # Settimana tipo e totali
+        n_stanze = len(self.stanze)
+        ore_lunedi = ore + _SCOSTAMENTO_LUNEDI_H
+        self.conteggi_settimana += np.bincount(
+            stanze * DOSE_RATE_WEEK_HOURS + ore_lunedi % DOSE_RATE_WEEK_HOURS,
+            weights=pesi, minlength=n_stanze * DOSE_RATE_WEEK_HOURS,
+        ).reshape(n_stanze, DOSE_RATE_WEEK_HOURS)
+        self.totale += np.bincount(stanze, weights=pesi, minlength=n_stanze)
+        if self._prima_ora is None:
+            self._prima_ora = int(ore[0])
+
+        # Esami per (ora, stanza), con l'ora rimasta aperta dal blocco precedente; l'ultima ora del blocco
+        # può proseguire nel successivo e resta aperta
+        if self._ora_corrente is not None:
+            aperte = np.flatnonzero(self._pendenti)
+            ore = np.concatenate([np.full(len(aperte), self._ora_corrente), ore])
+            stanze = np.concatenate([aperte, stanze])
+            pesi = np.concatenate([self._pendenti[aperte], pesi])
+        chiavi, inverso = np.unique((ore - ore[0]) * n_stanze + stanze, return_inverse=True)
+        conteggi = np.bincount(inverso.ravel(), weights=pesi)
+        ora_k, stanza_k = chiavi // n_stanze + ore[0], chiavi % n_stanze
+
+        ultima = ore[-1]
+        complete = ora_k < ultima
+        self._pendenti = np.bincount(stanza_k[~complete], weights=conteggi[~complete], minlength=n_stanze)
+        self._ora_corrente = int(ultima)
+        self._aggiorna_picco(self.picco, self.ora_picco, ora_k[complete], stanza_k[complete], conteggi[complete])
+
+    def _codici_programma(self, programma):
+        """ Codici di stanza degli esami (-1 per le stanze senza barriere), sulle colonne comuni alle due tabelle. """
+        if BATCH_ROOM_COLUMN not in programma.columns:
+            raise ValueError(f"Il programma degli esami deve contenere la colonna '{BATCH_ROOM_COLUMN}'.")
+        if all(col in programma.columns for col in self._colonne_stanza):
+            return self.stanze.get_indexer(_chiavi_stanza(programma, self._colonne_stanza))
+        if self._solo_stanza.has_duplicates:
+            ambigue = self._solo_stanza[self._solo_stanza.duplicated()].unique()
+            raise ValueError(
+                f"Stanze presenti in più impianti ({', '.join(map(str, ambigue[:10]))}): "
+                f"il programma degli esami deve contenere la colonna '{BATCH_FACILITY_COLUMN}'."
+            )
+        return self._solo_stanza.get_indexer(_chiavi_stanza(programma, [BATCH_ROOM_COLUMN]))
+
+    @staticmethod
+    def _aggiorna_picco(picco, ora_picco, ore, stanze, conteggi):
+        """ Massimo per stanza degli esami in un'ora (a parità, l'ora più vicina all'inizio del programma). """
+        if not len(conteggi):
+            return
+        ordine = np.lexsort((-ore, conteggi, stanze))
+        ultimo = np.append(stanze[ordine][1:] != stanze[ordine][:-1], True)
+        scelti = ordine[ultimo]
+        s, c, h = stanze[scelti], conteggi[scelti], ore[scelti]
+        migliore = c > picco[s]
+        picco[s[migliore]] = c[migliore]
+        ora_picco[s[migliore]] = h[migliore]
+
+    @property
+    def n_settimane(self):
+        """ Durata del programma (dalla prima all'ultima ora con esami) in settimane intere, almeno 1. """
+        if self._prima_ora is None:
+            return 1
+        return -(-(self._ora_corrente - self._prima_ora + 1) // DOSE_RATE_WEEK_HOURS)
+
+    def risultati(self):
+        """
+        DataFrame per barriera (stesso indice della tabella): esami settimanali della stanza, kerma trasmesso
+        per esame [mGy] e settimanale [mGy/settimana], dose settimanale (con T) confrontata con P, TADR
+        [µGy/h] sulle 40 ore lavorative, picco orario [µGy/h] e ora del picco. Il programma può essere
+        ancora in corso: l'ora aperta è inclusa senza chiuderla. Le barriere di stanze senza esami nel
+        programma (senza_esami) non sono verificabili e risultano non conformi.
+        """
+        picco, ora_picco = self.picco.copy(), self.ora_picco.copy()
+        if self._ora_corrente is not None:
+            aperte = np.flatnonzero(self._pendenti)
+            self._aggiorna_picco(picco, ora_picco, np.full(len(aperte), self._ora_corrente), aperte, self._pendenti[aperte])
+
+        r = self.codici_stanza
+        esami_settimana = self.totale[r] / self.n_settimane
+        kerma_settimanale = self.kerma_esame * esami_settimana
+        dose = kerma_settimanale * self.T
+        senza_esami = self.totale[r] == 0
+        ora = np.where(ora_picco[r] >= 0, ora_picco[r], np.iinfo(np.int64).min).astype('datetime64[h]')
+        return pd.DataFrame({
+            'esami_settimana': esami_settimana,
+            'kerma_esame_mGy': self.kerma_esame,
+            'kerma_settimanale': kerma_settimanale,
+            'dose_settimanale': dose,
+            'conforme': self.errore.isna().to_numpy() & ~senza_esami & (dose <= self.P * (1 + COMPLIANCE_RELATIVE_TOLERANCE)),
+            'senza_esami': senza_esami,
+            'tadr_uGy_h': kerma_settimanale * 1000.0 / DOSE_RATE_WORK_HOURS,
+            'picco_orario_uGy_h': self.kerma_esame * picco[r] * 1000.0,
+            'ora_picco': ora.astype('datetime64[s]'),
+            'errore': self.errore.to_numpy(),
+        }, index=self.indice)
+
+    def profilo_settimanale(self, righe=None):
+        """
+        Tasso di kerma trasmesso [µGy/h] della settimana tipo (media sulle settimane del programma), una
+        colonna per barriera e una riga per ora da lunedì 00:00 (168 righe). righe (posizioni nella tabella
+        delle barriere) limita le colonne: il profilo completo occupa 168 valori per barriera.
+        """
+        righe = np.arange(len(self.indice)) if righe is None else np.asarray(righe)
+        profilo = self.conteggi_settimana[self.codici_stanza[righe]].T * (self.kerma_esame[righe] * 1000.0 / self.n_settimane)
+        return pd.DataFrame(
+            profilo, columns=self.indice[righe], index=pd.RangeIndex(DOSE_RATE_WEEK_HOURS, name='ora_settimana'),
+        )
+
+
+def run_dose_rate_calculation(barriere, programma, chunk_size=BATCH_CHUNK_SIZE):
+    """
+    Legge il programma degli esami (DataFrame/CSV/Parquet, a blocchi, ordinato per orario di inizio) per
+    la tabella delle barriere e restituisce il TassoDoseProgrammato (risultati(), profilo_settimanale()).
+    """
+    tasso = TassoDoseProgrammato(barriere)
+    for blocco in iter_barrier_table(programma, chunk_size):
+        tasso.aggiungi(blocco)
+    return tasso
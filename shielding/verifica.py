@@ -0,0 +1,106 @@
+"""
+Verifica di conformità (calcolo diretto): dati gli spessori installati, trasmissione B(x) di Archer, kerma
+trasmesso e dose settimanale dietro ogni barriera, confrontata con il limite P.
+"""
+
+import numpy as np
+import pandas as pd
+
+from .analitica import calcola_trasmissione_array
+from .batch import (
+    BATCH_CHUNK_SIZE,
+    BATCH_COLUMN_DEFAULTS,
+    _normalizza_tabella_barriere,
+    _rami_componenti,
+    iter_barrier_table,
+)
+from .calcolo import CALC_ERROR_MESSAGES, RAMO_LOGICO_LABELS
+from .coefficienti import COEFF_STORE
+
+
+# Spessore installato della barriera [mm], nel materiale_schermatura (celle vuote: nessuna barriera, 0 mm)
+COMPLIANCE_THICKNESS_COLUMN = 'spessore_installato_mm'
+
+# Tolleranza relativa sul confronto con P: lo spessore calcolato da run_shielding_calculation risulta conforme
+COMPLIANCE_RELATIVE_TOLERANCE = 1e-6
+
+
+def calculate_compliance_chunk(df, coefficienti=COEFF_STORE):
+    """
+    Verifica vettoriale di una tabella di barriere (una riga per barriera, colonne come calculate_batch_chunk
+    più spessore_installato_mm). Lo spessore efficace è spessore installato + X_PRE_mm; per ogni componente
+    c (fascio combinato, oppure Fuga e Diffusione) con kerma non schermato K_c:
+        kerma_trasmesso = somma_c K_c * B_c(spessore efficace),   dose_settimanale = kerma_trasmesso * T
+    con i fit usati dal calcolo inverso (kerma da calcola_kerma_incidente / calcola_kerma_tc). La barriera è
+    conforme se dose_settimanale <= P; le barriere non richieste (Primaria TC, Primaria del Ramo 2 senza Kp1)
+    hanno dose 0.0, quelle con errore dose NaN e non sono conformi. Restituisce un DataFrame con lo stesso
+    indice di df.
+    """
+    df = _normalizza_tabella_barriere(df)
+    n = len(df)
+    if COMPLIANCE_THICKNESS_COLUMN in df.columns:
+        installato = np.nan_to_num(df[COMPLIANCE_THICKNESS_COLUMN].to_numpy(dtype=float), nan=0.0)
+    else:
+        installato = np.zeros(n)
+
+    ramo, errore, kerma, att, componenti = _rami_componenti(
+        df,
+        coefficienti.ids_modalita(df['modalita_radiografia']),
+        coefficienti.ids_materiale(df['materiale_schermatura']),
+        coefficienti.ids_kvp(df['kvp_tc']),
+        coefficienti,
+    )
+    P = df['P_mSv_wk'].to_numpy(dtype=float)
+    T = df['tasso_occupazione_T'].to_numpy(dtype=float)
+    Xpre = df['X_PRE_mm'].to_numpy(dtype=float)
+
+    # --- Calcolo diretto: B(x) di Archer per componente allo spessore efficace ---
+    spessore_efficace = np.maximum(installato, 0.0) + Xpre
+    B = calcola_trasmissione_array(att[..., 0], att[..., 1], att[..., 2], spessore_efficace[:, None])
+    kerma = np.where(componenti, kerma, 0.0)
+    kerma_totale = kerma.sum(axis=1)
+    kerma_trasmesso = np.where(componenti, kerma * B, 0.0).sum(axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        B_efficace = np.where(kerma_totale > 0, kerma_trasmesso / kerma_totale, np.nan)
+    dose = kerma_trasmesso * T
+
+    con_errore = errore != 0
+    dose[con_errore] = np.nan
+    kerma_trasmesso[con_errore] = np.nan
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rapporto = np.where(P > 0, dose / P, np.where(dose > 0, np.inf, 0.0))
+    conforme = ~con_errore & (dose <= P * (1 + COMPLIANCE_RELATIVE_TOLERANCE))
+
+    return pd.DataFrame({
+        'ramo_logico': pd.Categorical.from_codes(ramo, categories=RAMO_LOGICO_LABELS),
+        'spessore_efficace_mm': spessore_efficace,
+        'kerma_non_schermato': kerma_totale,
+        'trasmittanza_B': B_efficace,
+        'kerma_trasmesso': kerma_trasmesso,
+        'dose_settimanale': dose,
+        'rapporto_dose_P': rapporto,
+        'conforme': conforme,
+        'errore': pd.Categorical.from_codes(errore - 1, categories=CALC_ERROR_MESSAGES[1:]),
+    }, index=df.index)
+
+
+def run_compliance_check(source, chunk_size=BATCH_CHUNK_SIZE):
+    """
+    Verifica di conformità di un impianto da DataFrame/CSV/Parquet: restituisce (in streaming, un blocco
+    alla volta) i DataFrame con le colonne di input e i risultati, come run_batch_calculation.
+    """
+    for chunk in iter_barrier_table(source, chunk_size):
+        yield chunk.join(calculate_compliance_chunk(chunk), rsuffix='_risultato')
+
+
+def run_compliance_calculation(params, spessore_installato_mm):
+    """
+    Versione per una sola barriera: params come per run_shielding_calculation, spessore installato in mm
+    del materiale_schermatura. Restituisce il dizionario dei risultati.
+    """
+    barriera = {k: v for k, v in params.items() if k in BATCH_COLUMN_DEFAULTS}
+    barriera[COMPLIANCE_THICKNESS_COLUMN] = spessore_installato_mm
+    risultato = calculate_compliance_chunk(pd.DataFrame([barriera])).iloc[0].to_dict()
+    if pd.isna(risultato['errore']):
+        del risultato['errore']
+    return risultato